@@ -17,12 +17,22 @@ from bpy.props import (
 
 # ▼ ここで一度だけモジュールを import（register/unregister 内で再importしない）
 from . import (
+    core_bpy,
     render_override,
     main_panel,
     collection_management,
     material_override,
+    material_snapshots,
     light_camera,
     viewlayer_operations,
+    deferred_output,
+    contact_sheet,
+    frustum_cull,
+    image_buffers,
+    footprint,
+    visibility_index,
+    versioning,
+    manifest,
 )
 
 # ----------------------------------------------------------------
@@ -54,6 +64,9 @@ def register():
     bpy.types.Scene.vlm_ui_show_render_output    = BoolProperty(default=True)
     bpy.types.Scene.vlm_ui_show_sample_override  = BoolProperty(default=False)
     bpy.types.Scene.vlm_ui_show_cycles_light_paths = BoolProperty(default=False)
+    bpy.types.Scene.vlm_ui_show_simplify         = BoolProperty(default=False)
+    bpy.types.Scene.vlm_ui_show_eevee_perf       = BoolProperty(default=False)
+    bpy.types.Scene.vlm_ui_show_footprint        = BoolProperty(default=False)
 
     bpy.types.Scene.vlm_skip_existing_frames = BoolProperty(
         name="Skip Existing Frames",
@@ -61,13 +74,27 @@ def register():
         default=False,
     )
 
+    # --- CPU スレッド自動配分（バッチ単位） ---
+    bpy.types.Scene.vlm_thread_alloc_enable = BoolProperty(
+        name="Auto Thread Allocation",
+        description="同じマシンで複数のレンダープロセスを同時に回す前提で、レイヤーの推定コストに応じてスレッド数を固定する",
+        default=False,
+    )
+    bpy.types.Scene.vlm_thread_budget = IntProperty(
+        name="Core Budget",
+        description="このマシンで全プロセスが使ってよいコア数（0 で全コア）",
+        default=0, min=0, max=1024,
+    )
+    bpy.types.Scene.vlm_thread_workers = IntProperty(
+        name="Concurrent Renders",
+        description="同時に走らせるレンダープロセス数",
+        default=1, min=1, max=256,
+    )
+
     # --- サンプル強制上書き（Scene） ---
     def _update_force_samples(self, context):
-        try:
-            from .render_override import apply_render_override
-            apply_render_override(context.scene, context.view_layer)
-        except Exception:
-            pass
+        core_bpy.invalidate(self)
+        render_override.schedule_apply(self, context.view_layer)
 
     bpy.types.Scene.vlm_force_samples_enable = BoolProperty(
         name="Force Render Samples", default=False, update=_update_force_samples
@@ -85,8 +112,17 @@ def register():
     main_panel.register()
     collection_management.register()
     material_override.register()
+    material_snapshots.register()
     light_camera.register()
     viewlayer_operations.register()
+    deferred_output.register()
+    contact_sheet.register()
+    frustum_cull.register()
+    image_buffers.register()
+    footprint.register()
+    visibility_index.register()
+    versioning.register()
+    manifest.register()
 
 def unregister():
     # --- 実行中の外部レンダをまず停止（プロパティ削除より前） ---
@@ -97,10 +133,28 @@ def unregister():
         pass
 
     # --- モジュールの unregister（逆順） ---
+    try: manifest.unregister()
+    except Exception: pass
+    try: versioning.unregister()
+    except Exception: pass
+    try: visibility_index.unregister()
+    except Exception: pass
+    try: footprint.unregister()
+    except Exception: pass
+    try: image_buffers.unregister()
+    except Exception: pass
+    try: frustum_cull.unregister()
+    except Exception: pass
+    try: contact_sheet.unregister()
+    except Exception: pass
+    try: deferred_output.unregister()
+    except Exception: pass
     try: viewlayer_operations.unregister()
     except Exception: pass
     try: light_camera.unregister()
     except Exception: pass
+    try: material_snapshots.unregister()
+    except Exception: pass
     try: material_override.unregister()
     except Exception: pass
     try: collection_management.unregister()
@@ -123,7 +177,11 @@ def unregister():
         "vlm_ui_show_frame_range","vlm_ui_show_output_nodes","vlm_ui_show_render_output",
         "vlm_ui_show_sample_override",
         "vlm_ui_show_cycles_light_paths",
+        "vlm_ui_show_simplify",
+        "vlm_ui_show_eevee_perf",
+        "vlm_ui_show_footprint",
         "vlm_skip_existing_frames",
+        "vlm_thread_alloc_enable","vlm_thread_budget","vlm_thread_workers",
         "vlm_force_samples_enable","vlm_force_samples_cycles","vlm_force_samples_eevee",
         "vlm_gpu_safe_mode",
         "vlm_vram_watch_enable","vlm_vram_threshold_pct","vlm_vram_warmup_frames",
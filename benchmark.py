@@ -0,0 +1,381 @@
+# benchmark.py
+#
+# ヘッドレス・ベンチマーク（合成シーン生成 + ホットパス計測 → JSON 出力）
+#
+# 使い方（Blender をバックグラウンド起動）:
+#   blender -b --factory-startup --python-expr \
+#       "import RenderLayers.benchmark as b; b.main()" -- \
+#       --meshes 100,1000,10000 --collections 20 --view-layers 10 \
+#       --output bench.json
+#
+#   ※ "RenderLayers" はアドオンのインストール先フォルダ名に合わせてください。
+#   ※ 各カンマ区切り値ごとにシーンを作り直して計測し、スケーリングを比較できます。
+# ------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import bpy
+
+from . import light_camera
+from . import material_override
+from . import material_snapshots
+from . import collection_management as colm
+from . import main_panel
+from . import visibility_index
+from .render_override import (
+    apply_render_override, reset_write_stats, sync_scene_settings_to_addon, write_stats,
+)
+from .viewlayer_operations import _apply_content_collection_overrides
+
+BENCH_PREFIX = "VLM_BENCH"
+
+# 1回の JSON に含めるスキーマ版（比較スクリプト側で互換判定に使う）
+RESULT_SCHEMA = 1
+
+
+# ──────────────────────────────────────────────
+# ① 合成シーン生成
+# ──────────────────────────────────────────────
+def _ensure_registered():
+    """--factory-startup でアドオンが無効な場合でも、このパッケージを登録しておく"""
+    if hasattr(bpy.types.ViewLayer, "vlm_render"):
+        return
+    pkg = sys.modules.get(__package__)
+    if pkg is not None and hasattr(pkg, "register"):
+        pkg.register()
+
+
+def _clear_scene(scene):
+    """シーン内のオブジェクト・コレクション・追加ビューレイヤーを全削除し、
+    マテリアルのバックアップ表・スナップショット・上書きレジストリも空にする
+    （前の規模の行が残ると、次の規模の計測に混ざる）"""
+    if hasattr(scene, "vlm_material_snapshots"):
+        scene.vlm_material_snapshots.clear()
+        scene.vlm_material_snapshot_active = ""
+        material_snapshots._rows_cache.clear()
+    if hasattr(scene, "vlm_material_backup"):
+        material_override.clear_backup(scene)
+    material_override._dirty_backup.pop(scene.name, None)
+    material_override._backup_tracked.discard(scene.name)
+    for vl in scene.view_layers:
+        if hasattr(vl, "vlm_material_overrides"):
+            vl.vlm_material_overrides.clear()
+    material_override.invalidate_override_index()
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj, do_unlink=True)
+    for col in list(bpy.data.collections):
+        bpy.data.collections.remove(col)
+    for mesh in list(bpy.data.meshes):
+        bpy.data.meshes.remove(mesh)
+    for mat in list(bpy.data.materials):
+        bpy.data.materials.remove(mat)
+    for ng in list(bpy.data.node_groups):
+        bpy.data.node_groups.remove(ng)
+    while len(scene.view_layers) > 1:
+        scene.view_layers.remove(scene.view_layers[-1])
+    if "vlm_settings_synced" in scene:
+        del scene["vlm_settings_synced"]
+
+
+def _make_cube_mesh(name):
+    s = 0.5
+    verts = [(-s, -s, -s), (s, -s, -s), (s, s, -s), (-s, s, -s),
+             (-s, -s, s), (s, -s, s), (s, s, s), (-s, s, s)]
+    faces = [(0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 5, 4),
+             (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7)]
+    me = bpy.data.meshes.new(name)
+    me.from_pydata(verts, [], faces)
+    me.update()
+    return me
+
+
+def _make_aov_material(name, aov_name, *, via_group=False):
+    """AOV 出力を持つマテリアル（via_group=True ならノードグループ内に AOV を置く）"""
+    mat = bpy.data.materials.new(name)
+    mat.use_nodes = True
+    nt = mat.node_tree
+    if via_group:
+        grp = bpy.data.node_groups.new(f"{name}_grp", "ShaderNodeTree")
+        aov = grp.nodes.new("ShaderNodeOutputAOV")
+        aov.name = aov_name
+        if hasattr(aov, "aov_name"):
+            aov.aov_name = aov_name
+        node = nt.nodes.new("ShaderNodeGroup")
+        node.node_tree = grp
+    else:
+        aov = nt.nodes.new("ShaderNodeOutputAOV")
+        aov.name = aov_name
+        if hasattr(aov, "aov_name"):
+            aov.aov_name = aov_name
+    return mat
+
+
+def _build_collection_tree(scene, count, depth):
+    """count 個のコレクションを depth 段ずつの入れ子チェーンに並べ、生成順のリストを返す"""
+    created = []
+    for i in range(count):
+        parent = scene.collection if i % depth == 0 else created[-1]
+        col = bpy.data.collections.new(f"{BENCH_PREFIX}_COL_{i:04d}")
+        parent.children.link(col)
+        created.append(col)
+    return created
+
+
+def generate_scene(scene=None, *, meshes=1000, collections=20, depth=3, view_layers=10,
+                   overrides=10, aov_materials=8, lights=8, seed=0):
+    """ベンチマーク用の合成シーンを作る。
+
+    meshes        : メッシュオブジェクト数（各オブジェクトにマテリアルスロット 2 つ）
+    collections   : コレクション数（depth 段までネスト）
+    view_layers   : ビューレイヤー総数（先頭を含む）
+    overrides     : (コレクション × ビューレイヤー) のマテリアル上書き数
+    aov_materials : AOV 出力付きマテリアル数（半数はノードグループ経由）
+    lights        : ライト数（各レイヤーにランダムな記憶状態を持たせる）
+    """
+    _ensure_registered()
+    scene = scene or bpy.context.scene
+    rng = random.Random(seed)
+
+    _clear_scene(scene)
+
+    cols = _build_collection_tree(scene, max(1, collections), max(1, depth))
+
+    mats = [_make_aov_material(f"{BENCH_PREFIX}_AOV_{i:03d}", f"aov_{i:03d}", via_group=bool(i % 2))
+            for i in range(max(1, aov_materials))]
+    plain = [bpy.data.materials.new(f"{BENCH_PREFIX}_MAT_{i:03d}") for i in range(4)]
+
+    for i in range(meshes):
+        obj = bpy.data.objects.new(f"{BENCH_PREFIX}_OBJ_{i:06d}", _make_cube_mesh(f"{BENCH_PREFIX}_ME_{i:06d}"))
+        obj.location = (rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(0, 10))
+        cols[i % len(cols)].objects.link(obj)
+        obj.data.materials.append(rng.choice(mats))
+        obj.data.materials.append(rng.choice(plain))
+
+    light_objs = []
+    for i in range(lights):
+        ld = bpy.data.lights.new(f"{BENCH_PREFIX}_LIGHT_{i:03d}", type='POINT')
+        lo = bpy.data.objects.new(ld.name, ld)
+        cols[i % len(cols)].objects.link(lo)
+        light_objs.append(lo)
+
+    cam_data = bpy.data.cameras.new(f"{BENCH_PREFIX}_CAM")
+    cam = bpy.data.objects.new(cam_data.name, cam_data)
+    cam.location = (0.0, -120.0, 40.0)
+    cam.rotation_euler = (1.2, 0.0, 0.0)
+    scene.collection.objects.link(cam)
+    scene.camera = cam
+
+    scene.render.engine = 'BLENDER_WORKBENCH'
+    scene.render.resolution_x = 64
+    scene.render.resolution_y = 36
+    scene.render.resolution_percentage = 100
+
+    top = scene.view_layers[0]
+    for i in range(1, max(1, view_layers)):
+        vl = scene.view_layers.new(f"{BENCH_PREFIX}_VL_{i:03d}")
+        # 各レイヤーで約 3 割のコレクションを除外
+        for lc in material_override._iter_layer_collections_recursive(vl.layer_collection):
+            if rng.random() < 0.3:
+                lc.exclude = True
+
+    # ライト記憶状態
+    for vl in scene.view_layers:
+        light_camera._set_light_state_dict(vl, {
+            lo.name: {"hide_viewport": False, "hide_render": rng.random() < 0.5}
+            for lo in light_objs
+        })
+
+    # コレクション × レイヤーのマテリアル上書き
+    others = list(scene.view_layers)[1:]
+    if others:
+        for i in range(overrides):
+            vl = others[i % len(others)]
+            col = rng.choice(cols)
+            material_override.set_override(vl, col, rng.choice(plain))
+
+    sync_scene_settings_to_addon(scene)
+    top.vlm_render.engine = 'BLENDER_WORKBENCH'
+    top.vlm_render.resolution_x = 64
+    top.vlm_render.resolution_y = 36
+    top.vlm_render.frame_start = 1
+    top.vlm_render.frame_end = 2
+
+    # 同名のレイヤーで中身だけ作り直したので、可視索引は捨てておく
+    visibility_index.invalidate(scene)
+    return scene
+
+
+# ──────────────────────────────────────────────
+# ② 計測ヘルパー
+# ──────────────────────────────────────────────
+def _time_call(fn, repeat):
+    """fn を repeat 回実行し、秒単位の統計を返す"""
+    samples = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "repeat": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def _switch_viewlayer(scene, vl):
+    """VLM_OT_set_active_viewlayer と同等の適用処理（ウィンドウが無い環境向け）"""
+    if _apply_content_collection_overrides(vl):
+        vl.update()
+    material_override._apply_selective_material_overrides(vl)
+    light_camera.apply_lights_for_viewlayer(vl, do_view_update=False)
+    apply_render_override(scene, vl)
+
+
+def _set_active_viewlayer(scene, vl):
+    win = bpy.context.window
+    if win is not None:
+        bpy.ops.vlm.set_active_viewlayer(layer_name=vl.name)
+    else:
+        _switch_viewlayer(scene, vl)
+
+
+def _batch_render(scene, out_dir):
+    """Workbench で各レイヤー 1 フレームずつレンダリング（レンダーオペレーターの1ステップ相当）"""
+    for vl in scene.view_layers:
+        for v in scene.view_layers:
+            v.use = (v == vl)
+        _switch_viewlayer(scene, vl)
+        scene.render.filepath = os.path.join(out_dir, "")
+        scene.frame_set(scene.frame_start)
+        colm._prepare_compositor_nodes(scene)
+        colm._update_dynamic_paths_and_apply_ao(scene)
+        with material_override.operator_render():
+            bpy.ops.render.render(write_still=True, use_viewport=False, layer=vl.name)
+        colm._vlm_purge(scene)
+    for v in scene.view_layers:
+        v.use = True
+
+
+def run_hot_paths(scene, *, repeat=5, render=True):
+    """アドオンのホットパスを計測して {名前: 統計} を返す"""
+    layers = list(scene.view_layers)
+    non_top = layers[1:] or layers
+    results = {}
+
+    def _every_layer(fn):
+        def _run():
+            for vl in layers:
+                fn(vl)
+        return _run
+
+    results["set_active_viewlayer"] = _time_call(
+        _every_layer(lambda vl: _set_active_viewlayer(scene, vl)), repeat)
+    reset_write_stats()
+    results["apply_render_override"] = _time_call(
+        _every_layer(lambda vl: apply_render_override(scene, vl)), repeat)
+    # 差分適用で省けた書き込み数（同値なら書かない）
+    results["apply_render_override"].update(write_stats())
+    results["apply_selective_material_overrides"] = _time_call(
+        _every_layer(material_override._apply_selective_material_overrides), repeat)
+    results["apply_lights_for_viewlayer"] = _time_call(
+        _every_layer(lambda vl: light_camera.apply_lights_for_viewlayer(vl, do_view_update=False)), repeat)
+    results["prepare_compositor_nodes"] = _time_call(
+        lambda: colm._prepare_compositor_nodes(scene), repeat)
+    results["collect_aov_names_for_view_layer"] = _time_call(
+        _every_layer(main_panel._collect_aov_names_for_view_layer), repeat)
+
+    col_names = [c.name for c in bpy.data.collections if c.name.startswith(BENCH_PREFIX)]
+    settings = {name: {"holdout": i % 2 == 0, "indirect_only": False} for i, name in enumerate(col_names)}
+    target_names = [vl.name for vl in non_top]
+    results["apply_collection_settings"] = _time_call(
+        lambda: colm.apply_collection_settings(scene, target_names, settings), repeat)
+
+    if render:
+        with tempfile.TemporaryDirectory(prefix="vlm_bench_") as out_dir:
+            results["batch_render_workbench"] = _time_call(lambda: _batch_render(scene, out_dir), 1)
+
+    # 計測後は先頭レイヤーに戻しておく
+    _switch_viewlayer(scene, layers[0])
+    return results
+
+
+# ──────────────────────────────────────────────
+# ③ エントリポイント
+# ──────────────────────────────────────────────
+def _int_list(text):
+    return [int(v) for v in str(text).split(",") if v.strip()]
+
+
+def _parse_args(argv):
+    p = argparse.ArgumentParser(prog="vlm-benchmark", description="View Layer Manager benchmark")
+    p.add_argument("--meshes", default="1000", help="メッシュ数（カンマ区切りで複数スケール）")
+    p.add_argument("--collections", default="20", help="コレクション数（カンマ区切り可）")
+    p.add_argument("--depth", type=int, default=3, help="コレクションの最大ネスト段数")
+    p.add_argument("--view-layers", default="10", help="ビューレイヤー数（カンマ区切り可）")
+    p.add_argument("--overrides", type=int, default=10, help="マテリアル上書き数")
+    p.add_argument("--aov-materials", type=int, default=8, help="AOV 付きマテリアル数")
+    p.add_argument("--lights", type=int, default=8, help="ライト数")
+    p.add_argument("--repeat", type=int, default=5, help="各ホットパスの反復回数")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--no-render", action="store_true", help="Workbench バッチレンダーを省略")
+    p.add_argument("--output", default="", help="JSON 出力先（空なら標準出力）")
+    return p.parse_args(argv)
+
+
+def _environment():
+    pkg = sys.modules.get(__package__)
+    addon_version = getattr(pkg, "bl_info", {}).get("version", ())
+    return {
+        "schema": RESULT_SCHEMA,
+        "addon_version": ".".join(str(v) for v in addon_version),
+        "blender_version": bpy.app.version_string,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv=None):
+    """blender の '--' 以降の引数を解釈してベンチマークを実行し、JSON を出力する"""
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args = _parse_args(argv)
+    _ensure_registered()
+
+    runs = []
+    for n_mesh in _int_list(args.meshes):
+        for n_col in _int_list(args.collections):
+            for n_vl in _int_list(args.view_layers):
+                params = {
+                    "meshes": n_mesh, "collections": n_col, "depth": args.depth,
+                    "view_layers": n_vl, "overrides": args.overrides,
+                    "aov_materials": args.aov_materials, "lights": args.lights,
+                    "seed": args.seed,
+                }
+                print(f"VLM bench: {params}")
+                t0 = time.perf_counter()
+                scene = generate_scene(**params)
+                gen_time = time.perf_counter() - t0
+                timings = run_hot_paths(scene, repeat=args.repeat, render=not args.no_render)
+                runs.append({"params": params, "generate_seconds": gen_time, "timings": timings})
+
+    report = {"environment": _environment(), "runs": runs}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(bpy.path.abspath(args.output), "w", encoding="utf-8") as fh:
+            fh.write(text)
+        print(f"VLM bench: wrote {args.output}")
+    else:
+        print(text)
+    return report
@@ -7,9 +7,13 @@ import pathlib
 import datetime
 import gc
 
-from . import light_camera
-from .material_override import apply_active_viewlayer_overrides
-from .render_override import apply_render_override
+from . import light_camera, core, core_bpy, deferred_output, frustum_cull, image_buffers, visibility_index
+from .material_override import (
+    apply_active_viewlayer_overrides, clear_override, operator_render, set_override,
+)
+from .render_override import (
+    apply_render_override, snapshot_simplify, restore_simplify, reset_write_stats, write_stats,
+)
 
 # collection_management.py の import 群の下あたりに追加
 def _get_top_rs(scene):
@@ -21,37 +25,66 @@ def _get_top_rs(scene):
 def _resolve_frame_range(scene, vl):
     """このVLで実際に使うフレーム範囲（start, end, step）を返す。
        VL側がOFFなら『先頭VLのUI値』にフォールバック。"""
-    rs     = vl.vlm_render
-    top_rs = _get_top_rs(scene) or rs
-    if getattr(rs, "frame_enable", False):
-        s, e, st = rs.frame_start,  rs.frame_end,  max(1, rs.frame_step)
-    else:
-        s, e, st = top_rs.frame_start, top_rs.frame_end, max(1, top_rs.frame_step)
-    return int(s), int(e), int(st)
+    return core_bpy.resolve_frame_range(scene, vl)
+
+
+def _thread_budget(scene):
+    return int(getattr(scene, "vlm_thread_budget", 0)) or (os.cpu_count() or 1)
+
+
+def _thread_allocation(scene, layers):
+    """バッチ単位のスレッド配分（無効なら空）。{VL名: スレッド数}"""
+    if not getattr(scene, "vlm_thread_alloc_enable", False) or not layers:
+        return {}
+    return core_bpy.allocate_layer_threads(scene, layers, _thread_budget(scene),
+                                           int(getattr(scene, "vlm_thread_workers", 1)))
+
+
+def _apply_thread_allocation(scene, vl, alloc):
+    """apply_render_override の後に呼ぶ。
+       優先順位：レイヤー（または先頭レイヤー）の固定スレッド ＞ 自動配分 ＞ AUTO"""
+    threads = alloc.get(vl.name)
+    if not threads:
+        return
+    if core_bpy.resolve_view_layer(scene, vl).cycles_perf.get("threads_mode") == 'FIXED':
+        return
+    scene.render.threads_mode = 'FIXED'
+    scene.render.threads = threads
+
+
+# バッチ中に書き換えたプロパティ → 回数（毎フレーム出すと多すぎるので終了時にまとめて出す）
+_batch_changes = {}
+
+
+def _reset_batch_stats():
+    reset_write_stats()
+    _batch_changes.clear()
+
+
+def _apply_render_override(scene, vl):
+    """差分適用し、実際に書き換えたプロパティをバッチの集計に足す"""
+    changed = apply_render_override(scene, vl)
+    for prop in changed:
+        _batch_changes[prop] = _batch_changes.get(prop, 0) + 1
+    return changed
+
+
+def _log_write_stats():
+    """バッチ中に書き込みを省けたプロパティ数と、書き換えたプロパティを出す（_reset_batch_stats で開始）"""
+    st = write_stats()
+    total = st["written"] + st["skipped"]
+    if total:
+        print(f"VLM: render overrides wrote {st['written']} / skipped {st['skipped']} "
+              f"of {total} property writes")
+    if _batch_changes:
+        detail = ", ".join(f"{prop} x{n}" for prop, n in sorted(_batch_changes.items()))
+        print(f"VLM: render settings changed: {detail}")
+    _batch_changes.clear()
 
 
 def _file_extension_from_format(fmt, render):
-    mapping = {
-        "PNG": ".png",
-        "OPEN_EXR": ".exr",
-        "OPEN_EXR_MULTILAYER": ".exr",
-        "JPEG": ".jpg",
-        "JPEG2000": ".jp2",
-        "TIFF": ".tif",
-        "TARGA": ".tga",
-        "TARGA_RAW": ".tga",
-        "IRIS": ".sgi",
-        "BMP": ".bmp",
-        "CINEON": ".cin",
-        "DPX": ".dpx",
-        "HDR": ".hdr",
-    }
-    ext = mapping.get(getattr(fmt, "file_format", ""))
-    if not ext:
-        ext = getattr(render, "file_extension", "") or ""
-        if ext and not ext.startswith("."):
-            ext = f".{ext}"
-    return ext or ".exr"
+    return core.file_extension_for_format(getattr(fmt, "file_format", ""),
+                                          getattr(render, "file_extension", "") or "")
 
 
 def _iter_vlm_file_outputs(scene, vl_name):
@@ -79,33 +112,44 @@ def _frame_output_exists(scene, vl_name, frame_number):
         if not slots:
             continue
         slot = slots[0]
-        base_dir = bpy.path.abspath(getattr(node, "base_path", ""))
-        prefix = bpy.path.abspath(os.path.join(base_dir, getattr(slot, "path", "")))
-        directory = os.path.dirname(prefix) or base_dir or ""
-        if not directory or not os.path.isdir(directory):
-            continue
+        # バックグラウンドエンコード中は最終出力先と中間ファイルの両方を見る
+        candidates = deferred_output.final_output_candidates(node) or [
+            (bpy.path.abspath(getattr(node, "base_path", "")), _file_extension_from_format(node.format, scene.render)),
+        ]
+        for base_dir, ext in candidates:
+            if _frame_file_exists(base_dir, getattr(slot, "path", ""), frame_int, padding, ext):
+                return True
 
-        ext = _file_extension_from_format(node.format, scene.render)
-        filename = bpy.path.ensure_ext(f"{prefix}{frame_int:0{padding}d}", ext)
+    return False
 
-        if os.path.exists(filename):
-            return True
 
-        base_name = os.path.basename(prefix)
-        try:
-            for fname in os.listdir(directory):
-                if not fname.startswith(base_name):
-                    continue
-                if not fname.lower().endswith(ext.lower()):
-                    continue
-                digits = re.search(r"(\d+)", fname)
-                if digits and int(digits.group(1)) == frame_int:
-                    return True
-        except FileNotFoundError:
-            continue
+def _frame_file_exists(base_dir, slot_path, frame_int, padding, ext):
+    prefix = bpy.path.abspath(os.path.join(base_dir, slot_path))
+    directory = os.path.dirname(prefix) or base_dir or ""
+    if not directory or not os.path.isdir(directory):
+        return False
+
+    filename = bpy.path.ensure_ext(f"{prefix}{frame_int:0{padding}d}", ext)
+
+    if os.path.exists(filename):
+        return True
+
+    base_name = os.path.basename(prefix)
+    try:
+        for fname in os.listdir(directory):
+            if not fname.startswith(base_name):
+                continue
+            if not fname.lower().endswith(ext.lower()):
+                continue
+            digits = re.search(r"(\d+)", fname)
+            if digits and int(digits.group(1)) == frame_int:
+                return True
+    except FileNotFoundError:
+        return False
 
     return False
 
+
 def _selected_viewlayers(scene):
     """UI『レンダリングする/しない』チェックを反映して対象VLを選定。
        0件なら vl.use==True、さらに0件なら全VLにフォールバック。"""
@@ -204,6 +248,7 @@ def _apply_collection_states_to_viewlayer(vl, collection_states):
         for child in lc.children:
             _walk(child)
     _walk(vl.layer_collection)
+    visibility_index.invalidate(vl.id_data)
 
 
 def _find_layer_collection_by_name(lc_root, coll_name):
@@ -272,6 +317,8 @@ def apply_collection_settings(scene, target_layer_names, collection_settings):
         if changed_here:
             applied_layers.append((vl.name, changed_here))
 
+    if applied_layers:
+        visibility_index.invalidate(scene)
     return applied_layers, sorted(touched_collections)
 
 
@@ -313,9 +360,6 @@ def duplicate_view_layer_with_collections(scene, source_vl, *, collection_states
 # =========================================================
 # Collection × ViewLayer のマテリアル上書き（2オペ）
 # =========================================================
-def _override_key(layer_name: str, collection_name: str) -> str:
-    return f"_vlm_mat_override_{layer_name}_{collection_name}"
-
 class COLM_OT_set_collection_override(bpy.types.Operator):
     bl_idname = "colm.set_collection_override"
     bl_label  = "コレクションにマテリアル上書きを設定"
@@ -341,8 +385,7 @@ class COLM_OT_set_collection_override(bpy.types.Operator):
             self.report({'ERROR'}, f"Material not found: {self.material_name}")
             return {'CANCELLED'}
 
-        key = _override_key(self.layer_name, self.collection_name)
-        coll[key] = mat.name  # 名前で保存
+        set_override(vl, coll, mat)
 
         try:
             apply_active_viewlayer_overrides(context)
@@ -372,12 +415,7 @@ class COLM_OT_clear_collection_override(bpy.types.Operator):
             self.report({'ERROR'}, f"ViewLayer not found: {self.layer_name}")
             return {'CANCELLED'}
 
-        key = _override_key(self.layer_name, self.collection_name)
-        if key in coll:
-            try:
-                del coll[key]
-            except Exception:
-                coll[key] = ""
+        clear_override(vl, coll)
 
         try:
             apply_active_viewlayer_overrides(context)
@@ -460,8 +498,7 @@ def _get_free_file_output_input(fo: bpy.types.NodeSocket):
 
 
 def _sanitize_name_for_path(name: str) -> str:
-    import re
-    return re.sub(r'[^0-9A-Za-z_\-]', '_', name or "")
+    return core.sanitize_name_for_path(name)
 
 
 def _configure_output_node_for_pass(node: bpy.types.Node, pass_name: str, vl_name: str,
@@ -480,16 +517,13 @@ def _configure_output_node_for_pass(node: bpy.types.Node, pass_name: str, vl_nam
     if hasattr(img_set, "exr_codec"):
         node.format.exr_codec   = img_set.exr_codec
 
-    node.base_path = os.path.join(base_fp,
-                                  _sanitize_name_for_path(blend_name),
-                                  _sanitize_name_for_path(vl_name),
-                                  _sanitize_name_for_path(pass_name)) + os.sep
+    node.base_path = core.output_base_path(base_fp, blend_name, vl_name, pass_name)
 
     # スロット数を入力数に合わせて確保
     while len(node.file_slots) <= slot_index:
         node.file_slots.new(pass_name if slot_index == 0 else f"{pass_name}_{slot_index}")
 
-    node.file_slots[slot_index].path = f"{_sanitize_name_for_path(blend_name)}_{_sanitize_name_for_path(vl_name)}_{_sanitize_name_for_path(pass_name)}_"
+    node.file_slots[slot_index].path = core.output_slot_path(blend_name, vl_name, pass_name)
 
 
 def _find_connected_file_outputs_from_socket(sock: bpy.types.NodeSocket):
@@ -638,10 +672,7 @@ def _update_dynamic_file_output_paths(scene):
             continue
         vl = n.get("vl_name") or "ViewLayer"
         ps = n.get("pass_name") or "Image"
-        n.base_path = os.path.join(base_fp,
-                                  _sanitize_name_for_path(blend_name),
-                                  _sanitize_name_for_path(vl),
-                                  _sanitize_name_for_path(ps)) + os.sep
+        n.base_path = core.output_base_path(base_fp, blend_name, vl, ps)
         slot_idx = int(n.get("vlm_slot_index", 0)) if str(n.get("vlm_slot_index", "")).isdigit() else 0
 
         if not n.file_slots:
@@ -650,7 +681,7 @@ def _update_dynamic_file_output_paths(scene):
             n.file_slots.new(f"{ps}_{len(n.file_slots)}")
 
         target_slot = n.file_slots[slot_idx]
-        target_slot.path = f"{_sanitize_name_for_path(blend_name)}_{_sanitize_name_for_path(vl)}_{_sanitize_name_for_path(ps)}_"
+        target_slot.path = core.output_slot_path(blend_name, vl, ps)
 
 # =========================================================
 # AO 乗算チェーン（チェックON時のみ）
@@ -853,9 +884,6 @@ def _ensure_output_node_for_pass(scene, nt, vl_name, pass_name, *, blend_name, b
     ViewLayer名とパス名に対応する File Output ノードをちょうど1つだけ用意し、返す。
     既存があれば再利用。base_path とファイル設定を同期する。
     """
-    import os, re
-    def sanitize(s): return re.sub(r'[^0-9A-Za-z_\-]', '_', s)
-
     # 既存を探索（カスタムプロパティで管理）
     for n in nt.nodes:
         if n.type == 'OUTPUT_FILE' and n.get("vlm_managed") and n.get("vl_name")==vl_name and n.get("pass_name")==pass_name:
@@ -868,13 +896,13 @@ def _ensure_output_node_for_pass(scene, nt, vl_name, pass_name, *, blend_name, b
             if hasattr(img_set, "exr_codec"):
                 n.format.exr_codec   = img_set.exr_codec
             # base_path 更新（blend / VL / PASS）
-            n.base_path = os.path.join(base_fp, sanitize(blend_name), sanitize(vl_name), sanitize(pass_name)) + os.sep
+            n.base_path = core.output_base_path(base_fp, blend_name, vl_name, pass_name)
             # スロットは常に1つだけに揃える
             while len(n.file_slots) > 1:
                 n.file_slots.remove(n.file_slots[-1])
             if not n.file_slots:
                 n.file_slots.new(pass_name)
-            n.file_slots[0].path = f"{sanitize(blend_name)}_{sanitize(vl_name)}_{sanitize(pass_name)}_"
+            n.file_slots[0].path = core.output_slot_path(blend_name, vl_name, pass_name)
             return n
 
     # 無ければ新規作成
@@ -893,14 +921,14 @@ def _ensure_output_node_for_pass(scene, nt, vl_name, pass_name, *, blend_name, b
     if hasattr(img_set, "exr_codec"):
         fo.format.exr_codec   = img_set.exr_codec
 
-    fo.base_path = os.path.join(base_fp, sanitize(blend_name), sanitize(vl_name), sanitize(pass_name)) + os.sep
+    fo.base_path = core.output_base_path(base_fp, blend_name, vl_name, pass_name)
 
     # スロットは1つに固定
     if not fo.file_slots:
         fo.file_slots.new(pass_name)
     else:
         fo.file_slots[0].path = ""
-    fo.file_slots[0].path = f"{sanitize(blend_name)}_{sanitize(vl_name)}_{sanitize(pass_name)}_"
+    fo.file_slots[0].path = core.output_slot_path(blend_name, vl_name, pass_name)
     return fo
 
 # =========================================================
@@ -1080,6 +1108,9 @@ class VLM_OT_render_active_viewlayer(bpy.types.Operator):
         orig_engine = sc.render.engine
         orig_frame  = sc.frame_current
         orig_world  = sc.world
+        orig_simplify = snapshot_simplify(sc)
+        orig_threads = (sc.render.threads_mode, sc.render.threads)
+        _reset_batch_stats()
 
         try:
             # アクティブのみON
@@ -1092,15 +1123,26 @@ class VLM_OT_render_active_viewlayer(bpy.types.Operator):
             if target_vl:
                 win.view_layer = target_vl
             vl = win.view_layer
+            # 同時に走る他プロセスの相手は『レンダリングする』チェックのレイヤー群とみなす
+            peers = _selected_viewlayers(sc)
+            alloc = _thread_allocation(sc, peers if vl in peers else peers + [vl])
+            # カメラに映らないコレクションをレンダー中だけ除外
+            frustum_cull.cull_view_layer(sc, vl)
 
             if not self.use_animation:
                 apply_active_viewlayer_overrides(context)
                 light_camera.apply_lights_for_viewlayer(vl)
-                apply_render_override(sc, vl)
+                _apply_render_override(sc, vl)
+                _apply_thread_allocation(sc, vl, alloc)
                 sc.frame_set(sc.frame_current)
                 _prepare_compositor_nodes(sc)
                 _update_dynamic_paths_and_apply_ao(sc)
-                bpy.ops.render.render(write_still=True, use_viewport=False)
+                image_buffers.free_unused_images(sc, vl)
+                deferred_output.prepare_intermediate_outputs(sc, vl)
+                with operator_render():
+                    bpy.ops.render.render(write_still=deferred_output.write_still_enabled(sc, vl.name),
+                                          use_viewport=False)
+                deferred_output.enqueue_frame(sc, vl.name, sc.frame_current)
                 _vlm_purge(sc); _free_render_images_and_viewers(); _defer_strong_purge(sc, delay=0.1)
             else:
                 # ★ 実レンジを解決（OFFなら先頭VLのUI値）
@@ -1121,12 +1163,18 @@ class VLM_OT_render_active_viewlayer(bpy.types.Operator):
 
                     apply_active_viewlayer_overrides(context)
                     light_camera.apply_lights_for_viewlayer(vl)
-                    apply_render_override(sc, vl)
+                    _apply_render_override(sc, vl)
+                    _apply_thread_allocation(sc, vl, alloc)
 
                     sc.frame_set(f)
                     _prepare_compositor_nodes(sc)
                     _update_dynamic_paths_and_apply_ao(sc)
-                    bpy.ops.render.render(write_still=True, use_viewport=False)
+                    image_buffers.free_unused_images(sc, vl)
+                    deferred_output.prepare_intermediate_outputs(sc, vl)
+                    with operator_render():
+                        bpy.ops.render.render(write_still=deferred_output.write_still_enabled(sc, vl.name),
+                                              use_viewport=False)
+                    deferred_output.enqueue_frame(sc, vl.name, f)
                     _vlm_purge(sc); _free_render_images_and_viewers(); _defer_strong_purge(sc, delay=0.1)
 
                     done += 1
@@ -1136,6 +1184,17 @@ class VLM_OT_render_active_viewlayer(bpy.types.Operator):
                 context.window_manager.progress_end()
 
         finally:
+            # 中間出力を解除（変換はバックグラウンドで継続）
+            try:
+                deferred_output.finish_batch(sc)
+            except Exception:
+                pass
+            try:
+                frustum_cull.restore_view_layer(sc)
+            except Exception:
+                pass
+            image_buffers.reset()
+            _log_write_stats()
             # 復元
             try:
                 for v in sc.view_layers:
@@ -1144,6 +1203,8 @@ class VLM_OT_render_active_viewlayer(bpy.types.Operator):
                 sc.render.engine = orig_engine
                 sc.frame_set(orig_frame)
                 sc.world         = orig_world
+                restore_simplify(sc, orig_simplify)
+                sc.render.threads_mode, sc.render.threads = orig_threads
             except Exception:
                 pass
 
@@ -1191,6 +1252,12 @@ class VLM_OT_render_all_viewlayers(bpy.types.Operator):
         self._need_reset_frame = False
 
         self._done_steps = 0
+        # レイヤーごとの Simplify 上書きは終了時に元へ戻す
+        self._orig_simplify = snapshot_simplify(sc)
+        self._orig_threads = (sc.render.threads_mode, sc.render.threads)
+        self._thread_alloc = _thread_allocation(sc, self._vl_list)
+        self._culled_vl = None
+        _reset_batch_stats()
         wm.progress_begin(0, self._total_steps)
         self._timer = wm.event_timer_add(0.01, window=context.window)
         context.window_manager.modal_handler_add(self)
@@ -1199,6 +1266,12 @@ class VLM_OT_render_all_viewlayers(bpy.types.Operator):
     def modal(self, context, event):
         if event.type == 'ESC':
             context.window_manager.progress_end()
+            deferred_output.finish_batch(context.scene)
+            frustum_cull.restore_view_layer(context.scene)
+            image_buffers.reset()
+            _log_write_stats()
+            restore_simplify(context.scene, self._orig_simplify)
+            context.scene.render.threads_mode, context.scene.render.threads = self._orig_threads
             self.report({'WARNING'}, "キャンセルしました")
             return {'CANCELLED'}
 
@@ -1212,6 +1285,12 @@ class VLM_OT_render_all_viewlayers(bpy.types.Operator):
         # 全部終わった
         if self._vl_index >= len(self._vl_list):
             wm.progress_end()
+            deferred_output.finish_batch(sc)
+            frustum_cull.restore_view_layer(sc)
+            image_buffers.reset()
+            _log_write_stats()
+            restore_simplify(sc, self._orig_simplify)
+            sc.render.threads_mode, sc.render.threads = self._orig_threads
             if self._skipped_frames:
                 self.report({'INFO'}, f"全レイヤーのレンダリングが完了しました。（スキップ: {self._skipped_frames}フレーム）")
             else:
@@ -1225,6 +1304,12 @@ class VLM_OT_render_all_viewlayers(bpy.types.Operator):
             v.use = (v == vl)
         win.view_layer = vl
 
+        # レイヤーが替わったら前のレイヤーの除外を戻し、このレイヤーを視錐台カリング
+        if self._culled_vl != vl.name:
+            frustum_cull.restore_view_layer(sc)
+            frustum_cull.cull_view_layer(sc, vl)
+            self._culled_vl = vl.name
+
         # ★ このVLで実際に使うレンジ
         start, end, step = _resolve_frame_range(sc, vl)
 
@@ -1247,13 +1332,19 @@ class VLM_OT_render_all_viewlayers(bpy.types.Operator):
         # 各種オーバーライド適用
         apply_active_viewlayer_overrides(context)
         light_camera.apply_lights_for_viewlayer(vl)
-        apply_render_override(sc, vl)
+        _apply_render_override(sc, vl)
+        _apply_thread_allocation(sc, vl, self._thread_alloc)
 
         # レンダリング実行
         sc.frame_set(self._frame)
         _prepare_compositor_nodes(sc)
         _update_dynamic_paths_and_apply_ao(sc)
-        bpy.ops.render.render(write_still=True, use_viewport=False)
+        image_buffers.free_unused_images(sc, vl)
+        deferred_output.prepare_intermediate_outputs(sc, vl)
+        with operator_render():
+            bpy.ops.render.render(write_still=deferred_output.write_still_enabled(sc, vl.name),
+                                  use_viewport=False)
+        deferred_output.enqueue_frame(sc, vl.name, self._frame)
         _vlm_purge(sc); _free_render_images_and_viewers(); _defer_strong_purge(sc, delay=0.1)
 
         # 進捗
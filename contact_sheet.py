@@ -0,0 +1,383 @@
+# contact_sheet.py
+#
+# 全（選択）ビューレイヤーの低解像度プレビューを並列レンダリングし、
+# レイヤー名ラベル付きの 1 枚のグリッド画像（コンタクトシート）にまとめる
+#   - .blend の一時コピーを別プロセスの Blender で開き、レイヤーを分担してレンダー
+#   - 解像度％とサンプル数は強制サンプル（vlm_force_samples_*）の上からさらに下げる
+#   - タイルは「解決済み設定＋レイヤー構成」のハッシュでキャッシュし、変化の無いレイヤーは再レンダーしない
+# ------------------------------------------------------------
+
+import dataclasses
+import hashlib
+import json
+import math
+import os
+import pathlib
+import sys
+import tempfile
+
+import bpy
+from bpy.props import BoolProperty, IntProperty
+
+from . import core_bpy, deferred_output, light_camera, material_override
+from . import collection_management as colm
+from .render_override import apply_render_override
+from .viewlayer_operations import _apply_content_collection_overrides
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contact_sheet_worker.py")
+SHEET_IMAGE_NAME = "VLM Contact Sheet"
+
+# タイル間の余白（px）と背景色
+_GAP = 4
+_BG = (0.05, 0.05, 0.05, 1.0)
+
+
+# ──────────────────────────────────────────────
+# ① キャッシュキー
+# ──────────────────────────────────────────────
+def cache_dir():
+    blend = pathlib.Path(bpy.data.filepath).stem or "Untitled"
+    path = os.path.join(tempfile.gettempdir(), "vlm_contact_sheet", colm._sanitize(blend))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _collection_states(vl):
+    out = []
+
+    def _walk(lc):
+        out.append((lc.collection.name, lc.exclude, lc.holdout, lc.indirect_only))
+        for child in lc.children:
+            _walk(child)
+
+    _walk(vl.layer_collection)
+    return out
+
+
+def _material_overrides(vl):
+    return [(e.collection.name, e.material.name, e.priority) for e in material_override.iter_overrides(vl)]
+
+
+def preview_samples(resolved_samples, cap):
+    """強制サンプル適用後の値をさらにプレビュー上限で抑える（Workbench は None のまま）"""
+    if resolved_samples is None:
+        return None
+    return max(1, min(int(resolved_samples), int(cap)))
+
+
+def tile_key(scene, vl, percentage, samples_cap):
+    """解決済みレンダー設定＋レイヤー構成のハッシュ。
+    オブジェクトやマテリアル自体の編集は含まないので、その場合はキャッシュを使わずに再レンダーする。"""
+    res = core_bpy.resolve_view_layer(scene, vl)
+    payload = {
+        "blend": bpy.data.filepath,
+        "scene": scene.name,
+        "frame": scene.frame_current,
+        "resolved": dataclasses.asdict(res),
+        "collections": _collection_states(vl),
+        "materials": _material_overrides(vl),
+        "lights": light_camera._get_light_state_dict(vl),
+        "percentage": int(percentage),
+        "samples": preview_samples(res.samples, samples_cap),
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:20], res
+
+
+# ──────────────────────────────────────────────
+# ② ワーカー側（contact_sheet_worker.py から呼ばれる）
+# ──────────────────────────────────────────────
+def _switch_viewlayer(scene, vl):
+    """VLM_OT_set_active_viewlayer と同等の適用処理（ウィンドウが無い環境向け）"""
+    if _apply_content_collection_overrides(vl):
+        vl.update()
+    material_override._apply_selective_material_overrides(vl)
+    light_camera.apply_lights_for_viewlayer(vl, do_view_update=False)
+    apply_render_override(scene, vl)
+
+
+def _configure_label(r, label):
+    """スタンプはノートだけを有効にしてレイヤー名を焼き込む"""
+    for attr in dir(r):
+        if attr.startswith("use_stamp_") and attr not in {"use_stamp_note", "use_stamp_labels"}:
+            try:
+                setattr(r, attr, False)
+            except Exception:
+                pass
+    r.use_stamp = True
+    r.use_stamp_note = True
+    r.stamp_note_text = label
+    r.stamp_font_size = max(8, int(r.resolution_y * r.resolution_percentage / 100 * 0.05))
+
+
+def render_tile(scene, job):
+    vl = scene.view_layers[job["layer"]]
+    for v in scene.view_layers:
+        v.use = (v == vl)
+    _switch_viewlayer(scene, vl)
+
+    r = scene.render
+    r.resolution_percentage = int(job["percentage"])
+    samples = job.get("samples")
+    if samples is not None:
+        if r.engine == 'CYCLES':
+            scene.cycles.samples = samples
+            scene.cycles.use_denoising = False
+        elif hasattr(scene, "eevee"):
+            scene.eevee.taa_render_samples = samples
+
+    # File Output ノードに書かせない／VSE も通さない
+    r.use_compositing = False
+    r.use_sequencer = False
+    _configure_label(r, vl.name)
+
+    ims = r.image_settings
+    ims.file_format = 'PNG'
+    ims.color_mode = 'RGBA'
+    ims.color_depth = '8'
+    r.use_file_extension = False
+    r.filepath = job["output"]
+
+    bpy.ops.render.render(write_still=True, use_viewport=False, layer=vl.name)
+    if not os.path.isfile(job["output"]):
+        raise RuntimeError(f"tile not written: {job['output']}")
+    return job["output"]
+
+
+def run_jobs(jobs):
+    """ワーカー入口：必要ならアドオンを登録し、割り当てられたタイルを順にレンダーする"""
+    if not hasattr(bpy.types.ViewLayer, "vlm_render"):
+        pkg = sys.modules.get(__package__)
+        if pkg is not None and hasattr(pkg, "register"):
+            pkg.register()
+
+    scene = bpy.data.scenes.get(jobs[0]["scene"]) if jobs else None
+    results = []
+    for job in jobs:
+        try:
+            if scene is None:
+                raise RuntimeError(f"scene not found: {job.get('scene')}")
+            out = render_tile(scene, job)
+            results.append({"id": job.get("id"), "ok": True, "output": out})
+        except Exception as e:
+            results.append({"id": job.get("id"), "ok": False, "error": f"{e}"})
+    return results
+
+
+# ──────────────────────────────────────────────
+# ③ グリッド画像の組み立て
+# ──────────────────────────────────────────────
+def assemble_sheet(tile_paths, columns=0):
+    """タイル画像（下から上の Blender 画素順）を左上から並べた 1 枚の画像にする"""
+    import numpy as np
+
+    tiles = []
+    for path in tile_paths:
+        img = bpy.data.images.load(path, check_existing=False)
+        try:
+            w, h = img.size
+            px = np.empty(w * h * 4, dtype=np.float32)
+            img.pixels.foreach_get(px)
+            tiles.append(px.reshape(h, w, 4))
+        finally:
+            bpy.data.images.remove(img)
+    if not tiles:
+        return None
+
+    cols = columns if columns > 0 else math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / cols)
+    cell_w = max(t.shape[1] for t in tiles)
+    cell_h = max(t.shape[0] for t in tiles)
+    width = cols * cell_w + (cols + 1) * _GAP
+    height = rows * cell_h + (rows + 1) * _GAP
+
+    sheet = np.empty((height, width, 4), dtype=np.float32)
+    sheet[:] = _BG
+    for i, tile in enumerate(tiles):
+        c, r = i % cols, i // cols
+        x = _GAP + c * (cell_w + _GAP)
+        # 画素の行は下から上。1 段目を最上段に置く
+        top = height - _GAP - r * (cell_h + _GAP)
+        th, tw = tile.shape[:2]
+        sheet[top - th:top, x:x + tw] = tile
+
+    img = bpy.data.images.get(SHEET_IMAGE_NAME)
+    if img is not None and tuple(img.size) != (width, height):
+        bpy.data.images.remove(img)
+        img = None
+    if img is None:
+        img = bpy.data.images.new(SHEET_IMAGE_NAME, width, height, alpha=True)
+    img.pixels.foreach_set(sheet.ravel())
+    img.update()
+    return img
+
+
+def _show_in_image_editor(context, img):
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'IMAGE_EDITOR':
+                area.spaces.active.image = img
+                area.tag_redraw()
+                return True
+    return False
+
+
+# ──────────────────────────────────────────────
+# ④ オペレーター
+# ──────────────────────────────────────────────
+class VLM_OT_render_contact_sheet(bpy.types.Operator):
+    bl_idname = "vlm.render_contact_sheet"
+    bl_label = "コンタクトシート（全 Layers プレビュー）"
+    bl_description = ("選択中のビューレイヤーを低解像度・低サンプルで並列レンダリングし、"
+                      "ラベル付きのグリッド画像にまとめる")
+    bl_options = {'REGISTER'}
+
+    use_cache: BoolProperty(
+        name="Use Cache",
+        description="設定が変わっていないレイヤーは前回のタイルを再利用する",
+        default=True,
+    )
+
+    _timer = None
+    _pool = None
+    _tmp_blend = None
+    _tiles = None
+    _pending = None
+
+    def execute(self, context):
+        sc = context.scene
+        pct = int(sc.vlm_preview_percentage)
+        cap = int(sc.vlm_preview_samples)
+        out_dir = cache_dir()
+
+        self._tiles = []     # (レイヤー名, タイルパス) をレイヤー順に
+        self._pending = {}   # ジョブ id → レイヤー名
+        jobs = []
+        layers = colm._selected_viewlayers(sc)
+        # プレビュー用プロセスどうしでコアを分け合う
+        threads = core_bpy.allocate_layer_threads(sc, layers, colm._thread_budget(sc), sc.vlm_preview_workers)
+        for vl in layers:
+            key, res = tile_key(sc, vl, pct, cap)
+            path = os.path.join(out_dir, f"{key}.png")
+            self._tiles.append((vl.name, path))
+            if self.use_cache and os.path.isfile(path):
+                continue
+            jobs.append({
+                "scene": sc.name,
+                "layer": vl.name,
+                "output": path,
+                "percentage": max(1, res.resolution_percentage * pct // 100),
+                "samples": preview_samples(res.samples, cap),
+                "threads": threads.get(vl.name, 1),
+                "addon_dir": os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                # 拡張機能として入っている場合（bl_ext.*）もフォルダ名で import させる
+                "package": __package__.rpartition(".")[2],
+            })
+
+        if not jobs:
+            return self._finish(context)
+
+        # 未保存の変更も含めて一時コピーをワーカーに開かせる
+        fd, self._tmp_blend = tempfile.mkstemp(prefix="vlm_preview_", suffix=".blend")
+        os.close(fd)
+        bpy.ops.wm.save_as_mainfile(filepath=self._tmp_blend, copy=True, check_existing=False)
+
+        self._pool = deferred_output.BackgroundJobPool(
+            max_workers=sc.vlm_preview_workers, script=WORKER_SCRIPT, blend_path=self._tmp_blend)
+        # ワーカーごとに .blend を読み込むので、レイヤーは均等にまとめて渡す
+        self._pool.max_batch = max(1, math.ceil(len(jobs) / self._pool.max_workers))
+        for job_id, job in zip(self._pool.submit_many(jobs), jobs):
+            self._pending[job_id] = job["layer"]
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        wm.modal_handler_add(self)
+        self.report({'INFO'}, f"プレビュー: {len(jobs)} レイヤーをレンダー中（キャッシュ {len(self._tiles) - len(jobs)}）")
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._cleanup(context)
+            self.report({'WARNING'}, "プレビューを中断しました")
+            return {'CANCELLED'}
+        if event.type != 'TIMER' or self._pool.poll():
+            return {'PASS_THROUGH'}
+
+        failed = [self._pending[i] for i, res in self._pool.results.items()
+                  if not res.get("ok") and i in self._pending]
+        if failed:
+            self.report({'WARNING'}, f"プレビュー失敗: {', '.join(failed)}")
+        self._cleanup(context)
+        return self._finish(context)
+
+    def _cleanup(self, context):
+        if self._pool is not None:
+            # 実行ごとに作るプールなので、一時フォルダもここで消す
+            self._pool.shutdown(kill=True)
+            self._pool = None
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        if self._tmp_blend and os.path.isfile(self._tmp_blend):
+            try:
+                os.remove(self._tmp_blend)
+            except OSError:
+                pass
+
+    def _finish(self, context):
+        sc = context.scene
+        paths = [p for _, p in self._tiles if os.path.isfile(p)]
+        img = assemble_sheet(paths, int(sc.vlm_preview_columns))
+        if img is None:
+            self.report({'WARNING'}, "プレビュー画像がありません")
+            return {'CANCELLED'}
+        img.filepath_raw = os.path.join(cache_dir(), "contact_sheet.png")
+        img.file_format = 'PNG'
+        img.save()
+        if not _show_in_image_editor(context, img):
+            self.report({'INFO'}, f"コンタクトシート: {img.filepath_raw}")
+        return {'FINISHED'}
+
+
+# ──────────────────────────────────────────────
+# register / unregister
+# ──────────────────────────────────────────────
+classes = (
+    VLM_OT_render_contact_sheet,
+)
+
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    bpy.types.Scene.vlm_preview_percentage = IntProperty(
+        name="Preview Scale (%)",
+        description="各レイヤーの解像度％に掛ける縮小率",
+        default=25, min=1, max=100, subtype='PERCENTAGE',
+    )
+    bpy.types.Scene.vlm_preview_samples = IntProperty(
+        name="Preview Samples",
+        description="プレビュー時のサンプル数上限（強制サンプルより優先して下げる）",
+        default=8, min=1, max=4096,
+    )
+    bpy.types.Scene.vlm_preview_workers = IntProperty(
+        name="Preview Workers",
+        description="同時に動かすプレビュー用プロセス数",
+        default=2, min=1, max=32,
+    )
+    bpy.types.Scene.vlm_preview_columns = IntProperty(
+        name="Columns",
+        description="グリッドの列数（0 で自動）",
+        default=0, min=0, max=64,
+    )
+
+
+def unregister():
+    for nm in ("vlm_preview_percentage", "vlm_preview_samples", "vlm_preview_workers", "vlm_preview_columns"):
+        if hasattr(bpy.types.Scene, nm):
+            delattr(bpy.types.Scene, nm)
+    for c in reversed(classes):
+        try:
+            bpy.utils.unregister_class(c)
+        except RuntimeError:
+            pass
@@ -0,0 +1,36 @@
+# contact_sheet_worker.py
+#
+# コンタクトシート用のワーカースクリプト。
+#   blender -b --factory-startup <一時コピー.blend> -t <threads> --python contact_sheet_worker.py -- <jobs.json>
+#
+# --factory-startup ではアドオンが無効なので、ジョブに書かれた場所からパッケージを import し、
+# contact_sheet.run_jobs に処理を任せる。結果は <jobs.json>.result.json に書き出す。
+# ------------------------------------------------------------
+
+import importlib
+import json
+import sys
+
+
+def main(argv):
+    job_file = argv[0]
+    with open(job_file, "r", encoding="utf-8") as fh:
+        jobs = json.load(fh)
+
+    results = []
+    if jobs:
+        addon_dir, package = jobs[0]["addon_dir"], jobs[0]["package"]
+        if addon_dir not in sys.path:
+            sys.path.insert(0, addon_dir)
+        try:
+            module = importlib.import_module(f"{package}.contact_sheet")
+            results = module.run_jobs(jobs)
+        except Exception as e:
+            results = [{"id": job.get("id"), "ok": False, "error": f"{e}"} for job in jobs]
+
+    with open(job_file + ".result.json", "w", encoding="utf-8") as fh:
+        json.dump(results, fh)
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,563 @@
+# core.py
+#
+# bpy 非依存のコアロジック
+#   - ビューレイヤー設定の解決（先頭レイヤーへのフォールバック）
+#   - フレーム範囲 / フレームレート / 解像度の変換
+#   - レンダージョブ計画
+#   - 出力パス命名
+#
+# Blender を起動しなくても import できるよう、このモジュールでは bpy を一切使わない。
+# bpy オブジェクトとの変換は core_bpy.py（薄いアダプタ）が担当する。
+# ------------------------------------------------------------
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# ──────────────────────────────────────────────
+# ① エンジン識別子
+# ──────────────────────────────────────────────
+DEFAULT_ENGINE = "BLENDER_EEVEE_NEXT"
+ENGINE_IDS = ("BLENDER_EEVEE_NEXT", "BLENDER_WORKBENCH", "CYCLES")
+LEGACY_ENGINE_IDS = {"BLENDER_EEVEE", "EEVEE"}
+
+
+def normalize_engine_id(val: str) -> str:
+    """旧識別子（BLENDER_EEVEE 等）や想定外の値を Eevee Next に寄せる"""
+    if not val:
+        return DEFAULT_ENGINE
+    if val in LEGACY_ENGINE_IDS:
+        return DEFAULT_ENGINE
+    if val not in ENGINE_IDS:
+        return DEFAULT_ENGINE
+    return val
+
+
+# ──────────────────────────────────────────────
+# ② VLM_RenderSettings の項目 → Scene 側プロパティの対応表
+#    （左: VLM_RenderSettings のプロパティ名 / 右: scene.cycles のプロパティ名）
+# ──────────────────────────────────────────────
+LIGHT_PATH_PROP_MAP = [
+    ("light_path_max_bounces", "max_bounces"),
+    ("light_path_diffuse_bounces", "diffuse_bounces"),
+    ("light_path_glossy_bounces", "glossy_bounces"),
+    ("light_path_transmission_bounces", "transmission_bounces"),
+    ("light_path_volume_bounces", "volume_bounces"),
+    ("light_path_transparent_bounces", "transparent_max_bounces"),
+    ("light_path_clamp_direct", "sample_clamp_direct"),
+    ("light_path_clamp_indirect", "sample_clamp_indirect"),
+    ("light_path_filter_glossy", "filter_glossy"),
+    ("light_path_caustics_reflective", "caustics_reflective"),
+    ("light_path_caustics_refractive", "caustics_refractive"),
+]
+
+FAST_GI_PROP_MAP = [
+    ("fast_gi_use", "use_fast_gi"),
+    ("fast_gi_method", "fast_gi_method"),
+    ("fast_gi_ao_factor", "fast_gi_ao_factor"),
+    ("fast_gi_ao_distance", "fast_gi_ao_distance"),
+    ("fast_gi_viewport_bounces", "fast_gi_viewport_bounces"),
+    ("fast_gi_render_bounces", "fast_gi_render_bounces"),
+]
+
+
+# レンダー時間を直接縛る設定（適応サンプリング・時間制限）は scene.cycles、
+# スレッド数は scene.render へ書く
+CYCLES_PERF_PROP_MAP = [
+    ("cycles_use_adaptive_sampling", "use_adaptive_sampling"),
+    ("cycles_adaptive_threshold", "adaptive_threshold"),
+    ("cycles_adaptive_min_samples", "adaptive_min_samples"),
+    ("cycles_time_limit", "time_limit"),
+]
+
+RENDER_THREADS_PROP_MAP = [
+    ("threads_mode", "threads_mode"),
+    ("threads", "threads"),
+]
+
+# 簡略化（Simplify）：scene.render 側と scene.cycles 側（テクスチャ制限・カリング）
+SIMPLIFY_PROP_MAP = [
+    ("simplify_use", "use_simplify"),
+    ("simplify_subdivision", "simplify_subdivision_render"),
+    ("simplify_child_particles", "simplify_child_particles_render"),
+    ("simplify_volumes", "simplify_volumes"),
+]
+
+SIMPLIFY_CYCLES_PROP_MAP = [
+    ("simplify_texture_limit", "texture_limit_render"),
+    ("simplify_use_camera_cull", "use_camera_cull"),
+    ("simplify_camera_cull_margin", "camera_cull_margin"),
+    ("simplify_use_distance_cull", "use_distance_cull"),
+    ("simplify_distance_cull_margin", "distance_cull_margin"),
+]
+
+
+# EEVEE Next の重い設定（scene.eevee）。"a.b" はネストしたプロパティ（ray_tracing_options など）
+EEVEE_PERF_PROP_MAP = [
+    ("eevee_shadow_resolution_scale", "shadow_resolution_scale"),
+    ("eevee_shadow_ray_count", "shadow_ray_count"),
+    ("eevee_shadow_step_count", "shadow_step_count"),
+    ("eevee_volumetric_tile_size", "volumetric_tile_size"),
+    ("eevee_volumetric_samples", "volumetric_samples"),
+    ("eevee_ray_tracing_method", "ray_tracing_method"),
+    ("eevee_ray_tracing_resolution", "ray_tracing_options.resolution_scale"),
+    ("eevee_motion_blur_steps", "motion_blur_steps"),
+]
+
+
+# ──────────────────────────────────────────────
+# ③ データクラス
+# ──────────────────────────────────────────────
+@dataclass
+class LayerSettings:
+    """1 ビューレイヤー分の VLM_RenderSettings をプレーンな値で保持する。
+    camera / world は ID 名（文字列）で持つ。"""
+    name: str = ""
+
+    engine_enable: bool = False
+    engine: str = DEFAULT_ENGINE
+    samples_enable: bool = False
+    samples: int = 64
+    use_denoise: bool = False
+
+    light_paths_enable: bool = False
+    light_paths: Dict[str, object] = field(default_factory=dict)
+    fast_gi_enable: bool = False
+    fast_gi: Dict[str, object] = field(default_factory=dict)
+    cycles_perf_enable: bool = False
+    cycles_perf: Dict[str, object] = field(default_factory=dict)   # CYCLES_PERF + RENDER_THREADS
+    simplify_enable: bool = False
+    simplify: Dict[str, object] = field(default_factory=dict)      # SIMPLIFY + SIMPLIFY_CYCLES
+    eevee_perf_enable: bool = False
+    eevee_perf: Dict[str, object] = field(default_factory=dict)
+
+    camera_enable: bool = False
+    camera: Optional[str] = None
+    world_enable: bool = False
+    world: Optional[str] = None   # ViewLayer.vlm_world
+
+    format_enable: bool = False
+    resolution_x: int = 1920
+    resolution_y: int = 1080
+    resolution_percentage: int = 100
+    aspect_x: float = 1.0
+    aspect_y: float = 1.0
+    frame_rate: float = 24.0
+
+    frame_enable: bool = False
+    frame_start: int = 1
+    frame_end: int = 250
+    frame_step: int = 1
+
+
+@dataclass
+class SceneSettings:
+    """レイヤー設定の解決に必要な Scene 側の値"""
+    force_samples_enable: bool = False
+    force_samples_cycles: int = 16
+    force_samples_eevee: int = 16
+    world: Optional[str] = None   # Scene.world
+
+
+@dataclass
+class ResolvedSettings:
+    """フォールバック解決済みの、実際にシーンへ書き込む値。
+    samples / camera / world が None の場合は「書き込まない（現状維持）」を意味する。"""
+    layer: str
+    engine: str
+    samples: Optional[int]
+    use_denoise: bool
+    light_paths: Dict[str, object]
+    fast_gi: Dict[str, object]
+    camera: Optional[str]
+    resolution_x: int
+    resolution_y: int
+    resolution_percentage: int
+    pixel_aspect_x: float
+    pixel_aspect_y: float
+    fps: int
+    fps_base: float
+    frame_start: int
+    frame_end: int
+    frame_step: int
+    world: Optional[str]
+    cycles_perf: Dict[str, object] = field(default_factory=dict)
+    simplify: Dict[str, object] = field(default_factory=dict)
+    eevee_perf: Dict[str, object] = field(default_factory=dict)
+
+
+@dataclass
+class RenderJob:
+    """レンダーの 1 ステップ（ビューレイヤー × フレーム）"""
+    layer: str
+    frame: int
+
+
+# ──────────────────────────────────────────────
+# ④ 変換ヘルパー
+# ──────────────────────────────────────────────
+MAX_RESOLUTION = 16384
+
+
+def fps_from_frame_rate(rate: float) -> Tuple[int, float]:
+    """UI の FPS 値を (render.fps, render.fps_base) に変換（29.97 / 23.976 は NTSC 表記）"""
+    fr = round(float(rate), 3)
+    if round(fr, 2) == 29.97:
+        return 30000, 1001.0
+    if fr == 23.976:
+        return 24000, 1001.0
+    return int(round(fr)), 1.0
+
+
+def resolution_from_format(res_x: int, res_y: int, percentage: int) -> Tuple[int, int, int]:
+    """(X, Y, %) を render に書き込む値へ変換。
+    100% 超はピクセル数を直接拡大して 100% に戻す（上限 16384）。"""
+    scale = max(1, min(int(percentage), 1000))
+    if scale <= 100:
+        return int(res_x), int(res_y), scale
+    factor = scale / 100.0
+    return (min(int(round(res_x * factor)), MAX_RESOLUTION),
+            min(int(round(res_y * factor)), MAX_RESOLUTION),
+            100)
+
+
+def _is_top(layer: LayerSettings, top: LayerSettings) -> bool:
+    return layer is top or layer.name == top.name
+
+
+def _pick(layer: LayerSettings, top: LayerSettings, enable_attr: str) -> LayerSettings:
+    """enable フラグが立っている（または先頭レイヤー）ならそのレイヤー、そうでなければ先頭レイヤー"""
+    if _is_top(layer, top) or getattr(layer, enable_attr, False):
+        return layer
+    return top
+
+
+# ──────────────────────────────────────────────
+# ⑤ 設定解決
+# ──────────────────────────────────────────────
+def resolve_frame_range(layer: LayerSettings, top: LayerSettings) -> Tuple[int, int, int]:
+    """このVLで実際に使うフレーム範囲（start, end, step）を返す。
+    VL側がOFFなら『先頭VLのUI値』にフォールバック。"""
+    src = layer if layer.frame_enable else top
+    return int(src.frame_start), int(src.frame_end), max(1, int(src.frame_step))
+
+
+def resolve_samples(engine: str, layer: LayerSettings, top: LayerSettings,
+                    scene: SceneSettings) -> Optional[int]:
+    """サンプル数は【強制】＞【各VLサンプルON】＞【先頭VLのSamples】の優先順位。
+    サンプル数の概念が無いエンジン（Workbench）は None。"""
+    if engine not in {"CYCLES", "BLENDER_EEVEE_NEXT"}:
+        return None
+    if scene.force_samples_enable:
+        forced = scene.force_samples_cycles if engine == "CYCLES" else scene.force_samples_eevee
+        return max(1, int(forced))
+    src = layer if layer.samples_enable else top
+    return max(1, int(src.samples))
+
+
+def resolve_settings(layer: LayerSettings, top: LayerSettings,
+                     scene: Optional[SceneSettings] = None) -> ResolvedSettings:
+    """先頭レイヤーへのフォールバックを含めて、レイヤーの実効設定を解決する"""
+    scene = scene or SceneSettings()
+    is_top = _is_top(layer, top)
+
+    # 1) エンジン（デノイズはエンジン選択元に追随）
+    eng_src = _pick(layer, top, "engine_enable")
+    engine = normalize_engine_id(eng_src.engine)
+
+    # 2) Cycles ライトパス / 高速GI / パフォーマンス / 簡略化 / EEVEE パフォーマンス
+    light_paths = dict(_pick(layer, top, "light_paths_enable").light_paths)
+    fast_gi = dict(_pick(layer, top, "fast_gi_enable").fast_gi)
+    cycles_perf = dict(_pick(layer, top, "cycles_perf_enable").cycles_perf)
+    simplify = dict(_pick(layer, top, "simplify_enable").simplify)
+    eevee_perf = dict(_pick(layer, top, "eevee_perf_enable").eevee_perf)
+
+    # 3) カメラ（先頭は自身の値のみ、他は enable ON かつ設定ありなら自身）
+    if is_top:
+        camera = layer.camera or None
+    else:
+        camera = (layer.camera if (layer.camera_enable and layer.camera) else top.camera) or None
+
+    # 4) フォーマット / フレームレート
+    fmt = _pick(layer, top, "format_enable")
+    res_x, res_y, pct = resolution_from_format(fmt.resolution_x, fmt.resolution_y, fmt.resolution_percentage)
+    fps, fps_base = fps_from_frame_rate(fmt.frame_rate)
+
+    # 5) フレーム範囲
+    frm = _pick(layer, top, "frame_enable")
+    start = max(0, int(frm.frame_start))
+    end = max(start, int(frm.frame_end))
+    step = max(1, int(frm.frame_step))
+
+    # 6) World（先頭VLの vlm_world ＞ Scene.world）
+    base_world = top.world or scene.world
+    if is_top:
+        world = base_world
+    else:
+        world = layer.world if (layer.world_enable and layer.world) else base_world
+
+    return ResolvedSettings(
+        layer=layer.name,
+        engine=engine,
+        samples=resolve_samples(engine, layer, top, scene),
+        use_denoise=bool(eng_src.use_denoise),
+        light_paths=light_paths,
+        fast_gi=fast_gi,
+        camera=camera,
+        resolution_x=res_x,
+        resolution_y=res_y,
+        resolution_percentage=pct,
+        pixel_aspect_x=float(fmt.aspect_x),
+        pixel_aspect_y=float(fmt.aspect_y),
+        fps=fps,
+        fps_base=fps_base,
+        frame_start=start,
+        frame_end=end,
+        frame_step=step,
+        world=world or None,
+        cycles_perf=cycles_perf,
+        simplify=simplify,
+        eevee_perf=eevee_perf,
+    )
+
+
+# ──────────────────────────────────────────────
+# ⑥ ジョブ計画
+# ──────────────────────────────────────────────
+def iter_frames(start: int, end: int, step: int):
+    f = int(start)
+    step = max(1, int(step))
+    while f <= end:
+        yield f
+        f += step
+
+
+def count_frames(start: int, end: int, step: int) -> int:
+    if end < start:
+        return 0
+    return ((int(end) - int(start)) // max(1, int(step))) + 1
+
+
+def plan_render_jobs(layers: List[LayerSettings], top: LayerSettings, *,
+                     animation: bool = True) -> List[RenderJob]:
+    """対象レイヤー群のレンダージョブ一覧を作る（静止画は各レイヤーの開始フレームのみ）"""
+    jobs = []
+    for layer in layers:
+        start, end, step = resolve_frame_range(layer, top)
+        if not animation:
+            jobs.append(RenderJob(layer.name, start))
+            continue
+        jobs.extend(RenderJob(layer.name, f) for f in iter_frames(start, end, step))
+    return jobs
+
+
+# ──────────────────────────────────────────────
+# ⑥' CPU スレッド配分（同一マシンで複数プロセスを同時に回す場合）
+# ──────────────────────────────────────────────
+# エンジンごとの 1 サンプルあたりの相対コスト（大まかな目安）
+ENGINE_COST_WEIGHTS = {
+    "CYCLES": 1.0,
+    "BLENDER_EEVEE_NEXT": 0.05,
+    "BLENDER_WORKBENCH": 0.005,
+}
+
+
+def estimate_layer_cost(res: ResolvedSettings) -> float:
+    """1 フレームの相対コスト ≒ 出力画素数 × サンプル数 × エンジン係数"""
+    scale = res.resolution_percentage / 100.0
+    pixels = res.resolution_x * scale * res.resolution_y * scale
+    samples = res.samples if res.samples is not None else 1
+    return max(1.0, pixels * max(1, samples) * ENGINE_COST_WEIGHTS.get(res.engine, 1.0))
+
+
+def allocate_threads(costs: Dict[str, float], budget: int, workers: int) -> Dict[str, int]:
+    """コア予算 budget を workers 個の同時プロセスで分け合うときの、レイヤーごとのスレッド数。
+    各レイヤーは「平均的なレイヤー (workers - 1) 個と同時に走る」とみなし、
+    コスト比でコアを割り当てる。軽いレイヤーは少なく、重いレイヤーは多く取る。
+    どの workers 個が同時に走っても合計が budget を超えないよう、
+    割り当ての大きい順 workers 個の合計で正規化する。"""
+    budget = max(1, int(budget))
+    workers = max(1, int(workers))
+    if not costs:
+        return {}
+    if workers == 1:
+        return {name: budget for name in costs}
+
+    mean = sum(costs.values()) / len(costs)
+    # 1 プロセスが予算を独占しない上限（他のワーカーにも最低 1 コアずつ残す）
+    cap = max(1, budget - (workers - 1))
+    raw = {}
+    for name, cost in costs.items():
+        share = cost / (cost + (workers - 1) * mean) if (cost + mean) > 0 else 1.0 / workers
+        raw[name] = min(cap, max(1, int(round(budget * share))))
+
+    # 同時に走りうる最悪の組（大きい順 workers 個）の合計を予算に収める
+    peak = sum(sorted(raw.values(), reverse=True)[:workers])
+    if peak <= budget:
+        return raw
+    out = {name: max(1, int(budget * n / peak)) for name, n in raw.items()}
+    order = sorted(out, key=out.get, reverse=True)
+    while sum(out[name] for name in order[:workers]) > budget and out[order[0]] > 1:
+        out[order[0]] -= 1
+        order.sort(key=out.get, reverse=True)
+    return out
+
+
+# ──────────────────────────────────────────────
+# ⑦ 出力パス命名
+# ──────────────────────────────────────────────
+FORMAT_EXTENSIONS = {
+    "PNG": ".png",
+    "OPEN_EXR": ".exr",
+    "OPEN_EXR_MULTILAYER": ".exr",
+    "JPEG": ".jpg",
+    "JPEG2000": ".jp2",
+    "TIFF": ".tif",
+    "TARGA": ".tga",
+    "TARGA_RAW": ".tga",
+    "IRIS": ".sgi",
+    "BMP": ".bmp",
+    "CINEON": ".cin",
+    "DPX": ".dpx",
+    "HDR": ".hdr",
+}
+
+
+def sanitize_name_for_path(name: str) -> str:
+    return re.sub(r'[^0-9A-Za-z_\-]', '_', name or "")
+
+
+def file_extension_for_format(file_format: str, fallback: str = "") -> str:
+    """image_settings.file_format に対応する拡張子。不明なら fallback（無ければ .exr）"""
+    ext = FORMAT_EXTENSIONS.get(file_format or "")
+    if not ext:
+        ext = fallback or ""
+        if ext and not ext.startswith("."):
+            ext = f".{ext}"
+    return ext or ".exr"
+
+
+def output_base_path(base_fp: str, blend_name: str, vl_name: str, pass_name: str, sep: str = os.sep) -> str:
+    """File Output ノードの base_path（<出力先>/<blend>/<VL>/<パス>/）"""
+    return os.path.join(base_fp,
+                        sanitize_name_for_path(blend_name),
+                        sanitize_name_for_path(vl_name),
+                        sanitize_name_for_path(pass_name)) + sep
+
+
+def output_slot_path(blend_name: str, vl_name: str, pass_name: str) -> str:
+    """File Output スロットのファイル名プレフィックス（<blend>_<VL>_<パス>_）"""
+    return (f"{sanitize_name_for_path(blend_name)}_"
+            f"{sanitize_name_for_path(vl_name)}_"
+            f"{sanitize_name_for_path(pass_name)}_")
+
+
+def output_frame_path(base_fp: str, blend_name: str, vl_name: str, pass_name: str,
+                      frame: int, ext: str, padding: int = 4) -> str:
+    """1 フレーム分の最終出力ファイルパス"""
+    base = output_base_path(base_fp, blend_name, vl_name, pass_name)
+    name = f"{output_slot_path(blend_name, vl_name, pass_name)}{int(frame):0{max(1, int(padding))}d}{ext}"
+    return os.path.join(base, name)
+
+
+def file_output_frame_path(base_path: str, slot_path: str, frame: int, ext: str, padding: int = 4) -> str:
+    """File Output ノードが書き出すファイル名を再現する。
+    スロットパスに '#' があればその桁数で置換、無ければ末尾に 4 桁のフレーム番号を付ける。"""
+    m = re.search(r"#+", slot_path or "")
+    if m:
+        width = len(m.group(0))
+        name = f"{slot_path[:m.start()]}{int(frame):0{width}d}{slot_path[m.end():]}"
+    else:
+        name = f"{slot_path or ''}{int(frame):0{max(1, int(padding))}d}"
+    return os.path.join(base_path, name + ext)
+
+
+INTERMEDIATE_DIR_NAME = "_vlm_intermediate"
+
+
+def intermediate_base_path(base_fp: str, blend_name: str, vl_name: str, pass_name: str, sep: str = os.sep) -> str:
+    """バックグラウンドエンコード用の中間ファイル置き場（<出力先>/<blend>/_vlm_intermediate/<VL>/<パス>/）"""
+    return os.path.join(base_fp,
+                        sanitize_name_for_path(blend_name),
+                        INTERMEDIATE_DIR_NAME,
+                        sanitize_name_for_path(vl_name),
+                        sanitize_name_for_path(pass_name)) + sep
+
+
+# ──────────────────────────────────────────────
+# ⑧ 設定マニフェスト（書き出し / 読み込み）
+#   bpy を通さずにワーカーやファームの計画側から読めるよう、
+#   フォールバック解決済みの値（resolved）とフレーム範囲も一緒に保存する。
+#   拡張子 .msgpack は msgpack があれば使い、無ければ JSON のみ。
+# ──────────────────────────────────────────────
+MANIFEST_FORMAT = "vlm-manifest"
+MANIFEST_VERSION = 1
+
+try:
+    import msgpack
+except ImportError:  # Blender 同梱の Python には無いことが多い
+    msgpack = None
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def _is_msgpack_path(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in {".msgpack", ".mpk"}
+
+
+def layer_settings_from_dict(data: dict) -> LayerSettings:
+    """マニフェストの settings を LayerSettings に戻す（知らないキーは無視）"""
+    known = LayerSettings.__dataclass_fields__
+    return LayerSettings(**{k: v for k, v in data.items() if k in known})
+
+
+def resolved_settings_from_dict(data: dict) -> ResolvedSettings:
+    known = ResolvedSettings.__dataclass_fields__
+    return ResolvedSettings(**{k: v for k, v in data.items() if k in known})
+
+
+def dump_manifest(manifest: dict, path: str) -> None:
+    if _is_msgpack_path(path):
+        if msgpack is None:
+            raise ManifestError("msgpack is not installed; use a .json path")
+        with open(path, "wb") as fh:
+            fh.write(msgpack.packb(manifest, use_bin_type=True))
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_manifest(path: str) -> dict:
+    if _is_msgpack_path(path):
+        if msgpack is None:
+            raise ManifestError("msgpack is not installed")
+        with open(path, "rb") as fh:
+            manifest = msgpack.unpackb(fh.read(), raw=False)
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        raise ManifestError(f"not a view layer manifest: {path}")
+    if int(manifest.get("version", 0)) > MANIFEST_VERSION:
+        raise ManifestError(f"manifest version {manifest.get('version')} is newer than supported ({MANIFEST_VERSION})")
+    return manifest
+
+
+def plan_jobs_from_manifest(manifest: dict, *, layers: Optional[List[str]] = None,
+                            animation: bool = True) -> List[RenderJob]:
+    """マニフェストの解決済みフレーム範囲からレンダージョブ一覧を作る（bpy 不要）"""
+    jobs = []
+    for entry in manifest.get("layers", []):
+        name = entry["name"]
+        if layers is not None and name not in layers:
+            continue
+        start, end, step = entry["frame_range"]
+        if not animation:
+            jobs.append(RenderJob(name, int(start)))
+            continue
+        jobs.extend(RenderJob(name, f) for f in iter_frames(start, end, step))
+    return jobs
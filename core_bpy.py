@@ -0,0 +1,177 @@
+# core_bpy.py
+#
+# core.py（bpy 非依存）と Blender データの間の薄いアダプタ
+# ------------------------------------------------------------
+
+import bpy
+
+from . import core
+
+
+def _id_name(idblock):
+    return idblock.name if idblock is not None else None
+
+
+def _read_prop_map(rs, prop_map):
+    return {rs_prop: getattr(rs, rs_prop) for rs_prop, _ in prop_map if hasattr(rs, rs_prop)}
+
+
+def layer_settings_from_view_layer(vl) -> core.LayerSettings:
+    """ViewLayer（vlm_render / vlm_world）を core.LayerSettings に写す"""
+    rs = getattr(vl, "vlm_render", None)
+    data = core.LayerSettings(name=vl.name)
+    if rs is None:
+        return data
+
+    data.engine_enable = bool(getattr(rs, "engine_enable", False))
+    data.engine = getattr(rs, "engine", core.DEFAULT_ENGINE)
+    data.samples_enable = bool(getattr(rs, "samples_enable", False))
+    data.samples = int(getattr(rs, "samples", 64))
+    data.use_denoise = bool(getattr(rs, "use_denoise", False))
+
+    data.light_paths_enable = bool(getattr(rs, "light_paths_enable", False))
+    data.light_paths = _read_prop_map(rs, core.LIGHT_PATH_PROP_MAP)
+    data.fast_gi_enable = bool(getattr(rs, "fast_gi_enable", False))
+    data.fast_gi = _read_prop_map(rs, core.FAST_GI_PROP_MAP)
+    data.cycles_perf_enable = bool(getattr(rs, "cycles_perf_enable", False))
+    data.cycles_perf = _read_prop_map(rs, core.CYCLES_PERF_PROP_MAP + core.RENDER_THREADS_PROP_MAP)
+    data.simplify_enable = bool(getattr(rs, "simplify_enable", False))
+    data.simplify = _read_prop_map(rs, core.SIMPLIFY_PROP_MAP + core.SIMPLIFY_CYCLES_PROP_MAP)
+    data.eevee_perf_enable = bool(getattr(rs, "eevee_perf_enable", False))
+    data.eevee_perf = _read_prop_map(rs, core.EEVEE_PERF_PROP_MAP)
+
+    data.camera_enable = bool(getattr(rs, "camera_enable", False))
+    data.camera = _id_name(getattr(rs, "camera", None))
+    data.world_enable = bool(getattr(rs, "world_enable", False))
+    data.world = _id_name(getattr(vl, "vlm_world", None))
+
+    data.format_enable = bool(getattr(rs, "format_enable", False))
+    data.resolution_x = int(rs.resolution_x)
+    data.resolution_y = int(rs.resolution_y)
+    data.resolution_percentage = int(rs.resolution_percentage)
+    data.aspect_x = float(rs.aspect_x)
+    data.aspect_y = float(rs.aspect_y)
+    data.frame_rate = float(rs.frame_rate)
+
+    data.frame_enable = bool(getattr(rs, "frame_enable", False))
+    data.frame_start = int(rs.frame_start)
+    data.frame_end = int(rs.frame_end)
+    data.frame_step = int(rs.frame_step)
+    return data
+
+
+def scene_settings_from_scene(scene) -> core.SceneSettings:
+    return core.SceneSettings(
+        force_samples_enable=bool(getattr(scene, "vlm_force_samples_enable", False)),
+        force_samples_cycles=int(getattr(scene, "vlm_force_samples_cycles", 16)),
+        force_samples_eevee=int(getattr(scene, "vlm_force_samples_eevee", 16)),
+        world=_id_name(scene.world),
+    )
+
+
+def top_view_layer(scene, fallback=None):
+    return scene.view_layers[0] if scene.view_layers else fallback
+
+
+# ──────────────────────────────────────────────
+# 解決結果のキャッシュ
+#   * (シーン名, VL名) ごとに LayerSettings / ResolvedSettings / フレーム範囲を保持
+#   * VLM_RenderSettings・vlm_world・強制サンプルの update と load/undo で invalidate
+#   * レイヤーの追加・削除・先頭の入れ替えと Scene.world の変更は O(1) のシグネチャで検出
+#     （参照のたびに全レイヤーを走査しない）
+#   * レイヤー・カメラ・ワールドの改名は msgbus で受けて捨てる
+#     （解決結果はカメラ / ワールドを名前で持つので、名前引きが外れないように）
+# ──────────────────────────────────────────────
+_cache = {}
+_signatures = {}
+
+
+def invalidate(scene=None):
+    """キャッシュを捨てる（scene 省略で全シーン）。
+    先頭レイヤーの変更は他レイヤーの解決結果にも効くので、シーン単位で捨てる。"""
+    if scene is None:
+        _cache.clear()
+        _signatures.clear()
+        return
+    for key in [k for k in _cache if k[0] == scene.name]:
+        del _cache[key]
+    _signatures.pop(scene.name, None)
+
+
+def _entry(scene, vl):
+    layers = scene.view_layers
+    sig = (len(layers), layers[0].name if layers else None, _id_name(scene.world))
+    if _signatures.get(scene.name) != sig:
+        invalidate(scene)
+        _signatures[scene.name] = sig
+    return _cache.setdefault((scene.name, vl.name), {})
+
+
+# msgbus の購読者（ファイル読み込みで購読が消えるので load_post で張り直す）
+_rename_owner = object()
+
+
+def _on_rename():
+    invalidate()
+
+
+def subscribe_renames():
+    bpy.msgbus.clear_by_owner(_rename_owner)
+    for id_type in (bpy.types.ViewLayer, bpy.types.Object, bpy.types.World):
+        bpy.msgbus.subscribe_rna(
+            key=(id_type, "name"),
+            owner=_rename_owner,
+            args=(),
+            notify=_on_rename,
+        )
+
+
+def unsubscribe_renames():
+    bpy.msgbus.clear_by_owner(_rename_owner)
+
+
+def cached_layer_settings(scene, vl) -> core.LayerSettings:
+    entry = _entry(scene, vl)
+    layer = entry.get("layer")
+    if layer is None:
+        layer = entry["layer"] = layer_settings_from_view_layer(vl)
+    return layer
+
+
+def _layer_and_top(scene, vl):
+    top_vl = top_view_layer(scene, vl)
+    layer = cached_layer_settings(scene, vl)
+    top = layer if top_vl == vl else cached_layer_settings(scene, top_vl)
+    return layer, top
+
+
+def resolve_view_layer(scene, vl) -> core.ResolvedSettings:
+    """Scene / ViewLayer から実効設定を解決する（キャッシュ済みならそれを返す。書き換え禁止）"""
+    entry = _entry(scene, vl)
+    res = entry.get("resolved")
+    if res is None:
+        layer, top = _layer_and_top(scene, vl)
+        res = entry["resolved"] = core.resolve_settings(layer, top, scene_settings_from_scene(scene))
+    return res
+
+
+def resolve_frame_range(scene, vl):
+    entry = _entry(scene, vl)
+    rng = entry.get("frame_range")
+    if rng is None:
+        rng = entry["frame_range"] = core.resolve_frame_range(*_layer_and_top(scene, vl))
+    return rng
+
+
+def camera_object(resolved: core.ResolvedSettings):
+    return bpy.data.objects.get(resolved.camera) if resolved.camera else None
+
+
+def world_datablock(resolved: core.ResolvedSettings):
+    return bpy.data.worlds.get(resolved.world) if resolved.world else None
+
+
+def allocate_layer_threads(scene, layers, budget, workers):
+    """レイヤー群の実効設定からコストを見積もり、core.allocate_threads で配分する"""
+    costs = {vl.name: core.estimate_layer_cost(resolve_view_layer(scene, vl)) for vl in layers}
+    return core.allocate_threads(costs, budget, workers)
@@ -0,0 +1,581 @@
+# deferred_output.py
+#
+# File Output（VLM 管理）の最終エンコードをバックグラウンドプロセスへ逃がす
+#   1) レンダー中は無圧縮／軽圧縮の EXR 中間ファイルを書く
+#   2) フレームごとに変換ジョブを積み、別プロセスの Blender が最終フォーマットへ変換
+#   3) 変換後に読み直して検証し、中間ファイルを削除
+#   4) （任意）Cycles のデノイズもレンダー後段へ分離し、
+#      ノイジーな Image ＋ Denoising Data を別プロセスの OIDN で処理する
+# ------------------------------------------------------------
+
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+
+import bpy
+from bpy.props import BoolProperty, EnumProperty, IntProperty
+
+from . import core
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deferred_output_worker.py")
+
+# 中間ファイル化しても意味が無い／変換できないフォーマット
+_NON_DEFERRABLE_FORMATS = {"OPEN_EXR_MULTILAYER"}
+
+INTERMEDIATE_CODECS = [
+    ('NONE', "無圧縮",       "最速。ディスク容量は大きい"),
+    ('RLE',  "RLE（軽量）",   "軽い可逆圧縮"),
+    ('ZIPS', "ZIPS（軽量）",  "1 行単位の ZIP。比較的軽い可逆圧縮"),
+]
+
+
+# ──────────────────────────────────────────────
+# ① 最終フォーマットの取得と中間フォーマットへの差し替え
+# ──────────────────────────────────────────────
+def _image_settings_dict(fmt):
+    return {
+        key: getattr(fmt, key)
+        for key in ("file_format", "color_mode", "color_depth", "compression", "exr_codec", "quality")
+        if hasattr(fmt, key)
+    }
+
+
+def _color_dict(scene):
+    return {
+        "display_device": scene.display_settings.display_device,
+        "view_transform": scene.view_settings.view_transform,
+        "look": scene.view_settings.look,
+        "exposure": scene.view_settings.exposure,
+        "gamma": scene.view_settings.gamma,
+        "sequencer_colorspace": scene.sequencer_colorspace_settings.name,
+    }
+
+
+def is_enabled(scene):
+    return bool(getattr(scene, "vlm_deferred_encode", False))
+
+
+def is_denoise_enabled(scene):
+    return bool(getattr(scene, "vlm_deferred_denoise", False))
+
+
+def _is_deferred(node):
+    return bool(node.get("vlm_final_base_path"))
+
+
+def _iter_managed_nodes(scene, vl_name=None):
+    if not scene.use_nodes or not scene.node_tree:
+        return []
+    return [
+        n for n in scene.node_tree.nodes
+        if n.type == 'OUTPUT_FILE' and n.get("vlm_managed")
+        and (vl_name is None or n.get("vl_name") == vl_name)
+    ]
+
+
+def _is_denoise_source(node, vl_name):
+    return node.get("vl_name") == vl_name and (node.get("pass_name") or "Image") == "Image"
+
+
+def prepare_intermediate_outputs(scene, view_layer=None):
+    """VLM 管理の File Output を中間ファイル出力に切り替える。
+    直前に _prepare_compositor_nodes / _update_dynamic_file_output_paths が
+    最終パス・最終フォーマットを設定している前提で、それを退避してから差し替える。
+    view_layer を渡すと、後段デノイズの対象ならその準備も行う。"""
+    denoise_vl = None
+    if view_layer is not None and prepare_deferred_denoise(scene, view_layer):
+        denoise_vl = view_layer.name
+    if not is_enabled(scene) and denoise_vl is None:
+        return 0
+
+    blend_name = pathlib.Path(bpy.data.filepath).stem or "Untitled"
+    base_fp = scene.render.filepath
+    codec = getattr(scene, "vlm_intermediate_codec", 'NONE')
+    switched = 0
+
+    if denoise_vl is not None:
+        # Image パスを中間化できない（マルチレイヤー EXR 等）ならインラインに戻す
+        sources = [n for n in _iter_managed_nodes(scene, denoise_vl) if _is_denoise_source(n, denoise_vl)]
+        if not sources or any(n.format.file_format in _NON_DEFERRABLE_FORMATS for n in sources):
+            cancel_deferred_denoise(scene, view_layer)
+            denoise_vl = None
+            if not is_enabled(scene):
+                return 0
+
+    for node in _iter_managed_nodes(scene):
+        if "vlm_denoise" in node:
+            del node["vlm_denoise"]
+        is_source = denoise_vl is not None and _is_denoise_source(node, denoise_vl)
+        if not is_enabled(scene) and not is_source:
+            continue
+
+        fmt = node.format
+        final = _image_settings_dict(fmt)
+        if final.get("file_format") in _NON_DEFERRABLE_FORMATS:
+            continue
+        if (not is_source and final.get("file_format") == 'OPEN_EXR'
+                and final.get("exr_codec") == codec):
+            # 既に中間と同じ設定（変換不要）
+            continue
+
+        vl_name = node.get("vl_name") or "ViewLayer"
+        pass_name = node.get("pass_name") or "Image"
+        final_ext = core.file_extension_for_format(final.get("file_format", ""),
+                                                   getattr(scene.render, "file_extension", "") or "")
+
+        node["vlm_final_base_path"] = node.base_path
+        node["vlm_final_ext"] = final_ext
+        node["vlm_final_format"] = json.dumps(final)
+
+        node.base_path = core.intermediate_base_path(base_fp, blend_name, vl_name, pass_name)
+        fmt.file_format = 'OPEN_EXR'
+        # 8bit 出力なら half で十分。float 出力は 32bit のまま保持
+        fmt.color_depth = '32' if final.get("color_depth") == '32' else '16'
+        if final.get("color_mode") in {'BW', 'RGB', 'RGBA'}:
+            fmt.color_mode = final["color_mode"]
+        fmt.exr_codec = codec
+        if is_source:
+            node["vlm_denoise"] = True
+        switched += 1
+
+    if denoise_vl is not None:
+        _ensure_denoise_aux_nodes(scene, denoise_vl, blend_name, base_fp, codec)
+    return switched
+
+
+def restore_final_outputs(scene):
+    """中間出力への差し替えを解除し、ノードを最終パス・最終フォーマットへ戻す"""
+    for node in _iter_managed_nodes(scene):
+        if not _is_deferred(node):
+            continue
+        node.base_path = node["vlm_final_base_path"]
+        try:
+            final = json.loads(node.get("vlm_final_format", "{}"))
+        except ValueError:
+            final = {}
+        fmt = node.format
+        if "file_format" in final:
+            fmt.file_format = final["file_format"]
+        for key in ("color_mode", "color_depth", "compression", "exr_codec", "quality"):
+            if key in final and hasattr(fmt, key):
+                try:
+                    setattr(fmt, key, final[key])
+                except Exception:
+                    pass
+        for key in ("vlm_final_base_path", "vlm_final_ext", "vlm_final_format", "vlm_denoise"):
+            if key in node:
+                del node[key]
+
+
+def final_output_candidates(node):
+    """_frame_output_exists 用：(ディレクトリ, 拡張子) の候補を返す。
+    中間ファイルが残っている＝レンダー済み（エンコード待ち）とみなす。"""
+    if not _is_deferred(node):
+        return []
+    return [
+        (bpy.path.abspath(node["vlm_final_base_path"]), node.get("vlm_final_ext", ".exr")),
+        (bpy.path.abspath(node.base_path), ".exr"),
+    ]
+
+
+# ──────────────────────────────────────────────
+# ①' 後段デノイズの準備
+# ──────────────────────────────────────────────
+DENOISE_AUX_PASSES = ("Denoising Normal", "Denoising Albedo")
+
+# バッチ中に書き換えた設定の退避先（finish_batch で戻す）
+#   {"use_denoising": bool, "store_passes": {vl_name: bool}}
+_denoise_state = {}
+_denoise_layers = set()
+
+
+def prepare_deferred_denoise(scene, vl):
+    """apply_render_override の後に呼ぶ：Cycles のデノイズが有効なら
+    インラインのデノイズを止め、Denoising Data パスを出力させる"""
+    cycles = getattr(scene, "cycles", None)
+    vl_cycles = getattr(vl, "cycles", None)
+    if (not is_denoise_enabled(scene) or scene.render.engine != 'CYCLES'
+            or cycles is None or vl_cycles is None or not cycles.use_denoising):
+        _denoise_layers.discard(vl.name)
+        return False
+
+    _denoise_state.setdefault("use_denoising", True)
+    store = _denoise_state.setdefault("store_passes", {})
+    store.setdefault(vl.name, bool(vl_cycles.denoising_store_passes))
+
+    cycles.use_denoising = False
+    vl_cycles.denoising_store_passes = True
+    _denoise_layers.add(vl.name)
+    return True
+
+
+def write_still_enabled(scene, vl_name):
+    """render.render(write_still=...) に渡す値。
+    後段デノイズ中のレイヤーはレンダー結果がデノイズ前なので、Output パスへの保存を省く
+    （デノイズされるのは VLM 管理の File Output の Image だけ）"""
+    return vl_name not in _denoise_layers
+
+
+def cancel_deferred_denoise(scene, vl):
+    """このVLは後段デノイズできない：インラインのデノイズに戻す"""
+    _denoise_layers.discard(vl.name)
+    cycles = getattr(scene, "cycles", None)
+    if cycles is not None:
+        cycles.use_denoising = True
+    store = _denoise_state.get("store_passes", {})
+    vl_cycles = getattr(vl, "cycles", None)
+    if vl.name in store and vl_cycles is not None:
+        vl_cycles.denoising_store_passes = store.pop(vl.name)
+
+
+def _iter_denoise_aux_nodes(scene, vl_name=None):
+    if not scene.node_tree:
+        return []
+    return [
+        n for n in scene.node_tree.nodes
+        if n.type == 'OUTPUT_FILE' and n.get("vlm_denoise_aux")
+        and (vl_name is None or n.get("vl_name") == vl_name)
+    ]
+
+
+def _ensure_denoise_aux_nodes(scene, vl_name, blend_name, base_fp, codec):
+    """Denoising Normal / Albedo を中間 EXR に書く一時 File Output を用意する"""
+    nt = scene.node_tree
+    rl = next((n for n in nt.nodes if n.type == 'R_LAYERS' and n.layer == vl_name), None)
+    if rl is None:
+        return
+    existing = {n.get("pass_name"): n for n in _iter_denoise_aux_nodes(scene, vl_name)}
+
+    for i, pass_name in enumerate(DENOISE_AUX_PASSES):
+        sock = rl.outputs.get(pass_name)
+        if sock is None or not sock.enabled:
+            continue
+        node = existing.get(pass_name)
+        if node is None:
+            node = nt.nodes.new("CompositorNodeOutputFile")
+            node.label = f"VLM Denoise {pass_name}"
+            node.location = (rl.location.x + 400, rl.location.y - 120 * (i + 1))
+            node["vlm_denoise_aux"] = True
+            node["vl_name"] = vl_name
+            node["pass_name"] = pass_name
+
+        node.base_path = core.intermediate_base_path(base_fp, blend_name, vl_name, pass_name)
+        node.file_slots[0].path = core.output_slot_path(blend_name, vl_name, pass_name)
+        fmt = node.format
+        fmt.file_format = 'OPEN_EXR'
+        fmt.color_mode = 'RGB'
+        fmt.color_depth = '16'
+        fmt.exr_codec = codec
+
+        inp = node.inputs[0]
+        if inp.is_linked and inp.links[0].from_socket != sock:
+            nt.links.remove(inp.links[0])
+        if not inp.is_linked:
+            nt.links.new(sock, inp)
+
+
+def restore_denoise_settings(scene):
+    """後段デノイズのために変えた設定を戻し、一時ノードを削除する"""
+    cycles = getattr(scene, "cycles", None)
+    if cycles is not None and "use_denoising" in _denoise_state:
+        cycles.use_denoising = _denoise_state["use_denoising"]
+    for vl_name, value in _denoise_state.get("store_passes", {}).items():
+        vl = scene.view_layers.get(vl_name)
+        if vl is not None and getattr(vl, "cycles", None) is not None:
+            vl.cycles.denoising_store_passes = value
+    _denoise_state.clear()
+    _denoise_layers.clear()
+
+    if scene.node_tree:
+        for node in _iter_denoise_aux_nodes(scene):
+            scene.node_tree.nodes.remove(node)
+
+
+# ──────────────────────────────────────────────
+# ② バックグラウンドプロセスプール
+# ──────────────────────────────────────────────
+class BackgroundJobPool:
+    """Blender のバックグラウンドプロセスでジョブを処理する簡易プール。
+    ジョブは溜まった分だけまとめて 1 プロセスに渡す（起動コストの平準化）。"""
+
+    def __init__(self, max_workers=2, max_batch=32, *, script=WORKER_SCRIPT, blend_path=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_batch = max(1, int(max_batch))
+        self.script = script
+        self.blend_path = blend_path   # 指定時はワーカーがこの .blend を開いてから処理する
+        self._pending = []
+        self._running = []   # (Popen, job_file, jobs)
+        self._next_id = 0
+        self._tmpdir = tempfile.mkdtemp(prefix="vlm_jobs_")
+        self.completed = 0
+        self.failed = []
+        self.results = {}    # ジョブ id → ワーカーの結果
+
+    @property
+    def busy(self):
+        return bool(self._pending or self._running)
+
+    def submit(self, job):
+        job = dict(job)
+        job["id"] = self._next_id
+        self._next_id += 1
+        self._pending.append(job)
+        self.poll()
+        return job["id"]
+
+    def submit_many(self, jobs):
+        """まとめて積んでから配分する（1 件ずつ submit すると最初のプロセスが 1 件だけになる）"""
+        ids = []
+        for job in jobs:
+            job = dict(job)
+            job["id"] = self._next_id
+            self._next_id += 1
+            self._pending.append(job)
+            ids.append(job["id"])
+        self.poll()
+        return ids
+
+    def _spawn(self, jobs):
+        # shutdown で一時フォルダを消した後に使い回されても書けるように
+        os.makedirs(self._tmpdir, exist_ok=True)
+        job_file = os.path.join(self._tmpdir, f"jobs_{jobs[0]['id']:08d}.json")
+        with open(job_file, "w", encoding="utf-8") as fh:
+            json.dump(jobs, fh)
+        # 変換は 1 スレッドで足りる。デノイズはジョブ指定のスレッド数を使う
+        threads = max(int(j.get("threads", 1)) for j in jobs)
+        cmd = [bpy.app.binary_path, "-b", "--factory-startup"]
+        if self.blend_path:
+            cmd.append(self.blend_path)
+        cmd += ["-t", str(threads), "--python", self.script, "--", job_file]
+        # stderr はパイプにすると読み手がいないまま詰まる（饒舌なワーカーが止まる）ので、
+        # ジョブごとのログファイルへ流し、失敗時にだけ末尾を読む
+        with open(job_file + ".log", "wb") as log:
+            proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log)
+        self._running.append((proc, job_file, jobs))
+
+    @staticmethod
+    def _log_tail(path, size=500):
+        try:
+            with open(path, "rb") as fh:
+                fh.seek(0, os.SEEK_END)
+                fh.seek(max(0, fh.tell() - size))
+                return fh.read().decode(errors="replace")
+        except OSError:
+            return ""
+
+    def _collect(self, proc, job_file, jobs):
+        result_file = job_file + ".result.json"
+        log_file = job_file + ".log"
+        try:
+            with open(result_file, "r", encoding="utf-8") as fh:
+                results = json.load(fh)
+        except (OSError, ValueError):
+            err = self._log_tail(log_file)
+            results = [{"id": j["id"], "ok": False, "error": f"worker exit {proc.returncode}: {err}"}
+                       for j in jobs]
+        for res in results:
+            self.results[res.get("id")] = res
+            if res.get("ok"):
+                self.completed += 1
+            else:
+                self.failed.append(res)
+                print(f"VLM: background job {res.get('id')} failed: {res.get('error')}")
+        for path in (job_file, result_file, log_file):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def poll(self):
+        """終了したプロセスを回収し、空きがあれば待機ジョブを投入する"""
+        still = []
+        for proc, job_file, jobs in self._running:
+            if proc.poll() is None:
+                still.append((proc, job_file, jobs))
+            else:
+                self._collect(proc, job_file, jobs)
+        self._running = still
+
+        while self._pending and len(self._running) < self.max_workers:
+            # 空きワーカーで均等に分ける（最大 max_batch 件）
+            free = self.max_workers - len(self._running)
+            n = min(self.max_batch, max(1, -(-len(self._pending) // free)))
+            batch, self._pending = self._pending[:n], self._pending[n:]
+            self._spawn(batch)
+        return self.busy
+
+    def wait(self, timeout=None):
+        import time
+        t0 = time.monotonic()
+        while self.poll():
+            if timeout is not None and time.monotonic() - t0 > timeout:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def shutdown(self, *, kill=False):
+        """ワーカーの終了を待って（kill=True なら止めて）、一時フォルダを消す"""
+        if kill:
+            for proc, _, _ in self._running:
+                try:
+                    proc.kill()
+                    proc.wait(timeout=5)
+                except Exception:
+                    pass
+            self._running.clear()
+            self._pending.clear()
+        else:
+            self.wait()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+_pool = None
+
+
+def get_pool(scene=None):
+    global _pool
+    workers = int(getattr(scene, "vlm_encode_workers", 2)) if scene is not None else 2
+    if _pool is None:
+        _pool = BackgroundJobPool(max_workers=workers)
+    else:
+        _pool.max_workers = max(1, workers)
+    return _pool
+
+
+def _poll_timer():
+    if _pool is None:
+        return None
+    if _pool.poll():
+        return 0.5
+    print(f"VLM: background encode finished ({_pool.completed} ok / {len(_pool.failed)} failed)")
+    # 空になったら一時フォルダを消す（次の投入で作り直す）
+    _pool.shutdown()
+    return None
+
+
+def _ensure_poll_timer():
+    if not bpy.app.timers.is_registered(_poll_timer):
+        bpy.app.timers.register(_poll_timer, first_interval=0.5, persistent=True)
+
+
+# ──────────────────────────────────────────────
+# ③ レンダーループから呼ぶ入口
+# ──────────────────────────────────────────────
+def _find_frame_file(base_path, slot_path, frame, ext):
+    path = core.file_output_frame_path(bpy.path.abspath(base_path), slot_path, frame, ext)
+    return path if os.path.isfile(path) else None
+
+
+def enqueue_frame(scene, vl_name, frame):
+    """レンダー直後に呼ぶ：このVL・フレームの中間ファイルを変換／デノイズジョブとして投入"""
+    if not is_enabled(scene) and vl_name not in _denoise_layers:
+        return 0
+    pool = get_pool(scene)
+    color = _color_dict(scene)
+    submitted = 0
+
+    aux = {}
+    if vl_name in _denoise_layers:
+        for node in _iter_denoise_aux_nodes(scene, vl_name):
+            aux[node.get("pass_name")] = _find_frame_file(node.base_path, node.file_slots[0].path, frame, ".exr")
+
+    for node in _iter_managed_nodes(scene, vl_name):
+        if not _is_deferred(node):
+            continue
+        try:
+            final = json.loads(node.get("vlm_final_format", "{}"))
+        except ValueError:
+            continue
+        final_base = bpy.path.abspath(node["vlm_final_base_path"])
+        final_ext = node.get("vlm_final_ext", ".exr")
+        denoise_slot = int(node.get("vlm_slot_index", 0)) if node.get("vlm_denoise") else -1
+
+        for i, slot in enumerate(node.file_slots):
+            if i < len(node.inputs) and not node.inputs[i].is_linked:
+                continue
+            src = _find_frame_file(node.base_path, slot.path, frame, ".exr")
+            if not src:
+                continue
+            job = {
+                "kind": "transcode",
+                "src": src,
+                "dst": core.file_output_frame_path(final_base, slot.path, frame, final_ext),
+                "image_settings": final,
+                "color": color,
+            }
+            if i == denoise_slot:
+                job.update({
+                    "kind": "denoise",
+                    "albedo": aux.get("Denoising Albedo"),
+                    "normal": aux.get("Denoising Normal"),
+                    "threads": int(getattr(scene, "vlm_denoise_threads", 4)),
+                })
+            pool.submit(job)
+            submitted += 1
+
+    if submitted:
+        _ensure_poll_timer()
+    return submitted
+
+
+def finish_batch(scene, *, wait=False):
+    """バッチ終了時：ノードを最終出力設定に戻す。wait=True なら変換完了まで待つ"""
+    restore_final_outputs(scene)
+    restore_denoise_settings(scene)
+    if _pool is None:
+        return True
+    if wait:
+        return _pool.wait()
+    _ensure_poll_timer()
+    return not _pool.busy
+
+
+# ──────────────────────────────────────────────
+# register / unregister
+# ──────────────────────────────────────────────
+def register():
+    bpy.types.Scene.vlm_deferred_encode = BoolProperty(
+        name="Background Encode",
+        description="レンダー中は中間 EXR を書き、最終フォーマットへの変換は別プロセスで行う",
+        default=False,
+    )
+    bpy.types.Scene.vlm_intermediate_codec = EnumProperty(
+        name="Intermediate Codec",
+        description="中間 EXR の圧縮方式",
+        items=INTERMEDIATE_CODECS,
+        default='NONE',
+    )
+    bpy.types.Scene.vlm_encode_workers = IntProperty(
+        name="Encode Workers",
+        description="同時に動かす変換プロセス数",
+        default=2, min=1, max=32,
+    )
+    bpy.types.Scene.vlm_deferred_denoise = BoolProperty(
+        name="Background Denoise",
+        description="Cycles のデノイズをレンダー後に別プロセス（OpenImageDenoise）で行い、次フレームのレンダーと並行させる。"
+                    "対象は VLM 管理の File Output の画像だけで、レンダー出力（Output パス）への保存は行わない",
+        default=False,
+    )
+    bpy.types.Scene.vlm_denoise_threads = IntProperty(
+        name="Denoise Threads",
+        description="デノイズ用プロセス 1 つあたりのスレッド数",
+        default=4, min=1, max=256,
+    )
+
+
+def unregister():
+    global _pool
+    if bpy.app.timers.is_registered(_poll_timer):
+        bpy.app.timers.unregister(_poll_timer)
+    if _pool is not None:
+        _pool.shutdown(kill=True)
+        _pool = None
+    _denoise_state.clear()
+    _denoise_layers.clear()
+    for nm in ("vlm_deferred_encode", "vlm_intermediate_codec", "vlm_encode_workers",
+               "vlm_deferred_denoise", "vlm_denoise_threads"):
+        if hasattr(bpy.types.Scene, nm):
+            delattr(bpy.types.Scene, nm)
@@ -0,0 +1,163 @@
+# deferred_output_worker.py
+#
+# バックグラウンド Blender プロセス側で実行されるワーカースクリプト。
+#   blender -b --factory-startup -t <threads> --python deferred_output_worker.py -- <jobs.json>
+#
+# アドオン本体（相対 import）には依存しない。ジョブ JSON を読み、
+# 中間ファイルを最終フォーマットへ変換（必要ならデノイズ）→ 検証 → 中間ファイル削除を行い、
+# 結果を <jobs.json>.result.json に書き出す。
+# ------------------------------------------------------------
+
+import json
+import os
+import sys
+import traceback
+
+import bpy
+
+
+def _set_if_present(owner, attr, value):
+    if value is None or not hasattr(owner, attr):
+        return
+    try:
+        setattr(owner, attr, value)
+    except Exception:
+        pass
+
+
+def _configure_scene(scene, image_settings, color):
+    """最終フォーマット（image_settings）とカラーマネジメントをワーカーのシーンへ写す"""
+    ims = scene.render.image_settings
+    # file_format を先に設定しないと color_depth などの選択肢が合わない
+    _set_if_present(ims, "file_format", image_settings.get("file_format"))
+    for key in ("color_mode", "color_depth", "compression", "exr_codec", "quality"):
+        _set_if_present(ims, key, image_settings.get(key))
+
+    color = color or {}
+    _set_if_present(scene.display_settings, "display_device", color.get("display_device"))
+    _set_if_present(scene.view_settings, "view_transform", color.get("view_transform"))
+    _set_if_present(scene.view_settings, "look", color.get("look"))
+    _set_if_present(scene.view_settings, "exposure", color.get("exposure"))
+    _set_if_present(scene.view_settings, "gamma", color.get("gamma"))
+    _set_if_present(scene.sequencer_colorspace_settings, "name", color.get("sequencer_colorspace"))
+
+
+def _verify(path, size):
+    """書き出したファイルを読み直し、解像度が一致するか確認"""
+    if not os.path.isfile(path) or os.path.getsize(path) <= 0:
+        return False
+    img = bpy.data.images.load(path, check_existing=False)
+    try:
+        return tuple(img.size) == tuple(size)
+    finally:
+        bpy.data.images.remove(img)
+
+
+def transcode(scene, job):
+    """1 ジョブ分：中間ファイル → 最終フォーマット"""
+    src, dst = job["src"], job["dst"]
+    _configure_scene(scene, job.get("image_settings", {}), job.get("color"))
+
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    img = bpy.data.images.load(src, check_existing=False)
+    try:
+        size = tuple(img.size)
+        img.save_render(dst, scene=scene)
+    finally:
+        bpy.data.images.remove(img)
+
+    if not _verify(dst, size):
+        raise RuntimeError(f"verification failed: {dst}")
+    if job.get("delete_src", True):
+        os.remove(src)
+    return dst
+
+
+def _remove_files(*paths):
+    for path in paths:
+        if path and os.path.isfile(path):
+            os.remove(path)
+
+
+def denoise(scene, job):
+    """1 ジョブ分：ノイジーな Image ＋ Denoising Albedo/Normal → Denoise ノード → 最終フォーマット。
+    Render Layers ノードを含まないツリーなのでシーン自体はレンダーされず、合成のみ行われる。"""
+    src, dst = job["src"], job["dst"]
+    albedo, normal = job.get("albedo"), job.get("normal")
+
+    images = []
+    try:
+        scene.use_nodes = True
+        nt = scene.node_tree
+        nt.nodes.clear()
+
+        dn = nt.nodes.new("CompositorNodeDenoise")
+        _set_if_present(dn, "use_hdr", True)
+        _set_if_present(dn, "prefilter", job.get("prefilter", 'ACCURATE'))
+
+        size = None
+        for path, socket in ((src, "Image"), (albedo, "Albedo"), (normal, "Normal")):
+            if not path:
+                continue
+            img = bpy.data.images.load(path, check_existing=False)
+            images.append(img)
+            if size is None:
+                size = tuple(img.size)
+            node = nt.nodes.new("CompositorNodeImage")
+            node.image = img
+            nt.links.new(node.outputs["Image"], dn.inputs[socket])
+
+        comp = nt.nodes.new("CompositorNodeComposite")
+        nt.links.new(dn.outputs["Image"], comp.inputs["Image"])
+
+        r = scene.render
+        r.resolution_x, r.resolution_y = size
+        r.resolution_percentage = 100
+        r.pixel_aspect_x = r.pixel_aspect_y = 1.0
+        r.use_compositing = True
+        r.use_sequencer = False
+        r.use_file_extension = False
+        _configure_scene(scene, job.get("image_settings", {}), job.get("color"))
+
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        r.filepath = dst
+        bpy.ops.render.render(write_still=True)
+    finally:
+        for img in images:
+            bpy.data.images.remove(img)
+
+    if not _verify(dst, size):
+        raise RuntimeError(f"verification failed: {dst}")
+    if job.get("delete_src", True):
+        _remove_files(src, albedo, normal)
+    return dst
+
+
+HANDLERS = {
+    "transcode": transcode,
+    "denoise": denoise,
+}
+
+
+def main(argv):
+    job_file = argv[0]
+    with open(job_file, "r", encoding="utf-8") as fh:
+        jobs = json.load(fh)
+
+    scene = bpy.context.scene
+    results = []
+    for job in jobs:
+        kind = job.get("kind", "transcode")
+        try:
+            out = HANDLERS[kind](scene, job)
+            results.append({"id": job.get("id"), "ok": True, "output": out})
+        except Exception as e:
+            results.append({"id": job.get("id"), "ok": False, "error": f"{e}",
+                            "trace": traceback.format_exc()})
+
+    with open(job_file + ".result.json", "w", encoding="utf-8") as fh:
+        json.dump(results, fh)
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,203 @@
+# footprint.py
+#
+# ビューレイヤーごとのメモリフットプリント（頂点・面・インスタンス数・テクスチャ容量）の概算
+#   - vl.objects から foreach_get でまとめて取得し、numpy で集計
+#   - 細分化モディファイアはレンダーレベル（Simplify の上限込み）で面数を 4^n 倍
+#   - テクスチャは image_buffers.images_for_view_layer で到達できる画像から算出
+#     （未読み込みの画像はサイズ取得で読み込みが走るので、枚数だけ数える）
+#   - 結果はレイヤーごとにキャッシュし、depsgraph 更新で無効化（パネル描画を軽く保つ）
+# ------------------------------------------------------------
+
+from dataclasses import dataclass
+
+import numpy as np
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import image_buffers
+
+# 形状・参照関係が変わりうる ID 種別（これらが更新されたらキャッシュを捨てる）
+_INVALIDATING_TYPES = ('MESH', 'COLLECTION', 'IMAGE', 'MATERIAL', 'PARTICLE', 'NODETREE', 'CURVE')
+
+
+@dataclass
+class Footprint:
+    vertices: int = 0
+    faces: int = 0
+    instances: int = 0
+    texture_bytes: int = 0
+    textures_unloaded: int = 0
+    object_count: int = 0    # キャッシュ検証用（コレクション除外の切替で変わる）
+
+
+# (シーン名, VL名) → Footprint
+_cache = {}
+
+
+def _hidden_by_collection(vl):
+    """レンダー非表示のコレクション（Collection.hide_render）配下のオブジェクト名"""
+    hidden = set()
+
+    def _walk(lc):
+        if lc.exclude:
+            return
+        if lc.collection.hide_render:
+            hidden.update(ob.name for ob in lc.collection.all_objects)
+            return
+        for child in lc.children:
+            _walk(child)
+
+    _walk(vl.layer_collection)
+    return hidden
+
+
+def _subdivision_level(ob, scene):
+    r = scene.render
+    level = 0
+    for mod in ob.modifiers:
+        if mod.type in {'SUBSURF', 'MULTIRES'} and mod.show_render:
+            level += int(getattr(mod, "render_levels", 0))
+    if r.use_simplify:
+        level = min(level, int(r.simplify_subdivision_render))
+    return level
+
+
+def estimate_view_layer(scene, vl):
+    objects = vl.objects
+    n = len(objects)
+    fp = Footprint(object_count=n)
+    if n == 0:
+        return fp
+
+    hide_render = np.empty(n, dtype=bool)
+    objects.foreach_get("hide_render", hide_render)
+    hidden = _hidden_by_collection(vl)
+
+    mesh_index = {}
+    mesh_verts, mesh_faces = [], []
+    obj_mesh, obj_level = [], []
+    instances = 0
+
+    for i, ob in enumerate(objects):
+        if hide_render[i] or ob.name in hidden:
+            continue
+        if ob.type == 'MESH':
+            me = ob.data
+            idx = mesh_index.get(me.name)
+            if idx is None:
+                idx = mesh_index[me.name] = len(mesh_verts)
+                mesh_verts.append(len(me.vertices))
+                mesh_faces.append(len(me.polygons))
+            obj_mesh.append(idx)
+            obj_level.append(_subdivision_level(ob, scene))
+        if ob.instance_type == 'COLLECTION' and ob.instance_collection is not None:
+            instances += len(ob.instance_collection.all_objects)
+        for psys in getattr(ob, "particle_systems", []):
+            st = psys.settings
+            if st.render_type in {'OBJECT', 'COLLECTION'}:
+                per_parent = int(st.rendered_child_count) if st.child_type != 'NONE' else 1
+                instances += int(st.count) * max(1, per_parent)
+
+    if obj_mesh:
+        idx = np.asarray(obj_mesh, dtype=np.int64)
+        factor = np.power(4.0, np.asarray(obj_level, dtype=np.float64))
+        fp.vertices = int((np.asarray(mesh_verts, dtype=np.float64)[idx] * factor).sum())
+        fp.faces = int((np.asarray(mesh_faces, dtype=np.float64)[idx] * factor).sum())
+    fp.instances = instances
+
+    for img in image_buffers.images_for_view_layer(scene, vl):
+        if img.has_data:
+            fp.texture_bytes += image_buffers._image_bytes(img)
+        else:
+            fp.textures_unloaded += 1
+    return fp
+
+
+def get_footprint(scene, vl):
+    """キャッシュ付きの見積もり。除外切替でオブジェクト数が変わっていれば取り直す"""
+    key = (scene.name, vl.name)
+    fp = _cache.get(key)
+    if fp is None or fp.object_count != len(vl.objects):
+        fp = _cache[key] = estimate_view_layer(scene, vl)
+    return fp
+
+
+def invalidate(scene=None):
+    if scene is None:
+        _cache.clear()
+        return
+    for key in [k for k in _cache if k[0] == scene.name]:
+        del _cache[key]
+
+
+@persistent
+def _depsgraph_handler(scene, depsgraph=None):
+    if depsgraph is None:
+        return
+    if any(depsgraph.id_type_updated(t) for t in _INVALIDATING_TYPES):
+        invalidate(scene)
+        return
+    for upd in depsgraph.updates:
+        if upd.is_updated_geometry:
+            invalidate(scene)
+            return
+
+
+@persistent
+def _load_post(_dummy):
+    invalidate()
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+
+
+def format_count(n):
+    if n >= 1_000_000:
+        return f"{n / 1_000_000:.1f}M"
+    if n >= 1_000:
+        return f"{n / 1_000:.1f}k"
+    return str(n)
+
+
+class VLM_OT_refresh_footprint(bpy.types.Operator):
+    bl_idname = "vlm.refresh_footprint"
+    bl_label = "メモリ見積もりを更新"
+    bl_options = {'INTERNAL'}
+
+    def execute(self, context):
+        invalidate(context.scene)
+        for area in context.screen.areas:
+            area.tag_redraw()
+        return {'FINISHED'}
+
+
+classes = (
+    VLM_OT_refresh_footprint,
+)
+
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    if _depsgraph_handler not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_depsgraph_handler)
+    if _load_post not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_load_post)
+
+
+def unregister():
+    if _depsgraph_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_handler)
+    if _load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_load_post)
+    _cache.clear()
+    for c in reversed(classes):
+        try:
+            bpy.utils.unregister_class(c)
+        except RuntimeError:
+            pass
@@ -0,0 +1,320 @@
+# frustum_cull.py
+#
+# カメラの視錐台に一度も入らないコレクションを、レンダー中だけ一時的に除外する
+#   - 各ビューレイヤーの実効カメラ（rs.camera / 先頭レイヤーへのフォールバック）を使う
+#   - フレーム範囲（_resolve_frame_range）から数フレームを抜き出して判定
+#   - オブジェクトのワールド空間バウンディングボックスを numpy でまとめて平面判定
+#   - 影・反射のために視錐台をマージン分だけ外側へ広げる
+#   - ライト・カメラ・インスタンスを含むコレクションや「カリングしない」指定のコレクションは対象外
+#   - 判定結果は (カメラ, フレーム範囲, マージン, サンプル数, 対象コレクション) ごとに覚えておき、
+#     オブジェクトの移動・変形があるまで使い回す（フレームを回しての判定はレイヤーごとに 1 回）
+# ------------------------------------------------------------
+
+import numpy as np
+
+import bpy
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, FloatProperty, IntProperty
+
+from . import core, core_bpy, visibility_index
+
+# コレクションに含まれていたらカリングしない（画面外でも結果に影響する）オブジェクト種別
+_KEEP_TYPES = {'LIGHT', 'LIGHT_PROBE', 'CAMERA', 'SPEAKER'}
+
+# レンダー中に除外した LayerCollection（VL名 → コレクション名リスト）
+_culled = {}
+
+# (シーン名, VL名) → (判定条件, 映らないコレクション名リスト)
+_unseen_cache = {}
+# 判定中の frame_set による更新で _unseen_cache を捨てないためのフラグ
+_sampling = False
+
+
+# ──────────────────────────────────────────────
+# ① 視錐台
+# ──────────────────────────────────────────────
+def frustum_planes(cam_obj, depsgraph, res):
+    """カメラの 6 平面 (6, 4) を返す。ax + by + cz + d >= 0 が内側（法線は正規化済み）"""
+    proj = cam_obj.calc_matrix_camera(
+        depsgraph,
+        x=res.resolution_x, y=res.resolution_y,
+        scale_x=res.pixel_aspect_x, scale_y=res.pixel_aspect_y,
+    )
+    m = np.array(proj @ cam_obj.matrix_world.inverted(), dtype=np.float64)
+    r0, r1, r2, r3 = m
+    planes = np.stack([r3 + r0, r3 - r0, r3 + r1, r3 - r1, r3 + r2, r3 - r2])
+    norms = np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+    return planes / np.maximum(norms, 1e-12)
+
+
+def _world_corners(objects):
+    """オブジェクト群のワールド空間 bound_box (N, 8, 4)（同次座標）"""
+    if not objects:
+        return np.empty((0, 8, 4))
+    local = np.array([[tuple(c) for c in ob.bound_box] for ob in objects], dtype=np.float64)
+    local = np.concatenate([local, np.ones(local.shape[:2] + (1,))], axis=2)
+    mats = np.array([ob.matrix_world for ob in objects], dtype=np.float64)
+    return np.einsum('nij,nkj->nki', mats, local)
+
+
+def visible_mask(objects, planes, margin):
+    """各オブジェクトが（マージン込みの）視錐台と交差するか。
+    8 頂点すべてがある 1 平面の外側にあるものだけを『見えない』とする保守的な判定。"""
+    corners = _world_corners(objects)
+    if corners.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    dist = corners @ planes.T                      # (N, 8, 6)
+    outside = np.all(dist < -margin, axis=1)       # (N, 6)
+    return ~np.any(outside, axis=1)
+
+
+# ──────────────────────────────────────────────
+# ② コレクション判定
+# ──────────────────────────────────────────────
+def _is_cullable(col):
+    if getattr(col, "vlm_never_cull", False):
+        return False
+    for ob in col.all_objects:
+        if ob.type in _KEEP_TYPES or ob.instance_collection is not None:
+            return False
+    return True
+
+
+def _sample_frames(start, end, step, max_samples):
+    frames = list(core.iter_frames(start, end, step))
+    if len(frames) <= max_samples:
+        return frames
+    stride = len(frames) / float(max_samples)
+    picked = [frames[int(i * stride)] for i in range(max_samples)]
+    if picked[-1] != frames[-1]:
+        picked.append(frames[-1])
+    return picked
+
+
+def find_unseen_collections(scene, vl, *, margin=None, max_samples=None):
+    """このVLのカメラにフレーム範囲中一度も映らないコレクション名のリスト（上位優先）"""
+    res = core_bpy.resolve_view_layer(scene, vl)
+    cam = core_bpy.camera_object(res) or scene.camera
+    if cam is None or cam.type != 'CAMERA':
+        return []
+    margin = float(getattr(scene, "vlm_cull_margin", 2.0) if margin is None else margin)
+    max_samples = int(getattr(scene, "vlm_cull_frame_samples", 8) if max_samples is None else max_samples)
+
+    # 判定対象：除外されていないトップダウンの LayerCollection（祖先コレクション名も 1 回の走査で集める）
+    candidates = []
+    ancestors = {}
+
+    def _walk(lc, trail):
+        for child in lc.children:
+            if child.exclude:
+                continue
+            candidates.append(child)
+            ancestors[child.collection.name] = trail
+            _walk(child, trail + (child.collection.name,))
+
+    _walk(vl.layer_collection, ())
+    cols = [lc.collection for lc in candidates if _is_cullable(lc.collection)]
+    if not cols:
+        return []
+
+    start, end, step = core_bpy.resolve_frame_range(scene, vl)
+    key = (cam.name, res.resolution_x, res.resolution_y, res.pixel_aspect_x, res.pixel_aspect_y,
+           start, end, step, margin, max_samples, tuple(col.name for col in cols))
+    cached = _unseen_cache.get((scene.name, vl.name))
+    if cached is not None and cached[0] == key:
+        return list(cached[1])
+
+    objects = sorted({ob for col in cols for ob in col.all_objects}, key=lambda o: o.name)
+    index = {ob.name: i for i, ob in enumerate(objects)}
+    seen = _sample_visibility(scene, cam, res, objects, margin,
+                              _sample_frames(start, end, step, max_samples))
+
+    unseen = []
+    culled_names = set()
+    for col in cols:
+        # 親が既に除外対象なら子は見ない
+        if any(p in culled_names for p in ancestors.get(col.name, ())):
+            continue
+        idx = [index[ob.name] for ob in col.all_objects if ob.name in index]
+        if idx and not seen[idx].any():
+            unseen.append(col.name)
+            culled_names.add(col.name)
+    _unseen_cache[(scene.name, vl.name)] = (key, unseen)
+    return list(unseen)
+
+
+def _sample_visibility(scene, cam, res, objects, margin, frames):
+    """サンプルフレームのどこかで視錐台に入るオブジェクトのマスク（今のフレームは frame_set しない）"""
+    global _sampling
+    seen = np.zeros(len(objects), dtype=bool)
+    orig_frame = scene.frame_current
+    _sampling = True
+    try:
+        for f in frames:
+            if f != scene.frame_current:
+                scene.frame_set(f)
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            planes = frustum_planes(cam, depsgraph, res)
+            seen |= visible_mask(objects, planes, margin)
+            if seen.all():
+                break
+    finally:
+        if scene.frame_current != orig_frame:
+            scene.frame_set(orig_frame)
+        _sampling = False
+    return seen
+
+
+def invalidate(scene=None):
+    """判定結果を捨てる（scene 省略で全シーン）"""
+    if scene is None:
+        _unseen_cache.clear()
+        return
+    for key in [k for k in _unseen_cache if k[0] == scene.name]:
+        del _unseen_cache[key]
+
+
+@persistent
+def _depsgraph_handler(scene, depsgraph=None):
+    # 判定自身の frame_set 以外で、オブジェクトが動いた・変形した、カメラのレンズが変わったら捨てる
+    if depsgraph is None or _sampling or not _unseen_cache:
+        return
+    if depsgraph.id_type_updated('CAMERA'):
+        invalidate(scene)
+        return
+    for upd in depsgraph.updates:
+        if isinstance(upd.id, bpy.types.Object) and (upd.is_updated_transform or upd.is_updated_geometry):
+            invalidate(scene)
+            return
+
+
+@persistent
+def _reset(_dummy=None):
+    invalidate()
+
+
+# ──────────────────────────────────────────────
+# ③ 一時除外と復元
+# ──────────────────────────────────────────────
+def _find_layer_collection(lc, name):
+    if lc.collection.name == name:
+        return lc
+    for child in lc.children:
+        found = _find_layer_collection(child, name)
+        if found is not None:
+            return found
+    return None
+
+
+def cull_view_layer(scene, vl):
+    """有効ならこのVLで映らないコレクションを除外し、除外した名前を返す"""
+    if not getattr(scene, "vlm_frustum_cull_enable", False):
+        return []
+    names = find_unseen_collections(scene, vl)
+    done = []
+    for name in names:
+        lc = _find_layer_collection(vl.layer_collection, name)
+        if lc is not None and not lc.exclude:
+            lc.exclude = True
+            done.append(name)
+    if done:
+        _culled.setdefault(vl.name, []).extend(done)
+        visibility_index.invalidate(scene)
+        print(f"VLM: frustum cull [{vl.name}] excluded {len(done)} collections: {', '.join(done)}")
+    return done
+
+
+def restore_view_layer(scene, vl_name=None):
+    """cull_view_layer で除外したコレクションを戻す（vl_name 省略で全VL）"""
+    names = [vl_name] if vl_name else list(_culled.keys())
+    restored = False
+    for name in names:
+        vl = scene.view_layers.get(name)
+        for col_name in _culled.pop(name, []):
+            lc = _find_layer_collection(vl.layer_collection, col_name) if vl else None
+            if lc is not None:
+                lc.exclude = False
+                restored = True
+    if restored:
+        visibility_index.invalidate(scene)
+
+
+# ──────────────────────────────────────────────
+# ④ 解析オペレーター（除外はせず結果だけ表示）
+# ──────────────────────────────────────────────
+class VLM_OT_analyze_frustum_culling(bpy.types.Operator):
+    bl_idname = "vlm.analyze_frustum_culling"
+    bl_label = "画面外コレクションを解析"
+    bl_description = "各ビューレイヤーのカメラに一度も映らないコレクションを調べる（除外はしない）"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        sc = context.scene
+        lines = []
+        for vl in sc.view_layers:
+            names = find_unseen_collections(sc, vl)
+            if names:
+                lines.append(f"{vl.name}: {', '.join(names)}")
+        if not lines:
+            self.report({'INFO'}, "画面外のコレクションはありません")
+        else:
+            self.report({'INFO'}, " / ".join(lines))
+        return {'FINISHED'}
+
+
+# ──────────────────────────────────────────────
+# register / unregister
+# ──────────────────────────────────────────────
+classes = (
+    VLM_OT_analyze_frustum_culling,
+)
+
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    if _depsgraph_handler not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_depsgraph_handler)
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset not in h:
+            h.append(_reset)
+    bpy.types.Scene.vlm_frustum_cull_enable = BoolProperty(
+        name="Frustum Culling",
+        description="レンダー中、カメラに一度も映らないコレクションを一時的に除外する",
+        default=False,
+    )
+    bpy.types.Scene.vlm_cull_margin = FloatProperty(
+        name="Cull Margin",
+        description="影・反射のために視錐台を外側へ広げる距離",
+        default=2.0, min=0.0, subtype='DISTANCE',
+    )
+    bpy.types.Scene.vlm_cull_frame_samples = IntProperty(
+        name="Frame Samples",
+        description="フレーム範囲から判定に使うフレーム数（多いほど正確・遅い）",
+        default=8, min=1, max=1000,
+    )
+    bpy.types.Collection.vlm_never_cull = BoolProperty(
+        name="Never Cull",
+        description="画面外でも除外しない（鏡面に映る環境など）",
+        default=False,
+    )
+
+
+def unregister():
+    if _depsgraph_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_handler)
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset in h:
+            h.remove(_reset)
+    _culled.clear()
+    _unseen_cache.clear()
+    for nm in ("vlm_frustum_cull_enable", "vlm_cull_margin", "vlm_cull_frame_samples"):
+        if hasattr(bpy.types.Scene, nm):
+            delattr(bpy.types.Scene, nm)
+    if hasattr(bpy.types.Collection, "vlm_never_cull"):
+        del bpy.types.Collection.vlm_never_cull
+    for c in reversed(classes):
+        try:
+            bpy.utils.unregister_class(c)
+        except RuntimeError:
+            pass
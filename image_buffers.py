@@ -0,0 +1,110 @@
+# image_buffers.py
+#
+# ビューレイヤー切替時に、次のレイヤーで参照されない画像のピクセルバッファを解放する
+#   - 可視オブジェクトのマテリアル（ノードグループ込み）・ライト・モディファイア、
+#     World、コンポジターから到達できる画像を「必要」とみなす
+#   - それ以外で読み込み済みの画像は buffers_free()（データブロック自体は残る）
+#   - 20 レイヤー規模のバッチでテクスチャが積み上がらないようにする
+# ------------------------------------------------------------
+
+import bpy
+from bpy.props import BoolProperty
+
+from . import visibility_index
+from .material_override import iter_tree_nodes
+
+# 解放してはいけない画像種別（レンダー結果・ビューアー）
+_KEEP_IMAGE_TYPES = {'RENDER_RESULT', 'COMPOSITING'}
+
+# 直近に解放処理をした (シーン名, VL名)。同じレイヤーのフレーム送りでは走査しない
+_last_layer = None
+
+
+def _images_in_tree(nt, out, visited):
+    for node in iter_tree_nodes(nt, visited):
+        img = getattr(node, "image", None)
+        if isinstance(img, bpy.types.Image):
+            out.add(img)
+
+
+def images_for_view_layer(scene, vl):
+    """このVLのレンダーで参照されうる画像の集合"""
+    needed = set()
+    visited = set()
+
+    for ob in visibility_index.visible_objects(vl):
+        for slot in getattr(ob, "material_slots", []):
+            mat = slot.material
+            if mat is not None and mat.use_nodes:
+                _images_in_tree(mat.node_tree, needed, visited)
+        if ob.type == 'LIGHT' and getattr(ob.data, "use_nodes", False):
+            _images_in_tree(ob.data.node_tree, needed, visited)
+        if ob.type == 'EMPTY' and isinstance(ob.data, bpy.types.Image):
+            needed.add(ob.data)
+        for mod in getattr(ob, "modifiers", []):
+            if mod.type == 'NODES' and mod.node_group is not None:
+                _images_in_tree(mod.node_group, needed, visited)
+            tex = getattr(mod, "texture", None)
+            if tex is not None and isinstance(getattr(tex, "image", None), bpy.types.Image):
+                needed.add(tex.image)
+
+    world = scene.world
+    if world is not None and world.use_nodes:
+        _images_in_tree(world.node_tree, needed, visited)
+    if scene.use_nodes and scene.node_tree is not None:
+        _images_in_tree(scene.node_tree, needed, visited)
+    return needed
+
+
+def _image_bytes(img):
+    w, h = img.size
+    per_channel = 4 if img.is_float else 1
+    return int(w) * int(h) * int(img.channels) * per_channel
+
+
+def free_unused_images(scene, vl, *, force=False):
+    """このVLで使わない画像のバッファを解放し、(枚数, 推定バイト数) を返す。
+    同じレイヤーが続く間は何もしない（force=True で強制）。"""
+    global _last_layer
+    if not getattr(scene, "vlm_free_unused_images", False):
+        return 0, 0
+    key = (scene.name, vl.name)
+    if not force and key == _last_layer:
+        return 0, 0
+    _last_layer = key
+
+    needed = images_for_view_layer(scene, vl)
+    count = freed = 0
+    for img in bpy.data.images:
+        if img in needed or img.type in _KEEP_IMAGE_TYPES:
+            continue
+        # 未保存のペイント結果は捨てない
+        if not img.has_data or img.is_dirty:
+            continue
+        size = _image_bytes(img)
+        img.buffers_free()
+        count += 1
+        freed += size
+    if count:
+        print(f"VLM: [{vl.name}] freed {count} image buffers (~{freed / (1024 * 1024):.1f} MiB)")
+    return count, freed
+
+
+def reset():
+    """バッチ終了時に呼ぶ：次のバッチでは最初のレイヤーでも走査する"""
+    global _last_layer
+    _last_layer = None
+
+
+def register():
+    bpy.types.Scene.vlm_free_unused_images = BoolProperty(
+        name="Free Unused Images",
+        description="レイヤーを切り替えてレンダーする前に、そのレイヤーで使わない画像のメモリを解放する",
+        default=False,
+    )
+
+
+def unregister():
+    reset()
+    if hasattr(bpy.types.Scene, "vlm_free_unused_images"):
+        del bpy.types.Scene.vlm_free_unused_images
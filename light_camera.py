@@ -1,6 +1,8 @@
 import bpy
 import json
 
+from . import visibility_index
+
 # --------------------------------------------------
 # ViewLayer に保存するライト状態辞書（JSON 文字列）
 # --------------------------------------------------
@@ -52,17 +54,8 @@ class VLM_OT_apply_memorized_lights(bpy.types.Operator):
 def apply_lights_for_viewlayer(vl, *, do_view_update=True):
     state = _get_light_state_dict(vl)
 
-    # このビューレイヤーに属するオブジェクト名セットを作成
-    vl_obj_names = {o.name for o in vl.objects}
-
-    for ob in bpy.data.objects:
-        if ob.type != 'LIGHT':
-            continue
-
-        # ▼ ビューレイヤーに存在しないライトはスキップ（コレクションがOFFなど）
-        if ob.name not in vl_obj_names:
-            continue
-
+    # ▼ ビューレイヤーに存在するライトだけ（コレクションがOFFのものは索引に無い）
+    for ob in visibility_index.layer_objects(vl, 'LIGHT'):
         rec = state.get(ob.name)
         if rec:
             hide_rnd = bool(rec.get("hide_render",   False))
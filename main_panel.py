@@ -4,6 +4,10 @@ from . import (
     light_camera          as lc,
     collection_management as colm,
     render_override       as ro,
+    material_override     as mo,
+    core_bpy,
+    footprint,
+    visibility_index,
 )
 
 
@@ -72,12 +76,25 @@ class VLM_PG_render_layer_entry(bpy.types.PropertyGroup):
     frame_end: bpy.props.IntProperty(name="終了フレーム", default=250, min=0)
     frame_step: bpy.props.IntProperty(name="フレームステップ", default=1, min=1)
 
+    eevee_perf_enable: bpy.props.BoolProperty(name="EEVEE 設定を上書き", default=False)
+    eevee_shadow_resolution_scale: bpy.props.FloatProperty(name="シャドウ解像度", default=1.0, min=0.0, max=1.0)
+    eevee_shadow_ray_count: bpy.props.IntProperty(name="シャドウレイ数", default=1, min=1, max=4)
+    eevee_shadow_step_count: bpy.props.IntProperty(name="シャドウステップ数", default=6, min=1, max=16)
+    eevee_volumetric_tile_size: bpy.props.EnumProperty(name="ボリュームタイル", items=ro.EEVEE_TILE_SIZES, default="8")
+    eevee_volumetric_samples: bpy.props.IntProperty(name="ボリュームサンプル", default=64, min=1, max=256)
+    eevee_ray_tracing_method: bpy.props.EnumProperty(name="レイトレース方式", items=ro.EEVEE_RAY_TRACING_METHODS, default="SCREEN")
+    eevee_ray_tracing_resolution: bpy.props.EnumProperty(name="レイトレース解像度", items=ro.EEVEE_RAY_TRACING_RESOLUTIONS, default="2")
+    eevee_motion_blur_steps: bpy.props.IntProperty(name="モーションブラーステップ", default=1, min=1, max=64)
+
+
+# ポップアップ行 ⇔ VLM_RenderSettings でそのままコピーする EEVEE 項目
+_EEVEE_ENTRY_PROPS = ("eevee_perf_enable",) + tuple(rs_prop for rs_prop, _ in ro.EEVEE_PERF_PROP_MAP)
+
 
 def _gather_shader_aovs_from_tree(nt, visited):
     """ノードツリー内の AOV 出力名とタイプを収集（ノードグループも再帰）"""
     if nt is None or nt in visited:
         return {}
-    visited.add(nt)
 
     def _get_shader_aov_output_name(node):
         """
@@ -127,7 +144,8 @@ def _gather_shader_aovs_from_tree(nt, visited):
         return raw or ""
 
     found = {}
-    for node in getattr(nt, "nodes", []):
+    # ノードグループの再帰は material_override.iter_tree_nodes に任せる
+    for node in mo.iter_tree_nodes(nt, visited):
         # シェーダー AOV 出力
         if getattr(node, "bl_idname", "") == "ShaderNodeOutputAOV":
             raw = _get_shader_aov_output_name(node)
@@ -135,13 +153,6 @@ def _gather_shader_aovs_from_tree(nt, visited):
                 aov_type = getattr(node, "type", "COLOR") or "COLOR"
                 # 既に同名があれば最初のタイプを優先
                 found.setdefault(raw, aov_type)
-        # ノードグループを再帰的に探索
-        elif getattr(node, "type", "") == 'GROUP':
-            sub_tree = getattr(node, "node_tree", None)
-            if sub_tree:
-                sub = _gather_shader_aovs_from_tree(sub_tree, visited)
-                for k, v in sub.items():
-                    found.setdefault(k, v)
     return found
 
 
@@ -161,15 +172,8 @@ def _collect_aov_names_for_view_layer(vl):
         return {}
 
     names = {}
-    objs = getattr(vl, "objects", [])
-    for obj in objs:
-        # ビューレイヤーで可視なオブジェクトのみ対象
-        try:
-            if not obj.visible_get(view_layer=vl):
-                continue
-        except TypeError:
-            if not obj.visible_get():
-                continue
+    # ビューレイヤーで可視なオブジェクトのみ対象
+    for obj in visibility_index.visible_objects(vl):
         for slot in getattr(obj, "material_slots", []):
             mat = getattr(slot, "material", None)
             if mat is None:
@@ -779,30 +783,37 @@ class VLM_OT_apply_render_settings_popup(bpy.types.Operator):
             entry.rename_to = ""
             entry.delete_layer = False
 
-            entry.engine_enable = bool(getattr(rs, "engine_enable", False))
-            entry.engine = getattr(rs, "engine", entry.engine)
+            # レイヤーの生の値はキャッシュ済みの LayerSettings から読む
+            ls = core_bpy.cached_layer_settings(sc, vl)
+
+            entry.engine_enable = ls.engine_enable
+            entry.engine = ls.engine
 
-            entry.samples_enable = bool(getattr(rs, "samples_enable", False))
-            entry.samples = getattr(rs, "samples", entry.samples)
+            entry.samples_enable = ls.samples_enable
+            entry.samples = ls.samples
 
-            entry.camera_enable = bool(getattr(rs, "camera_enable", False))
-            entry.camera = getattr(rs, "camera", None)
+            entry.camera_enable = ls.camera_enable
+            entry.camera = bpy.data.objects.get(ls.camera) if ls.camera else None
 
-            entry.world_enable = bool(getattr(rs, "world_enable", False))
-            entry.world = getattr(vl, "vlm_world", None) or sc.world
+            entry.world_enable = ls.world_enable
+            entry.world = (bpy.data.worlds.get(ls.world) if ls.world else None) or sc.world
 
-            entry.format_enable = bool(getattr(rs, "format_enable", False))
-            entry.resolution_x = getattr(rs, "resolution_x", sc.render.resolution_x)
-            entry.resolution_y = getattr(rs, "resolution_y", sc.render.resolution_y)
-            entry.resolution_percentage = getattr(rs, "resolution_percentage", sc.render.resolution_percentage)
-            entry.aspect_x = getattr(rs, "aspect_x", sc.render.pixel_aspect_x)
-            entry.aspect_y = getattr(rs, "aspect_y", sc.render.pixel_aspect_y)
-            entry.frame_rate = getattr(rs, "frame_rate", sc.render.fps / sc.render.fps_base)
+            entry.format_enable = ls.format_enable
+            entry.resolution_x = ls.resolution_x
+            entry.resolution_y = ls.resolution_y
+            entry.resolution_percentage = ls.resolution_percentage
+            entry.aspect_x = ls.aspect_x
+            entry.aspect_y = ls.aspect_y
+            entry.frame_rate = ls.frame_rate
 
-            entry.frame_enable = bool(getattr(rs, "frame_enable", False))
-            entry.frame_start = getattr(rs, "frame_start", sc.frame_start)
-            entry.frame_end = getattr(rs, "frame_end", sc.frame_end)
-            entry.frame_step = getattr(rs, "frame_step", sc.frame_step)
+            entry.frame_enable = ls.frame_enable
+            entry.frame_start = ls.frame_start
+            entry.frame_end = ls.frame_end
+            entry.frame_step = ls.frame_step
+
+            for nm in _EEVEE_ENTRY_PROPS:
+                if hasattr(rs, nm):
+                    setattr(entry, nm, getattr(rs, nm))
 
         return context.window_manager.invoke_props_dialog(self, width=980)
 
@@ -878,6 +889,21 @@ class VLM_OT_apply_render_settings_popup(bpy.types.Operator):
             frvals.prop(entry, "frame_end", text="終了")
             frvals.prop(entry, "frame_step", text="ステップ")
 
+            if entry.engine == 'BLENDER_EEVEE_NEXT' or entry.eevee_perf_enable:
+                erow = box.row(align=True)
+                erow.separator(factor=8.0)
+                erow.prop(entry, "eevee_perf_enable", text="EEVEE")
+                evals = erow.row(align=True)
+                evals.enabled = bool(entry.eevee_perf_enable)
+                evals.prop(entry, "eevee_shadow_resolution_scale", text="影解像度")
+                evals.prop(entry, "eevee_shadow_ray_count", text="影レイ")
+                evals.prop(entry, "eevee_shadow_step_count", text="影ステップ")
+                evals.prop(entry, "eevee_volumetric_tile_size", text="")
+                evals.prop(entry, "eevee_volumetric_samples", text="ボリューム")
+                evals.prop(entry, "eevee_ray_tracing_method", text="")
+                evals.prop(entry, "eevee_ray_tracing_resolution", text="")
+                evals.prop(entry, "eevee_motion_blur_steps", text="MB")
+
     def execute(self, context):
         sc = context.scene
         applied = []
@@ -888,49 +914,53 @@ class VLM_OT_apply_render_settings_popup(bpy.types.Operator):
 
         rename_map = {}
         delete_names = set()
-        for entry in layers:
-            if entry.delete_layer:
-                delete_names.add(entry.name)
-                continue
-
-            rename_to = (entry.rename_to or "").strip()
-            if rename_to and rename_to != entry.name:
-                rename_map[entry.name] = rename_to
-
-            vl = sc.view_layers.get(entry.name)
-            if vl is None:
-                continue
-            rs = getattr(vl, "vlm_render", None)
-            if rs is None:
-                continue
-
-            rs.engine_enable = bool(entry.engine_enable)
-            rs.engine = entry.engine
-
-            rs.samples_enable = bool(entry.samples_enable)
-            rs.samples = entry.samples
-
-            rs.camera_enable = bool(entry.camera_enable)
-            rs.camera = entry.camera if entry.camera_enable else rs.camera
-
-            rs.world_enable = bool(entry.world_enable)
-            if entry.world_enable:
-                vl.vlm_world = entry.world
+        # 全レイヤーを検証しつつ一括で書き込み、最後にアクティブレイヤーへ 1 回だけ適用
+        with ro.bulk_edit(sc, context.view_layer):
+            for entry in layers:
+                if entry.delete_layer:
+                    delete_names.add(entry.name)
+                    continue
 
-            rs.format_enable = bool(entry.format_enable)
-            rs.resolution_x = entry.resolution_x
-            rs.resolution_y = entry.resolution_y
-            rs.resolution_percentage = entry.resolution_percentage
-            rs.aspect_x = entry.aspect_x
-            rs.aspect_y = entry.aspect_y
-            rs.frame_rate = entry.frame_rate
+                rename_to = (entry.rename_to or "").strip()
+                if rename_to and rename_to != entry.name:
+                    rename_map[entry.name] = rename_to
 
-            rs.frame_enable = bool(entry.frame_enable)
-            rs.frame_start = entry.frame_start
-            rs.frame_end = entry.frame_end
-            rs.frame_step = entry.frame_step
+                vl = sc.view_layers.get(entry.name)
+                if vl is None:
+                    continue
+                rs = getattr(vl, "vlm_render", None)
+                if rs is None:
+                    continue
 
-            applied.append(entry.name)
+                values = {
+                    "engine_enable": entry.engine_enable,
+                    "engine": entry.engine,
+                    "samples_enable": entry.samples_enable,
+                    "samples": entry.samples,
+                    "camera_enable": entry.camera_enable,
+                    "world_enable": entry.world_enable,
+                    "format_enable": entry.format_enable,
+                    "resolution_x": entry.resolution_x,
+                    "resolution_y": entry.resolution_y,
+                    "resolution_percentage": entry.resolution_percentage,
+                    "aspect_x": entry.aspect_x,
+                    "aspect_y": entry.aspect_y,
+                    "frame_rate": entry.frame_rate,
+                    "frame_enable": entry.frame_enable,
+                    "frame_start": entry.frame_start,
+                    "frame_end": entry.frame_end,
+                    "frame_step": entry.frame_step,
+                }
+                if entry.camera_enable:
+                    values["camera"] = entry.camera
+                for nm in _EEVEE_ENTRY_PROPS:
+                    values[nm] = getattr(entry, nm)
+                ro.write_layer_settings(rs, values)
+
+                if entry.world_enable and vl.vlm_world != entry.world:
+                    vl.vlm_world = entry.world
+
+                applied.append(entry.name)
 
         rename_applied = []
         rename_skipped = []
@@ -1068,6 +1098,10 @@ class VLM_PT_panel(bpy.types.Panel):
         dup_row.operator("vlm.apply_collection_settings_popup", icon='MODIFIER_ON')
         dup_row.operator("vlm.apply_render_settings_popup", icon='RENDER_STILL')
 
+        io_row = layout.row(align=True)
+        io_row.operator("vlm.export_manifest", icon='EXPORT')
+        io_row.operator("vlm.import_manifest", icon='IMPORT')
+
         layout.separator()
 
         # 2) コレクション（既存）
@@ -1083,6 +1117,49 @@ class VLM_PT_panel(bpy.types.Panel):
             row.operator("vlm.backup_materials_current", icon='FILE_TICK', text="今の見た目を保存")
             row.operator("vlm.backup_materials_base",    icon='FILE_TICK', text="ベース状態を保存")
             row.operator("vlm.clear_backup_materials",   icon='TRASH',     text="クリア")
+
+            # 名前付きスナップショット（ベースとの差分）
+            box = layout.box()
+            head = box.row()
+            head.label(text="スナップショット", icon='MATERIAL')
+            op = head.operator("vlm.capture_material_snapshot", text="", icon='ADD')
+            op.snapshot_name = ""
+            active = sc.vlm_material_snapshot_active
+            row = box.row(align=True)
+            op = row.operator("vlm.apply_material_snapshot", text="ベース", depress=not active)
+            op.snapshot_name = ""
+            for snap in sc.vlm_material_snapshots:
+                row = box.row(align=True)
+                op = row.operator("vlm.apply_material_snapshot", text=snap.name, depress=(snap.name == active))
+                op.snapshot_name = snap.name
+                row.label(text=f"v{snap.version} / {snap.object_count}")
+                op = row.operator("vlm.compare_material_snapshot", text="", icon='ARROW_LEFTRIGHT')
+                op.snapshot_name = snap.name
+                op = row.operator("vlm.capture_material_snapshot", text="", icon='FILE_REFRESH')
+                op.snapshot_name = snap.name
+                op = row.operator("vlm.remove_material_snapshot", text="", icon='X')
+                op.snapshot_name = snap.name
+            layout.separator()
+
+        # 3') メモリ見積もり（レイヤーごと・キャッシュ済み）
+        if _fold(layout, sc, "vlm_ui_show_footprint", "メモリ見積もり"):
+            box = layout.box()
+            head = box.row()
+            head.label(text="レイヤー")
+            head.label(text="頂点 / 面 / インスタンス")
+            head.label(text="テクスチャ")
+            head.operator("vlm.refresh_footprint", text="", icon='FILE_REFRESH')
+            for v in vlayers:
+                fp = footprint.get_footprint(sc, v)
+                row = box.row()
+                row.label(text=v.name, icon='RENDERLAYERS' if v.name == curr else 'NONE')
+                row.label(text=f"{footprint.format_count(fp.vertices)} / "
+                               f"{footprint.format_count(fp.faces)} / "
+                               f"{footprint.format_count(fp.instances)}")
+                tex = footprint.format_bytes(fp.texture_bytes)
+                if fp.textures_unloaded:
+                    tex += f" (+{fp.textures_unloaded} 未読込)"
+                row.label(text=tex)
             layout.separator()
 
         # ─────────────────────────────────────────
@@ -1127,6 +1204,15 @@ class VLM_PT_panel(bpy.types.Panel):
                     col.enabled = (is_top_layer or vrs.engine_enable)
                     col.prop(vrs, "engine", text="Engine")
                     # ※ ここから Samples / Denoise は削除しました（エンジンのみ）
+
+                    # 実効値（先頭レイヤーへのフォールバック込み・キャッシュ済み）
+                    res = core_bpy.resolve_view_layer(sc, context.view_layer)
+                    samples = f" / {res.samples} spp" if res.samples is not None else ""
+                    layout.label(
+                        text=f"実効: {res.engine}{samples} / {res.resolution_x}x{res.resolution_y} "
+                             f"{res.resolution_percentage}% / {res.frame_start}-{res.frame_end}",
+                        icon='INFO',
+                    )
             except Exception as e:
                 layout.label(text=f"Engine UI error: {e}", icon='ERROR')
 
@@ -1222,6 +1308,105 @@ class VLM_PT_panel(bpy.types.Panel):
                 fast_gi_body.prop(vrs, "fast_gi_viewport_bounces", text="ビューポートバウンス")
                 fast_gi_body.prop(vrs, "fast_gi_render_bounces", text="レンダーバウンス数")
 
+                if hasattr(vrs, "cycles_perf_enable"):
+                    perf_box = col.box()
+                    perf_head = perf_box.row(align=True)
+                    perf_head.label(text="パフォーマンス")
+                    perf_toggle = perf_head.row(align=True)
+                    perf_toggle.enabled = not is_top_layer
+                    perf_toggle.prop(vrs, "cycles_perf_enable", text="このレイヤーの設定を使用")
+
+                    perf_body = perf_box.column(align=True)
+                    perf_body.enabled = is_top_layer or bool(getattr(vrs, "cycles_perf_enable", False))
+                    perf_body.prop(vrs, "cycles_use_adaptive_sampling", text="適応サンプリング")
+                    adaptive = perf_body.column(align=True)
+                    adaptive.enabled = bool(getattr(vrs, "cycles_use_adaptive_sampling", True))
+                    adaptive.prop(vrs, "cycles_adaptive_threshold", text="ノイズしきい値")
+                    adaptive.prop(vrs, "cycles_adaptive_min_samples", text="最小サンプル数")
+                    perf_body.prop(vrs, "cycles_time_limit", text="時間制限（秒）")
+                    thr = perf_body.row(align=True)
+                    thr.prop(vrs, "threads_mode", text="スレッド")
+                    thr_n = thr.row(align=True)
+                    thr_n.enabled = getattr(vrs, "threads_mode", "AUTO") == "FIXED"
+                    thr_n.prop(vrs, "threads", text="")
+
+            layout.separator()
+
+        # ─────────────────────────────────────────
+        # ④' 簡略化（Simplify）
+        # ─────────────────────────────────────────
+        if _fold(layout, sc, "vlm_ui_show_simplify", "簡略化（Simplify）"):
+            vrs = getattr(context.view_layer, "vlm_render", None)
+            if vrs is None or not hasattr(vrs, "simplify_enable"):
+                layout.label(text="(vlm_render が未登録です)", icon='ERROR')
+            else:
+                row = layout.row(align=True)
+                row.enabled = not is_top_layer
+                row.prop(vrs, "simplify_enable", text="このレイヤーの設定を使用")
+
+                col = layout.column(align=True)
+                col.enabled = (is_top_layer or bool(getattr(vrs, "simplify_enable", False)))
+                col.prop(vrs, "simplify_use", text="簡略化を使用")
+
+                body = col.column(align=True)
+                body.enabled = bool(getattr(vrs, "simplify_use", False))
+                body.prop(vrs, "simplify_subdivision", text="最大細分化")
+                body.prop(vrs, "simplify_child_particles", text="子パーティクル")
+                body.prop(vrs, "simplify_volumes", text="ボリューム解像度")
+
+                cyc = body.box()
+                cyc.label(text="Cycles")
+                cyc.prop(vrs, "simplify_texture_limit", text="テクスチャ制限")
+                cull = cyc.row(align=True)
+                cull.prop(vrs, "simplify_use_camera_cull", text="カメラカリング")
+                sub = cull.row(align=True)
+                sub.enabled = bool(getattr(vrs, "simplify_use_camera_cull", False))
+                sub.prop(vrs, "simplify_camera_cull_margin", text="マージン")
+                cull = cyc.row(align=True)
+                cull.prop(vrs, "simplify_use_distance_cull", text="距離カリング")
+                sub = cull.row(align=True)
+                sub.enabled = bool(getattr(vrs, "simplify_use_distance_cull", False))
+                sub.prop(vrs, "simplify_distance_cull_margin", text="距離")
+
+            layout.separator()
+
+        # ─────────────────────────────────────────
+        # ④'' EEVEE Next パフォーマンス
+        # ─────────────────────────────────────────
+        if _fold(layout, sc, "vlm_ui_show_eevee_perf", "EEVEE パフォーマンス"):
+            vrs = getattr(context.view_layer, "vlm_render", None)
+            if vrs is None or not hasattr(vrs, "eevee_perf_enable"):
+                layout.label(text="(vlm_render が未登録です)", icon='ERROR')
+            else:
+                row = layout.row(align=True)
+                row.enabled = not is_top_layer
+                row.prop(vrs, "eevee_perf_enable", text="このレイヤーの設定を使用")
+
+                col = layout.column(align=True)
+                col.enabled = (is_top_layer or bool(getattr(vrs, "eevee_perf_enable", False)))
+
+                if getattr(vrs, "engine", "") != "BLENDER_EEVEE_NEXT":
+                    warn = col.box()
+                    warn.label(text="EEVEE 選択時のみ有効です", icon='INFO')
+
+                shadow_box = col.box()
+                shadow_box.label(text="シャドウ")
+                shadow_box.prop(vrs, "eevee_shadow_resolution_scale", text="解像度")
+                shadow_box.prop(vrs, "eevee_shadow_ray_count", text="レイ数")
+                shadow_box.prop(vrs, "eevee_shadow_step_count", text="ステップ数")
+
+                vol_box = col.box()
+                vol_box.label(text="ボリューム")
+                vol_box.prop(vrs, "eevee_volumetric_tile_size", text="タイルサイズ")
+                vol_box.prop(vrs, "eevee_volumetric_samples", text="サンプル数")
+
+                rt_box = col.box()
+                rt_box.label(text="レイトレーシング")
+                rt_box.prop(vrs, "eevee_ray_tracing_method", text="方式")
+                rt_box.prop(vrs, "eevee_ray_tracing_resolution", text="解像度")
+
+                col.prop(vrs, "eevee_motion_blur_steps", text="モーションブラーステップ")
+
             layout.separator()
 
         # 以降は既存のまま（カメラ／ライト／World／フォーマット／フレーム範囲／出力ノード／レンダー出力）
@@ -1325,6 +1510,20 @@ class VLM_PT_panel(bpy.types.Panel):
             if hasattr(bpy.types.Scene, "vlm_enable_ao_multiply"):
                 layout.prop(sc, "vlm_enable_ao_multiply", text="画像にAOを乗算（RGBカーブ適用）")
             layout.operator("vlm.prepare_output_nodes_plus", text="ノードを作成・接続")
+
+            if hasattr(sc, "vlm_deferred_encode"):
+                enc = layout.box()
+                enc.prop(sc, "vlm_deferred_encode", text="バックグラウンドでエンコード")
+                enc.prop(sc, "vlm_deferred_denoise", text="バックグラウンドでデノイズ（Cycles）")
+                col = enc.column(align=True)
+                col.enabled = bool(sc.vlm_deferred_encode or sc.vlm_deferred_denoise)
+                col.prop(sc, "vlm_intermediate_codec", text="中間EXR圧縮")
+                col.prop(sc, "vlm_encode_workers", text="変換プロセス数")
+                sub = col.row()
+                sub.enabled = bool(sc.vlm_deferred_denoise)
+                sub.prop(sc, "vlm_denoise_threads", text="デノイズスレッド数")
+                if sc.vlm_deferred_denoise:
+                    enc.label(text="デノイズは出力ノードの画像のみ。レンダー出力パスへは保存しません", icon='INFO')
             layout.separator()
 
         # 10) レンダー出力
@@ -1340,10 +1539,52 @@ class VLM_PT_panel(bpy.types.Panel):
             op.use_animation = True
             op = row.operator("vlm.render_active_viewlayer", text="アニメーション (アクティブのみ)")
             op.use_animation = True
+
+            if hasattr(sc, "vlm_render_time_overrides"):
+                rt = layout.box()
+                rt.prop(sc, "vlm_render_time_overrides", text="F12 / コマンドラインでもマテリアル・ライトを適用")
+                if sc.vlm_render_time_overrides and not sc.render.use_lock_interface:
+                    rt.prop(sc.render, "use_lock_interface", text="インターフェースをロック（必須）", icon='ERROR')
+
+            if hasattr(sc, "vlm_frustum_cull_enable"):
+                fc = layout.box()
+                row = fc.row(align=True)
+                row.prop(sc, "vlm_frustum_cull_enable", text="画面外コレクションを一時除外")
+                row.operator("vlm.analyze_frustum_culling", text="", icon='VIEWZOOM')
+                row = fc.row(align=True)
+                row.enabled = bool(sc.vlm_frustum_cull_enable)
+                row.prop(sc, "vlm_cull_margin", text="マージン")
+                row.prop(sc, "vlm_cull_frame_samples", text="判定フレーム数")
+
+            if hasattr(sc, "vlm_free_unused_images"):
+                layout.prop(sc, "vlm_free_unused_images", text="未使用テクスチャのメモリを解放（レイヤー切替時）")
+
+            if hasattr(sc, "vlm_thread_alloc_enable"):
+                th = layout.box()
+                th.prop(sc, "vlm_thread_alloc_enable", text="スレッドを自動配分（同時レンダー）")
+                row = th.row(align=True)
+                row.enabled = bool(sc.vlm_thread_alloc_enable)
+                row.prop(sc, "vlm_thread_budget", text="コア予算")
+                row.prop(sc, "vlm_thread_workers", text="同時プロセス数")
+
+            if hasattr(sc, "vlm_preview_percentage"):
+                pv = layout.box()
+                row = pv.row(align=True)
+                row.operator("vlm.render_contact_sheet", text="コンタクトシート", icon='IMGDISPLAY')
+                op = row.operator("vlm.render_contact_sheet", text="", icon='FILE_REFRESH')
+                op.use_cache = False
+                col = pv.column(align=True)
+                col.prop(sc, "vlm_preview_percentage", text="縮小率")
+                col.prop(sc, "vlm_preview_samples", text="サンプル上限")
+                row = col.row(align=True)
+                row.prop(sc, "vlm_preview_workers", text="プロセス数")
+                row.prop(sc, "vlm_preview_columns", text="列数")
             layout.separator()
 
     # ───────── コレクション再帰描画 ─────────
     def _draw_collections(self, layout, layer_coll, curr, is_top_layer, depth=0):
+        curr_vl = bpy.context.scene.view_layers.get(curr)
+
         def draw_one(lc, d):
             coll = lc.collection
             # ルート（Scene Collection）はスキップして子だけ描画
@@ -1388,11 +1629,10 @@ class VLM_PT_panel(bpy.types.Panel):
             mat_row = row.row(align=True)
             mat_row.enabled = not is_top_layer
 
-            key = f"_vlm_mat_override_{curr}_{coll.name}"
-            override_mat = coll.get(key)
+            override_mat = mo.get_override_material(curr_vl, coll) if curr_vl else None
 
             if override_mat:
-                mat_row.label(text=f"上書: {override_mat}", icon='MATERIAL')
+                mat_row.label(text=f"上書: {override_mat.name}", icon='MATERIAL')
                 clr = mat_row.operator("colm.clear_collection_override", text="", icon='X', emboss=True)
                 clr.collection_name = coll.name
                 clr.layer_name = curr
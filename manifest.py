@@ -0,0 +1,236 @@
+# manifest.py
+#
+# ビューレイヤー構成の書き出し / 読み込み（1 ファイルのマニフェスト）
+#   - vlm_render（生の値）と vlm_world、フォールバック解決済みの値とフレーム範囲
+#   - コレクションの除外 / ホールドアウト / 間接のみ、マテリアル上書き、ライト状態、内容切替リスト
+#   - 形式・読み込み・ジョブ計画は core（bpy 非依存）にあるので、ワーカーは bpy なしで読める
+#   - 読み込みは同名レイヤーへ上書き（無ければ作成も可）。ショット間のレイヤー構成コピー用
+# ------------------------------------------------------------
+
+import dataclasses
+import os
+
+import bpy
+from bpy.props import BoolProperty, StringProperty
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+
+from . import core, core_bpy, light_camera, material_override, visibility_index
+from .render_override import bulk_edit, write_layer_settings
+
+# LayerSettings のうち RNA へそのまま書けないフィールド
+_SKIP_FIELDS = {"name", "camera", "world"}
+_MAP_FIELDS = {"light_paths", "fast_gi", "cycles_perf", "simplify", "eevee_perf"}
+
+
+# ──────────────────────────────────────────────
+# ① 収集
+# ──────────────────────────────────────────────
+def _iter_layer_collections(lc):
+    for child in lc.children:
+        yield child
+        yield from _iter_layer_collections(child)
+
+
+def _collection_states(vl):
+    return {
+        lc.collection.name: {
+            "exclude": bool(lc.exclude),
+            "holdout": bool(lc.holdout),
+            "indirect_only": bool(lc.indirect_only),
+        }
+        for lc in _iter_layer_collections(vl.layer_collection)
+    }
+
+
+def _material_overrides(vl):
+    return [
+        {"collection": e.collection.name, "material": e.material.name, "priority": e.priority}
+        for e in material_override.iter_overrides(vl)
+    ]
+
+
+def _layer_entry(scene, vl):
+    return {
+        "name": vl.name,
+        "use": bool(vl.use),
+        "render_this_layer": bool(getattr(vl, "vlm_render_this_layer", True)),
+        "settings": dataclasses.asdict(core_bpy.cached_layer_settings(scene, vl)),
+        "resolved": dataclasses.asdict(core_bpy.resolve_view_layer(scene, vl)),
+        "frame_range": list(core_bpy.resolve_frame_range(scene, vl)),
+        "collections": _collection_states(vl),
+        "material_overrides": _material_overrides(vl),
+        "lights": light_camera._get_light_state_dict(vl),
+        "content_switch": {
+            "enable": bool(getattr(vl, "vlm_content_switch_enable", False)),
+            "collections": [it.name for it in getattr(vl, "vlm_content_collection_names", []) if it.name],
+        },
+    }
+
+
+def build_manifest(scene):
+    return {
+        "format": core.MANIFEST_FORMAT,
+        "version": core.MANIFEST_VERSION,
+        "scene": scene.name,
+        "blend": bpy.data.filepath,
+        "scene_settings": dataclasses.asdict(core_bpy.scene_settings_from_scene(scene)),
+        "layers": [_layer_entry(scene, vl) for vl in scene.view_layers],
+    }
+
+
+# ──────────────────────────────────────────────
+# ② 反映
+# ──────────────────────────────────────────────
+def _rna_values(settings):
+    """LayerSettings の dict → VLM_RenderSettings に書く {プロパティ名: 値}"""
+    values = {}
+    for key, value in settings.items():
+        if key in _SKIP_FIELDS:
+            continue
+        if key in _MAP_FIELDS:
+            values.update(value or {})
+        else:
+            values[key] = value
+    camera = settings.get("camera")
+    if camera:
+        values["camera"] = bpy.data.objects.get(camera)
+    return values
+
+
+def _apply_entry(scene, vl, entry, missing):
+    rs = vl.vlm_render
+    settings = entry.get("settings", {})
+    write_layer_settings(rs, _rna_values(settings))
+    if settings.get("camera") and bpy.data.objects.get(settings["camera"]) is None:
+        missing.add(f"camera:{settings['camera']}")
+
+    world_name = settings.get("world")
+    if world_name:
+        world = bpy.data.worlds.get(world_name)
+        if world is None:
+            missing.add(f"world:{world_name}")
+        elif vl.vlm_world != world:
+            vl.vlm_world = world
+
+    vl.use = bool(entry.get("use", vl.use))
+    if hasattr(vl, "vlm_render_this_layer"):
+        vl.vlm_render_this_layer = bool(entry.get("render_this_layer", True))
+
+    states = entry.get("collections", {})
+    for lc in _iter_layer_collections(vl.layer_collection):
+        st = states.get(lc.collection.name)
+        if st is None:
+            continue
+        lc.exclude = bool(st.get("exclude", lc.exclude))
+        lc.holdout = bool(st.get("holdout", lc.holdout))
+        lc.indirect_only = bool(st.get("indirect_only", lc.indirect_only))
+    visibility_index.invalidate(vl.id_data)
+    missing.update(f"collection:{n}" for n in states if n not in bpy.data.collections)
+
+    # マテリアル上書きはこのレイヤーの分を入れ替える
+    vl.vlm_material_overrides.clear()
+    material_override.invalidate_override_index(vl)
+    for ov in entry.get("material_overrides", []):
+        col = bpy.data.collections.get(ov["collection"])
+        mat = bpy.data.materials.get(ov["material"])
+        if col is None:
+            missing.add(f"collection:{ov['collection']}")
+        if mat is None:
+            missing.add(f"material:{ov['material']}")
+        if col is not None and mat is not None:
+            material_override.set_override(vl, col, mat, ov.get("priority", 0))
+
+    light_camera._set_light_state_dict(vl, entry.get("lights", {}))
+
+    cs = entry.get("content_switch", {})
+    if hasattr(vl, "vlm_content_switch_enable"):
+        vl.vlm_content_switch_enable = bool(cs.get("enable", False))
+        names = vl.vlm_content_collection_names
+        names.clear()
+        for n in cs.get("collections", []):
+            names.add().name = n
+
+
+def apply_manifest(scene, manifest, *, create_missing=False):
+    """マニフェストを同名レイヤーへ反映し、(反映したレイヤー名, 見つからなかったもの) を返す"""
+    applied, missing = [], set()
+    with bulk_edit(scene):
+        for entry in manifest.get("layers", []):
+            vl = scene.view_layers.get(entry["name"])
+            if vl is None:
+                if not create_missing:
+                    missing.add(f"view_layer:{entry['name']}")
+                    continue
+                vl = scene.view_layers.new(entry["name"])
+            _apply_entry(scene, vl, entry, missing)
+            applied.append(vl.name)
+    return applied, sorted(missing)
+
+
+# ──────────────────────────────────────────────
+# ③ オペレーター
+# ──────────────────────────────────────────────
+class VLM_OT_export_manifest(bpy.types.Operator, ExportHelper):
+    bl_idname = "vlm.export_manifest"
+    bl_label = "レイヤー構成を書き出し"
+    bl_description = "全ビューレイヤーの設定を 1 ファイル（.json / .msgpack）に書き出す"
+
+    filename_ext = ".json"
+    check_extension = False
+    filter_glob: StringProperty(default="*.json;*.msgpack", options={'HIDDEN'})
+
+    def execute(self, context):
+        try:
+            core.dump_manifest(build_manifest(context.scene), self.filepath)
+        except (OSError, core.ManifestError) as e:
+            self.report({'ERROR'}, f"書き出しに失敗しました: {e}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"書き出しました: {os.path.basename(self.filepath)}")
+        return {'FINISHED'}
+
+
+class VLM_OT_import_manifest(bpy.types.Operator, ImportHelper):
+    bl_idname = "vlm.import_manifest"
+    bl_label = "レイヤー構成を読み込み"
+    bl_description = "書き出したレイヤー構成を同名のビューレイヤーへ反映する"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filter_glob: StringProperty(default="*.json;*.msgpack", options={'HIDDEN'})
+    create_missing: BoolProperty(
+        name="Create Missing Layers",
+        description="このシーンに無いビューレイヤーは新しく作る",
+        default=False,
+    )
+
+    def execute(self, context):
+        try:
+            manifest = core.load_manifest(self.filepath)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, f"読み込みに失敗しました: {e}")
+            return {'CANCELLED'}
+        applied, missing = apply_manifest(context.scene, manifest, create_missing=self.create_missing)
+        if missing:
+            print(f"VLM: manifest import missing: {', '.join(missing)}")
+            self.report({'WARNING'}, f"{len(applied)} レイヤーに反映（見つからない項目 {len(missing)} 件。詳細はコンソール）")
+        else:
+            self.report({'INFO'}, f"{len(applied)} レイヤーに反映しました")
+        return {'FINISHED'}
+
+
+classes = (
+    VLM_OT_export_manifest,
+    VLM_OT_import_manifest,
+)
+
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+
+
+def unregister():
+    for c in reversed(classes):
+        try:
+            bpy.utils.unregister_class(c)
+        except RuntimeError:
+            pass
@@ -1,10 +1,15 @@
 # material_override.py
 
+import functools
+from contextlib import contextmanager
+
 import bpy
 from bpy.app.handlers import persistent
-from bpy.props import PointerProperty, CollectionProperty
+from bpy.props import BoolProperty, IntProperty, PointerProperty, CollectionProperty, StringProperty
 from bpy.types import PropertyGroup
 
+from . import visibility_index
+
 # ───────────────────────────────
 # 直前にアクティブだったビュー・レイヤー名を入れておくグローバル変数
 # （初期値は空文字で可）
@@ -18,38 +23,424 @@ class MaterialBackupItem(PropertyGroup):
         type=bpy.types.Material,
         description="元のマテリアル参照"
     )
+
+
+class ObjectBackupItem(PropertyGroup):
+    object: PointerProperty(
+        name="Object",
+        type=bpy.types.Object,
+        description="行のオブジェクト（pointer なので改名に追随する）"
+    )
+
+
+class VLM_PG_material_backup(PropertyGroup):
+    """シーン単位のマテリアルバックアップ表。
+    行はオブジェクト、値はスロットごとのパレット番号（-1 は空スロット）。
+    配列本体は ID プロパティ（int 配列）"slot_counts" / "slot_materials" に持つ。
+    行のオブジェクトは objects（pointer）で持ち、object_names は pointer の無い古い表の読み出し用。"""
+    palette: CollectionProperty(type=MaterialBackupItem)
+    objects: CollectionProperty(type=ObjectBackupItem)
+    object_names: StringProperty(
+        name="Objects",
+        description="バックアップ済みオブジェクト名（改行区切り）",
+        default="",
+    )
 # --------------------------------------------------
 # 内部キー
 # --------------------------------------------------
 def _backup_key(obj):
+    """旧形式（オブジェクトごと）のバックアップの互換フラグ。versioning のマイグレーション専用"""
     return "_vlm_mat_backup"
 
 def _override_key(vl_name, col_name):
+    """旧形式（コレクションの ID プロパティ）のキー。versioning のマイグレーション専用"""
     return f"_vlm_mat_override_{vl_name}_{col_name}"
 
 # --------------------------------------------------
-# マテリアル バックアップ／復元
+# マテリアル上書きレジストリ（ViewLayer.vlm_material_overrides）
+#   * (コレクション, マテリアル, 優先度) を pointer で持つので改名に強い
+#   * (シーン名, VL名) → {コレクション識別子: 行番号} の索引をメモリに持ち、
+#     参照時に pointer を照合して食い違えば作り直す（アンドゥ・削除後も安全）
 # --------------------------------------------------
-def backup_all_materials():
-    """
-    まだバックアップが無いオブジェクトだけ pointer で保存する。
-    PointerProperty はマテリアル名を変更しても追随するため
-    基本的に取り直しは不要（必要なら［マテリアルバックアップ］で上書き）。
-    """
-    for obj in bpy.data.objects:
-        if obj.type != 'MESH':
-            continue
+class VLM_PG_material_override(PropertyGroup):
+    collection: PointerProperty(name="Collection", type=bpy.types.Collection)
+    material: PointerProperty(name="Material", type=bpy.types.Material)
+    priority: IntProperty(
+        name="Priority",
+        description="大きいほど後に適用（同じオブジェクトが複数のコレクションにある場合に勝つ）",
+        default=0,
+    )
+
+
+_override_index = {}
+
+
+def _uid(idblock):
+    return getattr(idblock, "session_uid", None) or idblock.name
+
+
+def _index_key(vl):
+    return (vl.id_data.name, vl.name)
+
+
+def _override_index_for(vl, *, rebuild=False):
+    key = _index_key(vl)
+    entries = vl.vlm_material_overrides
+    cached = _override_index.get(key)
+    if rebuild or cached is None or cached[0] != len(entries):
+        cached = _override_index[key] = (len(entries), {
+            _uid(e.collection): i for i, e in enumerate(entries) if e.collection is not None
+        })
+    return cached[1]
+
+
+def invalidate_override_index(vl=None):
+    if vl is None:
+        _override_index.clear()
+    else:
+        _override_index.pop(_index_key(vl), None)
+
+
+def find_override(vl, col):
+    """このVLでの col の上書きエントリ（無ければ None）"""
+    entries = getattr(vl, "vlm_material_overrides", None)
+    if entries is None or col is None:
+        return None
+    i = _override_index_for(vl).get(_uid(col))
+    if i is None:
+        return None
+    if i < len(entries) and entries[i].collection == col:
+        return entries[i]
+    # 件数は同じだが並びが変わった（アンドゥ等）→ 作り直して引き直す
+    i = _override_index_for(vl, rebuild=True).get(_uid(col))
+    return entries[i] if i is not None else None
+
+
+def get_override_material(vl, col):
+    entry = find_override(vl, col)
+    return entry.material if entry is not None else None
+
+
+def set_override(vl, col, mat, priority=None):
+    entry = find_override(vl, col)
+    if entry is None:
+        entry = vl.vlm_material_overrides.add()
+        entry.collection = col
+    entry.material = mat
+    if priority is not None:
+        entry.priority = int(priority)
+    return entry
+
+
+def clear_override(vl, col):
+    entry = find_override(vl, col)
+    if entry is None:
+        return False
+    vl.vlm_material_overrides.remove(_override_index_for(vl)[_uid(col)])
+    invalidate_override_index(vl)
+    return True
+
+
+def iter_overrides(vl):
+    """有効なエントリを適用順（優先度の昇順、同じなら登録順）で返す"""
+    entries = [e for e in getattr(vl, "vlm_material_overrides", [])
+               if e.collection is not None and e.material is not None]
+    return sorted(entries, key=lambda e: e.priority)
+
+# --------------------------------------------------
+# ノードツリー走査（ノードグループの中まで）
+# --------------------------------------------------
+def iter_tree_nodes(nt, visited=None):
+    """ノードツリーのノードを列挙する。ノードグループは再帰し、同じツリーは 1 度だけ辿る"""
+    if visited is None:
+        visited = set()
+    if nt is None or nt in visited:
+        return
+    visited.add(nt)
+    for node in getattr(nt, "nodes", []):
+        yield node
+        if getattr(node, "type", "") == 'GROUP':
+            sub_tree = getattr(node, "node_tree", None)
+            if sub_tree:
+                yield from iter_tree_nodes(sub_tree, visited)
+
+# --------------------------------------------------
+# マテリアル バックアップ／復元（Scene.vlm_material_backup）
+#   * 表への書き込みは 1 回（パレット + int 配列 2 本 + 名前 1 本）
+#   * 読み出しは {オブジェクト名: [Material | None, ...]} に展開してメモリに持ち、
+#     書き込み・アンドゥ・ファイル読み込み・マテリアル数の変化と、
+#     行が指すマテリアルの削除（1 つ消して 1 つ足すと数は同じ）で捨てる
+# --------------------------------------------------
+_NAME_SEP = "\n"
+# シーン名 → (マテリアル数, {オブジェクト名: [Material | None, ...]}, {オブジェクト名: slot_materials 上の開始位置},
+#             行が指すマテリアルの集合)
+_backup_cache = {}
+
+
+def rows_palette(rows):
+    """行が指すマテリアルの集合（キャッシュの検証用）"""
+    return {m for mats in rows.values() for m in mats if m is not None}
+
+
+def materials_alive(materials):
+    """キャッシュに持っているマテリアルがどれも削除されていないか"""
+    try:
+        for mat in materials:
+            mat.name
+    except ReferenceError:
+        return False
+    return True
+
+
+def _scene_of(scene):
+    return scene if scene is not None else bpy.context.scene
+
+
+def read_backup(scene=None):
+    """バックアップ表を {オブジェクト名: [Material | None, ...]} で返す（読み取り専用として扱う）"""
+    scene = _scene_of(scene)
+    return _read_backup_rows(scene)[0]
+
+
+def _read_backup_rows(scene):
+    cached = _backup_cache.get(scene.name)
+    if cached is not None and cached[0] == len(bpy.data.materials) and materials_alive(cached[3]):
+        return cached[1], cached[2]
+
+    table = getattr(scene, "vlm_material_backup", None)
+    data, offsets = decode_rows(table) if table is not None else ({}, {})
+    _backup_cache[scene.name] = (len(bpy.data.materials), data, offsets, rows_palette(data))
+    return data, offsets
+
+
+def decode_rows(table):
+    """palette / object_names / int 配列を持つ表（バックアップ・スナップショット共通）を
+    ({オブジェクト名: [Material | None, ...]}, {オブジェクト名: 開始位置}) に展開する"""
+    data, offsets = {}, {}
+    if not table.object_names:
+        return data, offsets
+    names = table.object_names.split(_NAME_SEP)
+    # 行は pointer の今の名前で引く（保存後に改名されていても行が宙に浮かない）
+    if len(table.objects) == len(names):
+        names = [item.object.name if item.object is not None else name
+                 for item, name in zip(table.objects, names)]
+    counts = table["slot_counts"].to_list() if "slot_counts" in table else []
+    slots = table["slot_materials"].to_list() if "slot_materials" in table else []
+    # 番号 -1 は末尾の None を指す
+    lookup = [item.material for item in table.palette] + [None]
+    pos = 0
+    for name, n in zip(names, counts):
+        data[name] = [lookup[i] for i in slots[pos:pos + n]]
+        offsets[name] = pos
+        pos += n
+    return data, offsets
+
+
+def encode_rows(table, entries):
+    """{オブジェクト名: [Material | None, ...]} で表を丸ごと書き換え、開始位置を返す"""
+    palette = {}
+    names, counts, slots, offsets = [], [], [], {}
+    for name, mats in entries.items():
+        names.append(name)
+        counts.append(len(mats))
+        offsets[name] = len(slots)
+        slots.extend(-1 if m is None else palette.setdefault(m, len(palette)) for m in mats)
+
+    table.palette.clear()
+    for mat in palette:
+        table.palette.add().material = mat
+    objects = bpy.data.objects
+    table.objects.clear()
+    for name in names:
+        table.objects.add().object = objects.get(name)
+    table.object_names = _NAME_SEP.join(names)
+    for key, values in (("slot_counts", counts), ("slot_materials", slots)):
+        if values:
+            table[key] = values
+        elif key in table:
+            del table[key]
+    return offsets
+
+
+def _rebase_snapshots(scene, old, new, names):
+    # スナップショットはバックアップ表との差分なので、表が変わったら差分を付け替える
+    from . import material_snapshots
+    material_snapshots.rebase(scene, old, new, names)
+
+
+def write_backup(scene, entries):
+    """{オブジェクト名: [Material | None, ...]} で表を丸ごと置き換える"""
+    old = read_backup(scene)
+    offsets = encode_rows(scene.vlm_material_backup, entries)
+    new = {n: list(m) for n, m in entries.items()}
+    _backup_cache[scene.name] = (len(bpy.data.materials), new, offsets, rows_palette(new))
+    names = [n for n in old.keys() | new.keys() if old.get(n) != new.get(n)]
+    _rebase_snapshots(scene, old, new, names)
+
+
+def update_backup(scene, changed):
+    """{オブジェクト名: [Material | None, ...]} の行だけ差し替える。
+    既存の行でスロット数が同じなら int 配列をその場で書き換え、
+    そうでなければ（行の追加・スロット数の変化）表を作り直す。"""
+    if not changed:
+        return
+    data, offsets = _read_backup_rows(scene)
+    table = scene.vlm_material_backup
+    if any(name not in data or len(data[name]) != len(mats) for name, mats in changed.items()):
+        write_backup(scene, {**data, **changed})
+        return
+
+    old = {name: data[name] for name in changed}
+    palette = {item.material: i for i, item in enumerate(table.palette)}
+    arr = table["slot_materials"]
+    for name, mats in changed.items():
+        pos = offsets[name]
+        for i, mat in enumerate(mats):
+            if mat is None:
+                idx = -1
+            else:
+                idx = palette.get(mat)
+                if idx is None:
+                    idx = palette[mat] = len(table.palette)
+                    table.palette.add().material = mat
+            arr[pos + i] = idx
+        data[name] = list(mats)
+    _backup_cache[scene.name][3].update(rows_palette(changed))
+    _rebase_snapshots(scene, old, data, list(changed))
+
+
+def clear_backup(scene=None):
+    """バックアップ表を空にし、消したオブジェクト数を返す"""
+    scene = _scene_of(scene)
+    removed = len(read_backup(scene))
+    write_backup(scene, {})
+    return removed
+
+
+def invalidate_backup_cache():
+    _backup_cache.clear()
+    _mesh_users_cache.clear()
 
-        # すでにバックアップ済みならスキップ
-        if getattr(obj, "backup_materials", None) and obj.backup_materials:
-            continue
 
-        for slot in obj.material_slots:
-            item = obj.backup_materials.add()
-            item.material = slot.material
+def effective_backup(scene=None):
+    """バックアップ表に、適用中のスナップショット（あれば）の差分を重ねたもの。
+    レイヤー切替・復元はこれを「ベース」として扱う。"""
+    from . import material_snapshots
+    return material_snapshots.effective_rows(_scene_of(scene))
+
+
+# --------------------------------------------------
+# 先頭レイヤーでのスロット変更の追跡
+#   * depsgraph 更新で「先頭レイヤー上で更新されたメッシュ」の session_uid を貯めておき、
+#     先頭レイヤーを離れるときにその行だけ取り直す（全件の取り直しはしない）
+#   * オブジェクトの改名は msgbus で受け、名前で引いているキャッシュを捨てる
+#   * 読み込み直後・アドオン有効化直後は追跡できていないので、最初の 1 回は全件取り直す
+# --------------------------------------------------
+# シーン名 → 前回のバックアップ以降にスロットが変わったかもしれないオブジェクトの識別子（_uid）
+_dirty_backup = {}
+# このセッションで全件取り直し済み（以降は追跡で足りる）シーン名
+_backup_tracked = set()
+# DATA リンクのスロット変更はメッシュの更新として届くので、メッシュ → 利用オブジェクトを引く
+# {"key": (オブジェクト数, メッシュ数), "map": {メッシュ名: [オブジェクト名, ...]}}
+_mesh_users_cache = {}
+
+
+def refresh_dirty_backups(scene=None):
+    """追跡していたオブジェクトのうち、スロットが表と食い違うものだけ取り直す。
+    スナップショットを適用中なら、表ではなくそのスナップショットの差分へ入れる。
+    取り直したオブジェクト数を返す（全件取り直しのときはメッシュ数）。"""
+    from . import material_snapshots
+
+    scene = _scene_of(scene)
+    if scene.name not in _backup_tracked:
+        force_create_initial_backup(scene)
+        return len(read_backup(scene))
+
+    dirty = _dirty_backup.pop(scene.name, set())
+    data = effective_backup(scene)
+    changed = {}
+    if dirty:
+        for obj in bpy.data.objects:
+            if obj.type != 'MESH' or _uid(obj) not in dirty:
+                continue
+            mats = _current_materials(obj)
+            if data.get(obj.name) != mats:
+                changed[obj.name] = mats
+    snap = material_snapshots.active_snapshot(scene)
+    if snap is not None:
+        material_snapshots.update_snapshot_rows(scene, snap, changed)
+    else:
+        update_backup(scene, changed)
+    return len(changed)
+
+
+def _mesh_users(meshes):
+    """メッシュ名 → それを使うメッシュオブジェクト名（オブジェクト数・メッシュ数が変わったら作り直す）"""
+    key = (len(bpy.data.objects), len(bpy.data.meshes))
+    if _mesh_users_cache.get("key") != key or any(me.name not in _mesh_users_cache["map"] for me in meshes):
+        users = {}
+        for ob in bpy.data.objects:
+            if ob.type == 'MESH' and ob.data is not None:
+                users.setdefault(ob.data.name, []).append(ob.name)
+        _mesh_users_cache.update(key=key, map=users)
+    users = _mesh_users_cache["map"]
+    return [name for me in meshes for name in users.get(me.name, ())]
+
+
+@persistent
+def _track_backup_changes(scene, depsgraph=None):
+    """先頭レイヤーで更新されたメッシュオブジェクト（DATA リンクのスロットはメッシュの利用者）の
+    今のスロットを表と照合し、食い違うものだけ控える。
+    スロットの付け替えは transform + relations の更新として届くこともあるので、更新フラグでは絞らない。"""
+    if depsgraph is None or _operator_render_depth:
+        return
+    try:
+        if depsgraph.view_layer.name != scene.view_layers[0].name:
+            return
+    except (AttributeError, IndexError, ReferenceError):
+        return
+    if not (depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('MESH')):
+        return
+
+    names, meshes = set(), []
+    for upd in depsgraph.updates:
+        id_ = getattr(upd.id, "original", upd.id)
+        if isinstance(id_, bpy.types.Object):
+            if id_.type == 'MESH':
+                names.add(id_.name)
+        elif isinstance(id_, bpy.types.Mesh):
+            meshes.append(id_)
+    if meshes:
+        names.update(_mesh_users(meshes))
+    if not names:
+        return
+
+    dirty = _dirty_backup.setdefault(scene.name, set())
+    data = effective_backup(scene)
+    objects = bpy.data.objects
+    for name in names:
+        obj = objects.get(name)
+        if obj is not None and _uid(obj) not in dirty and data.get(name) != _current_materials(obj):
+            dirty.add(_uid(obj))
 
-        # 旧ロジック互換フラグ
-        obj[_backup_key(obj)] = ""
+
+def _current_materials(obj):
+    return [slot.material for slot in obj.material_slots]
+
+
+def backup_all_materials(scene=None):
+    """
+    まだバックアップが無いメッシュだけ表に追加する（表の書き込みは 1 回）。
+    パレットは pointer なのでマテリアル名を変更しても追随する
+    （必要なら［マテリアルバックアップ］で取り直す）。
+    """
+    scene = _scene_of(scene)
+    data = read_backup(scene)
+    missing = {obj.name: _current_materials(obj)
+               for obj in bpy.data.objects
+               if obj.type == 'MESH' and obj.name not in data}
+    if missing:
+        write_backup(scene, {**data, **missing})
 
 # _viewlayer_changed_handler 関数をこの内容に差し替えてください
 
@@ -97,6 +488,9 @@ def _viewlayer_changed_handler(depsgraph):
         return
 
     # 6) ここまで来たら「実際に切り替わった」ので適用
+    #    先頭レイヤーを離れるときは、そこで変わったスロットだけバックアップへ取り込む
+    if _prev_active_viewlayer_name == current_sc.view_layers[0].name:
+        refresh_dirty_backups(current_sc)
     _prev_active_viewlayer_name = name_now
 
     from . import light_camera
@@ -106,28 +500,14 @@ def _viewlayer_changed_handler(depsgraph):
     light_camera.apply_lights_for_viewlayer(current_vl)
     apply_render_override(current_sc, current_vl)
         
-def restore_all_materials():
-    """バックアップから直接 Material ポインタを復元"""
-    for obj in bpy.data.objects:
-        if obj.type != 'MESH' or not hasattr(obj, "backup_materials"):
-            continue
-        for i, item in enumerate(obj.backup_materials):
-            if i < len(obj.material_slots):
-                obj.material_slots[i].material = item.material
-
-
-def _set_collection_material(col: bpy.types.Collection,
-                             mat_name: str,
-                             view_layer: bpy.types.ViewLayer):
-    """コレクション内の可視 Mesh オブジェクトへ一括でマテリアルを設定"""
-    mat = bpy.data.materials.get(mat_name)
-    if not mat:
-        return  # 見つからなければスキップ
-
-    for obj in col.objects:
-        if obj.type == 'MESH' and obj.visible_get(view_layer=view_layer):
-            for slot in obj.material_slots:
-                slot.material = mat
+def restore_all_materials(scene=None):
+    """バックアップ表からスロットを復元する（差分のあるスロットだけ書く）"""
+    objects = bpy.data.objects
+    for name, mats in effective_backup(scene).items():
+        obj = objects.get(name)
+        if obj is not None and obj.type == 'MESH':
+            _write_slot_materials(obj, mats)
+
 
 def _iter_layer_collections_recursive(layer_coll):
     """
@@ -141,98 +521,75 @@ def _iter_layer_collections_recursive(layer_coll):
 # --------------------------------------------------
 # ViewLayer ごとのマテリアル上書きロジック
 # --------------------------------------------------
-def _apply_overrides_for_viewlayer(view_layer: bpy.types.ViewLayer):
+def _target_materials(view_layer: bpy.types.ViewLayer):
     """
-    指定ビューレイヤーに対し、
-    オーバーライドキーを持つコレクションのみ
-    マテリアルを再設定する。
+    このビューレイヤーで表示される Mesh ごとの「あるべき」スロット割り当て
+    {obj: [Material | None, ...]}。バックアップ（ベース）の上に、
+    レジストリの上書きを優先度順に重ねる（後勝ち）。先頭レイヤーは上書きなし。
     """
-    # ★ 修正: 一番上のビューレイヤーでは何もしない
-    if view_layer.name == bpy.context.scene.view_layers[0].name:
-        return
-        
-    for lc in _iter_layer_collections_recursive(view_layer.layer_collection):
-        col = lc.collection
-        key = _override_key(view_layer.name, col.name)
-        if key in col:
-            _set_collection_material(col, col[key], view_layer)
+    scene = view_layer.id_data
+    backup = effective_backup(scene)
+    targets = {}
+    for obj in visibility_index.visible_objects(view_layer, 'MESH'):
+        base = backup.get(obj.name)
+        if base is not None:
+            targets[obj] = base
+
+    if view_layer.name == scene.view_layers[0].name:
+        return targets
+    for entry in iter_overrides(view_layer):
+        for obj in visibility_index.visible_in_collection(view_layer, entry.collection, 'MESH'):
+            targets[obj] = [entry.material] * len(obj.material_slots)
+    return targets
+
+
+def _write_slot_materials(obj, materials):
+    """現在の割り当てと違うスロットだけ書き、書いたスロット数を返す"""
+    written = 0
+    slots = obj.material_slots
+    for i, mat in enumerate(materials[:len(slots)]):
+        if slots[i].material != mat:
+            slots[i].material = mat
+            written += 1
+    return written
+
 
 def _apply_selective_material_overrides(view_layer: bpy.types.ViewLayer):
     """
     1) 初回だけバックアップを確保（既にあればスキップ）
-    2) アクティブ ViewLayer 全体をバックアップへロールバック
-    3) 当該 ViewLayer のコレクション単位オーバーライドを再適用
+    2) 当該 ViewLayer の目標割り当て（ベース＋コレクション単位オーバーライド）を計算
+    3) 現在の割り当てと差分のあるスロットだけ書き換える
+       （上書き 1 件だけ違うレイヤー間の切替では、そのオブジェクトしか触らない）
+    書き換えたスロット数を返す。
     """
-    backup_all_materials()                     # ❶ バックアップ（初回のみ）
-    _restore_viewlayer_materials(view_layer)   # ❷ まず全部「元に戻す」
-    _apply_overrides_for_viewlayer(view_layer) # ❸ その上でオーバーライド
+    backup_all_materials(view_layer.id_data)
+    written = 0
+    for obj, materials in _target_materials(view_layer).items():
+        written += _write_slot_materials(obj, materials)
+    return written
 
 def apply_active_viewlayer_overrides(context):
     """アクティブなビューレイヤーにマテリアルオーバーライドを適用"""
     _apply_selective_material_overrides(context.view_layer)
 
-def force_create_initial_backup():
+def force_create_initial_backup(scene=None):
     """既存のバックアップを削除して新しくバックアップを作成"""
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH':
-            # 既存のバックアップキーを削除
-            key = _backup_key(obj)
-            if key in obj:
-                del obj[key]
-    # 新しくバックアップを作成
-    backup_all_materials()
-
-def _restore_collection_materials(collection: bpy.types.Collection,
-                                  view_layer: bpy.types.ViewLayer):
-    """
-    指定コレクションに属する Mesh オブジェクトを
-    pointer バックアップから復元する（文字列バックアップはフォールバック用）
-    """
-    for obj in collection.all_objects:
-        if obj.type != 'MESH' or not obj.visible_get(view_layer=view_layer):
-            continue
-
-        # --- pointer があれば優先 ---
-        if getattr(obj, "backup_materials", None) and obj.backup_materials:
-            for i, item in enumerate(obj.backup_materials):
-                if i < len(obj.material_slots):
-                    obj.material_slots[i].material = item.material
-            obj.update_tag()
-            continue  # pointer で復元済み
-
-        # --- 旧式（文字列）バックアップが残っている場合のみフォールバック ---
-        key = _backup_key(obj)
-        if key in obj:
-            names = obj[key].split(",")
-            for i, name in enumerate(names):
-                if i < len(obj.material_slots):
-                    obj.material_slots[i].material = bpy.data.materials.get(name) if name else None
-            obj.update_tag()
-
+    scene = _scene_of(scene)
+    clear_backup(scene)
+    backup_all_materials(scene)
+    _dirty_backup.pop(scene.name, None)
+    _backup_tracked.add(scene.name)
 
 def _restore_viewlayer_materials(view_layer: bpy.types.ViewLayer):
     """
     アクティブ ViewLayer で *表示されている* 全オブジェクトを
     バックアップ状態に戻す。
     """
-    for obj in bpy.data.objects:
-        if obj.type != 'MESH':
-            continue
-        if not obj.visible_get(view_layer=view_layer):
-            continue
-        # ポインタ方式
-        if getattr(obj, "backup_materials", None) and obj.backup_materials:
-            for i, item in enumerate(obj.backup_materials):
-                if i < len(obj.material_slots):
-                    obj.material_slots[i].material = item.material
-            continue
-        # 文字列バックアップ（旧形式）のフォールバック
-        key = _backup_key(obj)
-        if key in obj:
-            names = obj[key].split(",")
-            for i, name in enumerate(names):
-                if i < len(obj.material_slots):
-                    obj.material_slots[i].material = bpy.data.materials.get(name) if name else None
+    backup = effective_backup(view_layer.id_data)
+    for obj in visibility_index.visible_objects(view_layer, 'MESH'):
+        base = backup.get(obj.name)
+        if base is not None:
+            _write_slot_materials(obj, base)
 
 # --------------------------------------------------
 # マテリアル上書き関連オペレーター
@@ -250,7 +607,12 @@ class COLMATERIAL_OT_set_collection_override(bpy.types.Operator):
         from . import light_camera
         
         col = bpy.data.collections[self.collection_name]
-        col[_override_key(self.layer_name, self.collection_name)] = self.material_name
+        vl = context.scene.view_layers[self.layer_name]
+        mat = bpy.data.materials.get(self.material_name)
+        if mat is None:
+            self.report({'ERROR'}, f"Material not found: {self.material_name}")
+            return {'CANCELLED'}
+        set_override(vl, col, mat)
         apply_active_viewlayer_overrides(context)
         # ライト設定も適用
         light_camera.apply_lights_for_viewlayer(context.view_layer)
@@ -268,16 +630,11 @@ class COLMATERIAL_OT_clear_collection_override(bpy.types.Operator):
         col         = bpy.data.collections[self.collection_name]
         view_layer  = context.scene.view_layers[self.layer_name]
 
-        # ① この ViewLayer 用のオーバーライドキーを削除
-        key = _override_key(self.layer_name, self.collection_name)
-        if key in col:
-            del col[key]
-
-        # ② 該当コレクションだけを元に戻す
-        _restore_collection_materials(col, view_layer)
+        # ① この ViewLayer 用のオーバーライドを削除
+        clear_override(view_layer, col)
 
-        # ③ レイヤー全体で必要なオーバーライドを再適用
-        _apply_overrides_for_viewlayer(view_layer)
+        # ② 目標割り当てとの差分だけ書き戻す（該当コレクション以外は触らない）
+        _apply_selective_material_overrides(view_layer)
 
         return {'FINISHED'}
 
@@ -301,21 +658,8 @@ class VLM_OT_backup_materials_current(bpy.types.Operator):
             return False
 
     def execute(self, context):
-        # 既存バックアップを全クリア
-        for obj in bpy.data.objects:
-            if obj.type != 'MESH':
-                continue
-            if getattr(obj, "backup_materials", None):
-                obj.backup_materials.clear()
-            key = _backup_key(obj)
-            if key in obj:
-                try:
-                    del obj[key]
-                except Exception:
-                    pass
-
-        # 今の見た目をそのまま保存
-        backup_all_materials()
+        # 既存バックアップを捨てて、今の見た目をそのまま保存
+        force_create_initial_backup(context.scene)
         self.report({'INFO'}, "現在の見た目でマテリアルバックアップを更新しました")
         return {'FINISHED'}
 
@@ -335,12 +679,7 @@ def _visible_collections_in_viewlayer(vl: bpy.types.ViewLayer):
 def _overridden_collections_for(vl: bpy.types.ViewLayer):
     """この ViewLayer 名でオーバーライド指定のある Collection を（可視ツリー内に限って）返す"""
     vis_cols = _visible_collections_in_viewlayer(vl)
-    over = set()
-    for col in vis_cols:
-        key = _override_key(vl.name, col.name)
-        if key in col:
-            over.add(col)
-    return over
+    return {e.collection for e in iter_overrides(vl) if e.collection in vis_cols}
 
 class VLM_OT_backup_materials_base(bpy.types.Operator):
     bl_idname = "vlm.backup_materials_base"
@@ -362,11 +701,12 @@ class VLM_OT_backup_materials_base(bpy.types.Operator):
 
     def execute(self, context):
         vl = context.view_layer
+        backup = read_backup(context.scene)
         vis_cols = _visible_collections_in_viewlayer(vl)
         overridden_cols = _overridden_collections_for(vl)
 
         # 1) まず各オブジェクトごとに「保存候補のマテリアル配列」を作っておく
-        plan = {}  # obj -> [mat0, mat1, ...]
+        plan = {}  # オブジェクト名 -> [mat0, mat1, ...]
         fallback_used = False
 
         def obj_in_overridden(o: bpy.types.Object) -> bool:
@@ -380,37 +720,20 @@ class VLM_OT_backup_materials_base(bpy.types.Operator):
             if obj.type != 'MESH':
                 continue
 
-            # 既存ベース（Pointerバックアップ）があるか
-            has_base = bool(getattr(obj, "backup_materials", None) and obj.backup_materials)
+            # 既存ベース（バックアップ表の行）があるか
+            base = backup.get(obj.name)
 
-            if obj_in_overridden(obj) and has_base:
+            if obj_in_overridden(obj) and base is not None:
                 # オーバーライド対象だがベースを持っている ⇒ ベースを採用
-                mats = [item.material for item in obj.backup_materials]
-                plan[obj] = mats
+                plan[obj.name] = list(base)
             else:
                 # それ以外は「今の見た目」を採用（※ベース無いオブジェクトはここに来る）
-                mats = [slot.material for slot in obj.material_slots]
-                plan[obj] = mats
-                if obj_in_overridden(obj) and not has_base:
+                plan[obj.name] = _current_materials(obj)
+                if obj_in_overridden(obj) and base is None:
                     fallback_used = True
 
-        # 2) 既存バックアップを一括クリア
-        for obj in plan.keys():
-            if getattr(obj, "backup_materials", None):
-                obj.backup_materials.clear()
-            key = _backup_key(obj)
-            if key in obj:
-                try:
-                    del obj[key]
-                except Exception:
-                    pass
-
-        # 3) 計画どおりに新しいバックアップを書き込み（Pointer方式）
-        for obj, mats in plan.items():
-            for m in mats:
-                itm = obj.backup_materials.add()
-                itm.material = m
-            obj[_backup_key(obj)] = ""  # 旧方式互換フラグ
+        # 2) 計画どおりに表を丸ごと置き換える（書き込みは 1 回）
+        write_backup(context.scene, plan)
 
         msg = "ベース状態（オーバーライド無視）でマテリアルバックアップを更新しました"
         if fallback_used:
@@ -440,25 +763,10 @@ class VLM_OT_force_backup_materials(bpy.types.Operator):
             return False
 
     def execute(self, context):
-        # 1) 既存バックアップを全消去（PointerProperty も旧キーも）
-        for obj in bpy.data.objects:
-            if obj.type != 'MESH':
-                continue
-            # PointerProperty（新方式）
-            if getattr(obj, "backup_materials", None):
-                obj.backup_materials.clear()
-            # 旧形式の文字列キー
-            key = _backup_key(obj)
-            if key in obj:
-                try:
-                    del obj[key]
-                except Exception:
-                    pass
-
-        # 2) 今の見た目をそのまま保存（上書き）
-        #    ※ backup_all_materials() は「未保存のものだけ」保存する仕様なので、
-        #       先にクリアしてから呼び出すのがポイント
-        backup_all_materials()  # ←「現在のスロット割当」を保存します
+        # 既存バックアップを捨てて、今の見た目（現在のスロット割当）をそのまま保存
+        #   ※ backup_all_materials() は「未保存のものだけ」保存する仕様なので、
+        #      先にクリアしてから呼び出すのがポイント
+        force_create_initial_backup(context.scene)
 
         self.report({'INFO'}, "現在の状態でマテリアルバックアップを更新しました")
         return {'FINISHED'}
@@ -470,7 +778,7 @@ class VLM_OT_restore_materials(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
-        restore_all_materials()
+        restore_all_materials(context.scene)
         self.report({'INFO'}, "マテリアルを復元しました")
         return {'FINISHED'}
 
@@ -489,40 +797,143 @@ class VLM_OT_clear_backup_materials(bpy.types.Operator):
             return False
 
     def execute(self, context):
-        from .material_override import _backup_key
-        removed = 0
-        for obj in bpy.data.objects:
-            if _backup_key(obj) in obj:
-                del obj[_backup_key(obj)]
-                removed += 1
+        removed = clear_backup(context.scene)
         self.report({'INFO'}, f"クリアされたオブジェクト数: {removed}")
         return {'FINISHED'}
 
 # --------------------------------------------------
-# レンダリング直前ハンドラ
+# レンダー時オーバーライド（ネイティブ F12 / Ctrl+F12 / コマンドライン）
+#   * render_pre で「描かれるレイヤー」のマテリアル・ライトを適用
+#   * render_complete / render_cancel でビューポートのレイヤーの状態へ戻す
+#   * アドオン自身のレンダー（operator_render 内）では何もしない
 # --------------------------------------------------
+_operator_render_depth = 0
+# 適用中の状態 {"key": (シーン名, VL名), "viewport": ビューポートのVL名}
+_render_time_state = {}
+
+
+@contextmanager
+def operator_render():
+    """アドオンのレンダーオペレーターが bpy.ops.render.render を囲む。
+    オーバーライドは呼び出し側で適用済みなので、ハンドラは素通りさせる。"""
+    global _operator_render_depth
+    _operator_render_depth += 1
+    try:
+        yield
+    finally:
+        _operator_render_depth -= 1
+
+
+def _lock_interface_update(self, context):
+    # レンダージョブのスレッドからデータを書き換えるため、UI をロックしておく
+    if self.vlm_render_time_overrides:
+        self.render.use_lock_interface = True
+
+
+def _rendered_view_layer(scene):
+    """ネイティブレンダーで描かれるVL。複数レイヤーが有効で決められなければ None。
+    （マテリアルはオブジェクト共有なので、1 フレーム内でレイヤーごとに切り替えられない）"""
+    if scene.render.use_single_layer:
+        try:
+            return bpy.context.view_layer
+        except AttributeError:
+            return None
+    used = [vl for vl in scene.view_layers if vl.use]
+    return used[0] if len(used) == 1 else None
+
+
 @persistent
-def _render_pre(scene):
-    """レンダリング開始直前に呼ばれるハンドラ
-    
-    他のアドオンの影響を受けないよう、最後に実行されることを前提とした処理
-    1. 現在のマテリアル状態をバックアップ
-    2. 選択的にマテリアルを復元・オーバーライド適用
-    3. ライト／カメラ可視設定を適用
-    """
+def _render_pre(scene, _depsgraph=None):
     from . import light_camera
-    
-    # 初回バックアップ作成（既存があれば上書きしない）
-    backup_all_materials()
-    
-    # オーバーライド指定があるオブジェクトのみ選択的に処理
-    _apply_selective_material_overrides(bpy.context.view_layer)
-    
-    # ライト設定適用
-    # ★ light_camera.py に apply_lights_visibility 関数が存在しないためコメントアウト
-    # light_camera.apply_lights_visibility(bpy.context)
-    # 代わりに apply_lights_for_viewlayer を使うのが適切かもしれません
-    light_camera.apply_lights_for_viewlayer(bpy.context.view_layer)
+
+    if _operator_render_depth or not getattr(scene, "vlm_render_time_overrides", False):
+        return
+    if not (bpy.app.background or scene.render.use_lock_interface):
+        print("VLM: render-time overrides skipped (enable Lock Interface)")
+        return
+    vl = _rendered_view_layer(scene)
+    if vl is None:
+        print("VLM: render-time overrides skipped (multiple view layers enabled)")
+        return
+
+    key = (scene.name, vl.name)
+    # アニメーションでは毎フレーム呼ばれるが、適用はジョブにつき 1 回
+    if _render_time_state.get("key") == key:
+        return
+    if not _render_time_state:
+        try:
+            _render_time_state["viewport"] = bpy.context.window.view_layer.name
+        except AttributeError:
+            _render_time_state["viewport"] = vl.name
+    _render_time_state["key"] = key
+
+    _apply_selective_material_overrides(vl)
+    light_camera.apply_lights_for_viewlayer(vl, do_view_update=False)
+
+
+def _restore_render_time_overrides(scene_name, viewport_name):
+    from . import light_camera
+
+    sc = bpy.data.scenes.get(scene_name)
+    vl = sc.view_layers.get(viewport_name) if sc else None
+    if vl is None:
+        return None
+    _apply_selective_material_overrides(vl)
+    light_camera.apply_lights_for_viewlayer(vl, do_view_update=False)
+    return None
+
+
+@persistent
+def _render_finished(scene, _depsgraph=None):
+    if _operator_render_depth or not _render_time_state:
+        return
+    state = dict(_render_time_state)
+    _render_time_state.clear()
+    scene_name, layer_name = state["key"]
+    if layer_name == state["viewport"]:
+        return
+    if bpy.app.background:
+        _restore_render_time_overrides(scene_name, state["viewport"])
+    else:
+        # ジョブのスレッドではなくメインスレッドで戻す
+        bpy.app.timers.register(
+            functools.partial(_restore_render_time_overrides, scene_name, state["viewport"]),
+            first_interval=0.0,
+        )
+
+
+@persistent
+def _reset_backup_cache(_dummy=None):
+    invalidate_backup_cache()
+
+
+# msgbus の購読者（ファイル読み込みで購読が消えるので load_post で張り直す）
+_rename_owner = object()
+
+
+def _on_object_renamed():
+    """行は pointer で持っているので、名前で展開したキャッシュを捨てれば新しい名前で引き直せる"""
+    from . import material_snapshots
+    invalidate_backup_cache()
+    material_snapshots._rows_cache.clear()
+
+
+def _subscribe_renames():
+    bpy.msgbus.clear_by_owner(_rename_owner)
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.Object, "name"),
+        owner=_rename_owner,
+        args=(),
+        notify=_on_object_renamed,
+    )
+
+
+@persistent
+def _load_post_backup(_dummy=None):
+    _dirty_backup.clear()
+    _backup_tracked.clear()
+    _mesh_users_cache.clear()
+    _subscribe_renames()
 
 
 # --------------------------------------------------
@@ -535,21 +946,46 @@ classes = (
     VLM_OT_backup_materials_base,
     VLM_OT_force_backup_materials,
     VLM_OT_restore_materials,
+    VLM_OT_clear_backup_materials,
 )
 
 def register():
     # ① PropertyGroup 登録
     bpy.utils.register_class(MaterialBackupItem)
-    # ② Object にコレクションプロパティを追加
+    bpy.utils.register_class(ObjectBackupItem)
+    bpy.utils.register_class(VLM_PG_material_backup)
+    bpy.utils.register_class(VLM_PG_material_override)
+    bpy.types.ViewLayer.vlm_material_overrides = CollectionProperty(type=VLM_PG_material_override)
+    # ② バックアップ表（Scene）。Object 側は旧形式の読み出し（マイグレーション）専用
+    bpy.types.Scene.vlm_material_backup = PointerProperty(type=VLM_PG_material_backup)
     bpy.types.Object.backup_materials = CollectionProperty(type=MaterialBackupItem)
 
     # 既存の operators 登録
     for c in classes:
         bpy.utils.register_class(c)
 
-    # ── render_pre ハンドラを最後に追加 ──
-    #if _render_pre not in bpy.app.handlers.render_pre:
-    #    bpy.app.handlers.render_pre.append(_render_pre)
+    bpy.types.Scene.vlm_render_time_overrides = BoolProperty(
+        name="Render-Time Overrides",
+        description="通常の F12 / Ctrl+F12 / コマンドラインのレンダーでも、描くレイヤーのマテリアル・ライト設定を適用する",
+        default=False,
+        update=_lock_interface_update,
+    )
+
+    # ── レンダー時オーバーライドのハンドラ（他アドオンより後に実行） ──
+    if _render_pre not in bpy.app.handlers.render_pre:
+        bpy.app.handlers.render_pre.append(_render_pre)
+    for h in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if _render_finished not in h:
+            h.append(_render_finished)
+
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset_backup_cache not in h:
+            h.append(_reset_backup_cache)
+    if _load_post_backup not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_load_post_backup)
+    if _track_backup_changes not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_track_backup_changes)
+    _subscribe_renames()
 
     # ── depsgraph 更新ハンドラを追加 ──
     if _viewlayer_changed_handler not in bpy.app.handlers.depsgraph_update_post:
@@ -557,9 +993,28 @@ def register():
 
 
 def unregister():
-    # render_pre ハンドラ解除
+    # レンダー時オーバーライドのハンドラ解除
     if _render_pre in bpy.app.handlers.render_pre:
         bpy.app.handlers.render_pre.remove(_render_pre)
+    for h in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if _render_finished in h:
+            h.remove(_render_finished)
+    _render_time_state.clear()
+    if hasattr(bpy.types.Scene, "vlm_render_time_overrides"):
+        del bpy.types.Scene.vlm_render_time_overrides
+
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset_backup_cache in h:
+            h.remove(_reset_backup_cache)
+    if _load_post_backup in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_load_post_backup)
+    if _track_backup_changes in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_track_backup_changes)
+    bpy.msgbus.clear_by_owner(_rename_owner)
+    _backup_cache.clear()
+    _dirty_backup.clear()
+    _backup_tracked.clear()
+    _mesh_users_cache.clear()
 
     # depsgraph 更新ハンドラ解除
     if _viewlayer_changed_handler in bpy.app.handlers.depsgraph_update_post:
@@ -569,4 +1024,11 @@ def unregister():
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
     del bpy.types.Object.backup_materials
-    bpy.utils.unregister_class(MaterialBackupItem)
\ No newline at end of file
+    del bpy.types.Scene.vlm_material_backup
+    bpy.utils.unregister_class(VLM_PG_material_backup)
+    bpy.utils.unregister_class(ObjectBackupItem)
+    bpy.utils.unregister_class(MaterialBackupItem)
+    if hasattr(bpy.types.ViewLayer, "vlm_material_overrides"):
+        del bpy.types.ViewLayer.vlm_material_overrides
+    bpy.utils.unregister_class(VLM_PG_material_override)
+    _override_index.clear()
\ No newline at end of file
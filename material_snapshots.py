@@ -0,0 +1,322 @@
+# material_snapshots.py
+#
+# 名前付きのマテリアル割り当てスナップショット（ルックデブのバリエーション切替用）
+#   - Scene.vlm_material_backup（ベース）との差分だけを、同じ形式の表（パレット + int 配列）で持つ
+#   - 切替は「前のスナップショットと次のスナップショットの差分行の和集合」だけ書き換える
+#   - 適用中のスナップショットはレイヤー切替・復元の「ベース」として扱われる
+#     （material_override.effective_backup）。先頭レイヤーでの変更もそこへ入る
+#   - ベースの表が書き換わったら、各スナップショットの見た目が変わらないよう差分を付け替える
+# ------------------------------------------------------------
+
+import bpy
+from bpy.app.handlers import persistent
+from bpy.props import CollectionProperty, IntProperty, StringProperty
+from bpy.types import PropertyGroup
+
+from . import material_override
+from .material_override import (
+    MaterialBackupItem, ObjectBackupItem, decode_rows, encode_rows, materials_alive, rows_palette,
+)
+
+# (シーン名, スナップショット名) → (版, マテリアル数, {オブジェクト名: [Material | None, ...]}, 行が指すマテリアルの集合)
+_rows_cache = {}
+
+
+class VLM_PG_material_snapshot(PropertyGroup):
+    """ベースとの差分。name は PropertyGroup 標準のものを使う"""
+    version: IntProperty(name="Version", default=0, description="取り直し・付け替えのたびに増える")
+    object_count: IntProperty(name="Objects", default=0, description="ベースと異なるオブジェクト数")
+    palette: CollectionProperty(type=MaterialBackupItem)
+    objects: CollectionProperty(type=ObjectBackupItem)
+    object_names: StringProperty(default="")
+
+
+# ──────────────────────────────────────────────
+# ① 読み書き
+# ──────────────────────────────────────────────
+def find_snapshot(scene, name):
+    return scene.vlm_material_snapshots.get(name) if name else None
+
+
+def active_snapshot(scene):
+    return find_snapshot(scene, getattr(scene, "vlm_material_snapshot_active", ""))
+
+
+def snapshot_rows(scene, snap):
+    """スナップショットの差分 {オブジェクト名: [Material | None, ...]}（読み取り専用として扱う）"""
+    key = (scene.name, snap.name)
+    cached = _rows_cache.get(key)
+    if (cached is not None and cached[:2] == (snap.version, len(bpy.data.materials))
+            and materials_alive(cached[3])):
+        return cached[2]
+    rows = decode_rows(snap)[0]
+    _rows_cache[key] = (snap.version, len(bpy.data.materials), rows, rows_palette(rows))
+    return rows
+
+
+def _write_rows(scene, snap, rows):
+    encode_rows(snap, rows)
+    snap.object_count = len(rows)
+    snap.version += 1
+    _rows_cache[(scene.name, snap.name)] = (snap.version, len(bpy.data.materials), rows, rows_palette(rows))
+
+
+def effective_rows(scene, snap=None):
+    """ベースにスナップショット（省略時は適用中のもの）の差分を重ねた割り当て"""
+    base = material_override.read_backup(scene)
+    if snap is None:
+        snap = active_snapshot(scene)
+    if snap is None:
+        return base
+    delta = snapshot_rows(scene, snap)
+    return {**base, **delta} if delta else base
+
+
+def update_snapshot_rows(scene, snap, changed):
+    """指定行をこのスナップショットの見た目として取り込む（ベースと同じになった行は差分から外す）"""
+    if not changed:
+        return
+    base = material_override.read_backup(scene)
+    rows = dict(snapshot_rows(scene, snap))
+    for name, mats in changed.items():
+        if base.get(name) == mats:
+            rows.pop(name, None)
+        else:
+            rows[name] = list(mats)
+    _write_rows(scene, snap, rows)
+
+
+def rebase(scene, old, new, names):
+    """ベースの names 行が old → new に変わったとき、各スナップショットの見た目を保つ"""
+    snaps = getattr(scene, "vlm_material_snapshots", None)
+    if not snaps or not names:
+        return
+    for snap in snaps:
+        rows = snapshot_rows(scene, snap)
+        updated = dict(rows)
+        for name in names:
+            if name in rows:
+                look = rows[name]
+            elif name in old:
+                look = old[name]
+            else:
+                continue
+            if new.get(name) == look:
+                updated.pop(name, None)
+            else:
+                updated[name] = look
+        if updated != rows:
+            _write_rows(scene, snap, updated)
+
+
+def capture_snapshot(scene, name):
+    """今のスロット割り当てを name のスナップショットとして保存（同名は取り直し）し、適用中にする"""
+    material_override.backup_all_materials(scene)
+    base = material_override.read_backup(scene)
+    rows = {}
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+        mats = [slot.material for slot in obj.material_slots]
+        if base.get(obj.name) != mats:
+            rows[obj.name] = mats
+    snap = find_snapshot(scene, name)
+    if snap is None:
+        snap = scene.vlm_material_snapshots.add()
+        snap.name = name
+    _write_rows(scene, snap, rows)
+    scene.vlm_material_snapshot_active = snap.name
+    return snap
+
+
+def apply_snapshot(scene, snap, view_layer):
+    """snap（None でベース）へ切り替え、書き換えたスロット数を返す。
+    先頭レイヤーでは前後の差分行だけを書き、それ以外のレイヤーでは上書きを重ね直す。"""
+    prev = active_snapshot(scene)
+    names = set(snapshot_rows(scene, prev)) if prev is not None else set()
+    if snap is not None:
+        names |= set(snapshot_rows(scene, snap))
+    scene.vlm_material_snapshot_active = snap.name if snap is not None else ""
+
+    if view_layer != scene.view_layers[0]:
+        return material_override._apply_selective_material_overrides(view_layer)
+
+    target = effective_rows(scene, snap) if snap is not None else material_override.read_backup(scene)
+    objects = bpy.data.objects
+    written = 0
+    for name in names:
+        obj = objects.get(name)
+        mats = target.get(name)
+        if obj is not None and obj.type == 'MESH' and mats is not None:
+            written += material_override._write_slot_materials(obj, mats)
+    return written
+
+
+def compare_snapshots(scene, a, b):
+    """a と b（None でベース）で割り当てが異なるオブジェクト名"""
+    base = material_override.read_backup(scene)
+    rows_a = snapshot_rows(scene, a) if a is not None else {}
+    rows_b = snapshot_rows(scene, b) if b is not None else {}
+    return sorted(
+        name for name in rows_a.keys() | rows_b.keys()
+        if rows_a.get(name, base.get(name)) != rows_b.get(name, base.get(name))
+    )
+
+
+def remove_snapshot(scene, name):
+    snaps = scene.vlm_material_snapshots
+    idx = snaps.find(name)
+    if idx < 0:
+        return False
+    snaps.remove(idx)
+    _rows_cache.pop((scene.name, name), None)
+    return True
+
+
+# ──────────────────────────────────────────────
+# ② オペレーター
+# ──────────────────────────────────────────────
+def _label(snap):
+    return snap.name if snap is not None else "ベース"
+
+
+def _refresh_top_layer(context):
+    # 先頭レイヤーで作業中の変更は、切替前に今の見た目へ取り込んでおく
+    sc = context.scene
+    if context.view_layer == sc.view_layers[0]:
+        material_override.refresh_dirty_backups(sc)
+
+
+class VLM_OT_capture_material_snapshot(bpy.types.Operator):
+    bl_idname = "vlm.capture_material_snapshot"
+    bl_label = "スナップショットを保存"
+    bl_description = "今のマテリアル割り当てを名前付きで保存する（ベースとの差分だけを持つ）。同名は取り直し"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    snapshot_name: StringProperty(name="Name", default="")
+
+    def invoke(self, context, event):
+        if self.snapshot_name:
+            return self.execute(context)
+        self.snapshot_name = f"Look {len(context.scene.vlm_material_snapshots) + 1}"
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        name = self.snapshot_name.strip()
+        if not name:
+            self.report({'WARNING'}, "名前を入力してください")
+            return {'CANCELLED'}
+        if context.view_layer != context.scene.view_layers[0]:
+            self.report({'WARNING'}, "先頭のビューレイヤーで保存してください（上書きが混ざるため）")
+            return {'CANCELLED'}
+        snap = capture_snapshot(context.scene, name)
+        self.report({'INFO'}, f"{snap.name} を保存しました（v{snap.version}、差分 {snap.object_count} オブジェクト）")
+        return {'FINISHED'}
+
+
+class VLM_OT_apply_material_snapshot(bpy.types.Operator):
+    bl_idname = "vlm.apply_material_snapshot"
+    bl_label = "スナップショットを適用"
+    bl_description = "保存したマテリアル割り当てへ一括で切り替える（空欄でベースに戻す）"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    snapshot_name: StringProperty(default="")
+
+    def execute(self, context):
+        sc = context.scene
+        snap = find_snapshot(sc, self.snapshot_name)
+        if self.snapshot_name and snap is None:
+            self.report({'WARNING'}, f"スナップショットが見つかりません: {self.snapshot_name}")
+            return {'CANCELLED'}
+        _refresh_top_layer(context)
+        written = apply_snapshot(sc, snap, context.view_layer)
+        self.report({'INFO'}, f"{_label(snap)} に切り替えました（{written} スロット）")
+        return {'FINISHED'}
+
+
+class VLM_OT_compare_material_snapshot(bpy.types.Operator):
+    bl_idname = "vlm.compare_material_snapshot"
+    bl_label = "スナップショットを比較"
+    bl_description = "適用中のスナップショット（無ければベース）と割り当てが異なるオブジェクトを調べる"
+    bl_options = {'REGISTER'}
+
+    snapshot_name: StringProperty(default="")
+
+    def execute(self, context):
+        sc = context.scene
+        snap = find_snapshot(sc, self.snapshot_name)
+        other = active_snapshot(sc)
+        names = compare_snapshots(sc, other, snap)
+        if names:
+            print(f"VLM: snapshot diff {_label(other)} -> {_label(snap)}: {', '.join(names)}")
+            self.report({'INFO'}, f"{_label(other)} と {_label(snap)}: {len(names)} オブジェクトが異なります（詳細はコンソール）")
+        else:
+            self.report({'INFO'}, f"{_label(other)} と {_label(snap)} は同じ割り当てです")
+        return {'FINISHED'}
+
+
+class VLM_OT_remove_material_snapshot(bpy.types.Operator):
+    bl_idname = "vlm.remove_material_snapshot"
+    bl_label = "スナップショットを削除"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    snapshot_name: StringProperty(default="")
+
+    def execute(self, context):
+        sc = context.scene
+        snap = find_snapshot(sc, self.snapshot_name)
+        if snap is None:
+            return {'CANCELLED'}
+        # 適用中なら先にベースへ戻す
+        if snap == active_snapshot(sc):
+            _refresh_top_layer(context)
+            apply_snapshot(sc, None, context.view_layer)
+        remove_snapshot(sc, self.snapshot_name)
+        self.report({'INFO'}, f"{self.snapshot_name} を削除しました")
+        return {'FINISHED'}
+
+
+# ──────────────────────────────────────────────
+# register / unregister
+# ──────────────────────────────────────────────
+@persistent
+def _reset_cache(_dummy=None):
+    _rows_cache.clear()
+
+
+classes = (
+    VLM_PG_material_snapshot,
+    VLM_OT_capture_material_snapshot,
+    VLM_OT_apply_material_snapshot,
+    VLM_OT_compare_material_snapshot,
+    VLM_OT_remove_material_snapshot,
+)
+
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    bpy.types.Scene.vlm_material_snapshots = CollectionProperty(type=VLM_PG_material_snapshot)
+    bpy.types.Scene.vlm_material_snapshot_active = StringProperty(
+        name="Active Snapshot",
+        description="適用中のマテリアルスナップショット（空ならベース）",
+        default="",
+    )
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset_cache not in h:
+            h.append(_reset_cache)
+
+
+def unregister():
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset_cache in h:
+            h.remove(_reset_cache)
+    _rows_cache.clear()
+    for nm in ("vlm_material_snapshots", "vlm_material_snapshot_active"):
+        if hasattr(bpy.types.Scene, nm):
+            delattr(bpy.types.Scene, nm)
+    for c in reversed(classes):
+        try:
+            bpy.utils.unregister_class(c)
+        except RuntimeError:
+            pass
@@ -3,6 +3,10 @@
 # ビューレイヤーごとのレンダー設定 + カメラ / フォーマット / フレーム範囲オーバーライド
 # ------------------------------------------------------------
 
+import math
+import time
+from contextlib import contextmanager
+
 import bpy
 from bpy.props import (
     EnumProperty,
@@ -14,6 +18,8 @@ from bpy.props import (
 from bpy.types import PropertyGroup, Panel
 from bpy.app.handlers import persistent
 
+from . import core, core_bpy
+
 # ──────────────────────────────────────────────
 # ① ビューレイヤーごとのレンダー設定を保持する PropertyGroup
 # ──────────────────────────────────────────────
@@ -25,89 +31,135 @@ ENGINES = [
     ("CYCLES",             "Cycles",     ""),
 ]
 
-# 追加（ファイル上部のユーティリティ群の近くに）
-def _normalize_engine_id(val: str) -> str:
-    if not val:
-        return "BLENDER_EEVEE_NEXT"
-    # 旧識別子 → 新識別子に統一
-    if val in {"BLENDER_EEVEE", "EEVEE"}:
-        return "BLENDER_EEVEE_NEXT"
-    # 想定外は安全側で Eevee Next に寄せる
-    if val not in {"BLENDER_EEVEE_NEXT", "BLENDER_WORKBENCH", "CYCLES"}:
-        return "BLENDER_EEVEE_NEXT"
-    return val
-
-def _sanitize_engine_values(scene: bpy.types.Scene) -> None:
-    # 既存 .blend に保存されている旧値をその場で矯正
-    for vl in scene.view_layers:
-        vrs = getattr(vl, "vlm_render", None)
-        if vrs is not None:
-            fixed = _normalize_engine_id(getattr(vrs, "engine", ""))
-            if fixed != getattr(vrs, "engine", ""):
-                vrs.engine = fixed
-
-LIGHT_PATH_PROP_MAP = [
-    ("light_path_max_bounces", "max_bounces"),
-    ("light_path_diffuse_bounces", "diffuse_bounces"),
-    ("light_path_glossy_bounces", "glossy_bounces"),
-    ("light_path_transmission_bounces", "transmission_bounces"),
-    ("light_path_volume_bounces", "volume_bounces"),
-    ("light_path_transparent_bounces", "transparent_max_bounces"),
-    ("light_path_clamp_direct", "sample_clamp_direct"),
-    ("light_path_clamp_indirect", "sample_clamp_indirect"),
-    ("light_path_filter_glossy", "filter_glossy"),
-    ("light_path_caustics_reflective", "caustics_reflective"),
-    ("light_path_caustics_refractive", "caustics_refractive"),
+# エンジン識別子の正規化・対応表は bpy 非依存の core に集約
+_normalize_engine_id = core.normalize_engine_id
+LIGHT_PATH_PROP_MAP = core.LIGHT_PATH_PROP_MAP
+FAST_GI_PROP_MAP = core.FAST_GI_PROP_MAP
+CYCLES_PERF_PROP_MAP = core.CYCLES_PERF_PROP_MAP
+RENDER_THREADS_PROP_MAP = core.RENDER_THREADS_PROP_MAP
+SIMPLIFY_PROP_MAP = core.SIMPLIFY_PROP_MAP
+SIMPLIFY_CYCLES_PROP_MAP = core.SIMPLIFY_CYCLES_PROP_MAP
+EEVEE_PERF_PROP_MAP = core.EEVEE_PERF_PROP_MAP
+
+EEVEE_TILE_SIZES = [
+    ("1", "1px", ""),
+    ("2", "2px", ""),
+    ("4", "4px", ""),
+    ("8", "8px", ""),
+    ("16", "16px", ""),
+]
+EEVEE_RAY_TRACING_METHODS = [
+    ("PROBE", "ライトプローブ", ""),
+    ("SCREEN", "スクリーントレース", ""),
+]
+EEVEE_RAY_TRACING_RESOLUTIONS = [
+    ("1", "1:1", ""),
+    ("2", "1:2", ""),
+    ("4", "1:4", ""),
+    ("8", "1:8", ""),
+    ("16", "1:16", ""),
 ]
 
-FAST_GI_PROP_MAP = [
-    ("fast_gi_use", "use_fast_gi"),
-    ("fast_gi_method", "fast_gi_method"),
-    ("fast_gi_ao_factor", "fast_gi_ao_factor"),
-    ("fast_gi_ao_distance", "fast_gi_ao_distance"),
-    ("fast_gi_viewport_bounces", "fast_gi_viewport_bounces"),
-    ("fast_gi_render_bounces", "fast_gi_render_bounces"),
+TEXTURE_LIMITS = [
+    ("OFF", "制限なし", ""),
+    ("128", "128", ""),
+    ("256", "256", ""),
+    ("512", "512", ""),
+    ("1024", "1024", ""),
+    ("2048", "2048", ""),
+    ("4096", "4096", ""),
+    ("8192", "8192", ""),
 ]
 
-def _sync_cycles_light_paths(rs, cycles_settings) -> None:
-    if rs is None or cycles_settings is None:
-        return
-    for rs_prop, cycles_prop in LIGHT_PATH_PROP_MAP:
-        if hasattr(rs, rs_prop) and hasattr(cycles_settings, cycles_prop):
-            try:
-                setattr(rs, rs_prop, getattr(cycles_settings, cycles_prop))
-            except Exception:
-                pass
-
-def _sync_cycles_fast_gi(rs, cycles_settings) -> None:
-    if rs is None or cycles_settings is None:
-        return
-    for rs_prop, cycles_prop in FAST_GI_PROP_MAP:
-        if hasattr(rs, rs_prop) and hasattr(cycles_settings, cycles_prop):
-            try:
-                setattr(rs, rs_prop, getattr(cycles_settings, cycles_prop))
-            except Exception:
-                pass
-
-def _apply_cycles_light_paths(rs, cycles_settings) -> None:
-    if rs is None or cycles_settings is None:
+def _resolve_target(target, target_prop):
+    """"a.b" 形式のネストしたプロパティを (所有者, 属性名) に分解する"""
+    *path, attr = target_prop.split(".")
+    for name in path:
+        target = getattr(target, name, None)
+        if target is None:
+            return None, attr
+    return target, attr
+
+def _read_target_map(target, prop_map) -> dict:
+    """Scene 側の値を {rs プロパティ名: 値} で読む（sync 用）"""
+    if target is None:
+        return {}
+    values = {}
+    for rs_prop, target_prop in prop_map:
+        owner, attr = _resolve_target(target, target_prop)
+        if owner is not None and hasattr(owner, attr):
+            values[rs_prop] = getattr(owner, attr)
+    return values
+
+# 差分書き込みの統計（バッチ開始時に reset_write_stats、終了時に write_stats で確認）
+# 数えるのは apply_render_override 経由の書き込みだけ（UI・読み込み時の書き込みは含めない）
+_write_stats = {"written": 0, "skipped": 0}
+_counting_depth = 0
+
+def reset_write_stats() -> None:
+    _write_stats["written"] = 0
+    _write_stats["skipped"] = 0
+
+def write_stats() -> dict:
+    return dict(_write_stats)
+
+def _same_value(current, value) -> bool:
+    # RNA の float は単精度なので厳密比較しない
+    if isinstance(current, float) or isinstance(value, float):
+        try:
+            return math.isclose(float(current), float(value), rel_tol=1e-6, abs_tol=1e-9)
+        except (TypeError, ValueError):
+            return False
+    return current == value
+
+def _assign(owner, attr, value, changed=None, label=None) -> bool:
+    """値が異なるときだけ書き込む。同じ値の代入でも depsgraph がタグ付けされ、
+    Cycles / EEVEE の状態がリセットされうるため。"""
+    try:
+        current = getattr(owner, attr)
+    except AttributeError:
+        return False
+    if _same_value(current, value):
+        if _counting_depth:
+            _write_stats["skipped"] += 1
+        return False
+    try:
+        setattr(owner, attr, value)
+    except Exception:
+        return False
+    if _counting_depth:
+        _write_stats["written"] += 1
+    if changed is not None:
+        changed.append(label or attr)
+    return True
+
+def _write_prop_map(values, target, prop_map, changed=None, prefix="") -> None:
+    """解決済みの値（rs プロパティ名 → 値）を Scene 側へ書き込む（差分のみ）"""
+    if target is None:
         return
-    for rs_prop, cycles_prop in LIGHT_PATH_PROP_MAP:
-        if hasattr(rs, rs_prop) and hasattr(cycles_settings, cycles_prop):
-            try:
-                setattr(cycles_settings, cycles_prop, getattr(rs, rs_prop))
-            except Exception:
-                pass
-
-def _apply_cycles_fast_gi(rs, cycles_settings) -> None:
-    if rs is None or cycles_settings is None:
+    for rs_prop, target_prop in prop_map:
+        if rs_prop not in values:
+            continue
+        owner, attr = _resolve_target(target, target_prop)
+        if owner is not None:
+            _assign(owner, attr, values[rs_prop], changed, prefix + target_prop)
+
+def snapshot_simplify(scene) -> dict:
+    """レンダー前の Simplify 設定を退避（restore_simplify で戻す）"""
+    snap = {}
+    for owner_key, owner, prop_map in (("render", scene.render, SIMPLIFY_PROP_MAP),
+                                       ("cycles", getattr(scene, "cycles", None), SIMPLIFY_CYCLES_PROP_MAP)):
+        if owner is None:
+            continue
+        snap[owner_key] = {rs_prop: getattr(owner, target_prop)
+                           for rs_prop, target_prop in prop_map if hasattr(owner, target_prop)}
+    return snap
+
+def restore_simplify(scene, snap) -> None:
+    if not snap:
         return
-    for rs_prop, cycles_prop in FAST_GI_PROP_MAP:
-        if hasattr(rs, rs_prop) and hasattr(cycles_settings, cycles_prop):
-            try:
-                setattr(cycles_settings, cycles_prop, getattr(rs, rs_prop))
-            except Exception:
-                pass
+    _write_prop_map(snap.get("render", {}), scene.render, SIMPLIFY_PROP_MAP)
+    _write_prop_map(snap.get("cycles", {}), getattr(scene, "cycles", None), SIMPLIFY_CYCLES_PROP_MAP)
 
 def _update_render_settings(self, context):
     pass
@@ -115,18 +167,153 @@ def _camera_poll(self, obj):
     """カメラだけを選択肢にするポーラ―関数"""
     return obj.type == 'CAMERA'
 
+# --- 更新の集約（デバウンス） ---
+#   update コールバックは「シーンが汚れた」印を付けるだけにして、
+#   最後の変更から _UPDATE_DELAY 秒後のタイマーで 1 回だけ適用する。
+#   スライダーのドラッグや多数レイヤーへの一括書き込みでも適用は 1 回で済む。
+_UPDATE_DELAY = 0.05
+_pending_updates = {}     # シーン名 → 適用するVL名
+_last_update_time = 0.0
+_suspend_depth = 0
+
+
+def schedule_apply(scene, view_layer) -> None:
+    """scene / view_layer の適用を予約する（suspend_updates 中は印だけ付ける）"""
+    global _last_update_time
+    if scene is None or view_layer is None:
+        return
+    if not scene.get("vlm_settings_synced", False):
+        return
+    _pending_updates[scene.name] = view_layer.name
+    _last_update_time = time.monotonic()
+    if _suspend_depth:
+        return
+    if not bpy.app.timers.is_registered(_flush_updates):
+        bpy.app.timers.register(_flush_updates, first_interval=_UPDATE_DELAY)
+
+
+def _tag_view3d_redraw() -> None:
+    wm = getattr(bpy.context, "window_manager", None)
+    for window in getattr(wm, "windows", []):
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+def flush_updates() -> int:
+    """予約済みの適用を今すぐ実行し、適用したシーン数を返す"""
+    pending = dict(_pending_updates)
+    _pending_updates.clear()
+    for scene_name, vl_name in pending.items():
+        scene = bpy.data.scenes.get(scene_name)
+        vl = scene.view_layers.get(vl_name) if scene else None
+        if vl is None:
+            continue
+        try:
+            apply_render_override(scene, vl)
+        except Exception as e:
+            print(f"VLM: deferred render override failed for {scene_name}/{vl_name}: {e}")
+    if pending:
+        _tag_view3d_redraw()
+    return len(pending)
+
+
+def _flush_updates():
+    if _suspend_depth or not _pending_updates:
+        return None
+    # まだ変更が続いている（ドラッグ中など）なら待つ
+    wait = _UPDATE_DELAY - (time.monotonic() - _last_update_time)
+    if wait > 0:
+        return wait
+    # レンダー中は書き込まない
+    if hasattr(bpy.app, "is_job_running") and bpy.app.is_job_running("RENDER"):
+        return _UPDATE_DELAY
+    flush_updates()
+    return None
+
+
+@contextmanager
+def suspend_updates():
+    """一括書き込み中は適用を止める。抜けたときに溜まった分を 1 回だけ予約する。"""
+    global _suspend_depth
+    _suspend_depth += 1
+    try:
+        yield
+    finally:
+        _suspend_depth -= 1
+        if not _suspend_depth and _pending_updates and not bpy.app.timers.is_registered(_flush_updates):
+            bpy.app.timers.register(_flush_updates, first_interval=_UPDATE_DELAY)
+
+
+# --- 一括編集 ---
+#   多数レイヤーへ書き込む処理（sync / 設定一覧ポップアップ）は bulk_edit の中で
+#   write_layer_settings を使う。update コールバックは素通りし、抜けたときに
+#   キャッシュを捨ててアクティブレイヤーへ 1 回だけ適用する。
+_bulk_depth = 0
+
+
+@contextmanager
+def bulk_edit(scene, view_layer=None):
+    global _bulk_depth
+    _bulk_depth += 1
+    try:
+        with suspend_updates():
+            yield
+    finally:
+        _bulk_depth -= 1
+    if _bulk_depth:
+        return
+    _pending_updates.pop(scene.name, None)
+    core_bpy.invalidate(scene)
+    if view_layer is None:
+        try:
+            view_layer = bpy.context.view_layer
+        except AttributeError:
+            view_layer = None
+    if view_layer is not None and scene.get("vlm_settings_synced", False):
+        apply_render_override(scene, view_layer)
+        _tag_view3d_redraw()
+
+
+def _validated(rs, name, value):
+    """RNA 定義に合わせて値を検証する。範囲外の数値は丸め、不正な列挙値・型は None"""
+    prop = rs.bl_rna.properties.get(name)
+    if prop is None or value is None:
+        return None
+    if getattr(prop, "is_array", False):
+        return value
+    if prop.type == 'INT':
+        return max(prop.hard_min, min(prop.hard_max, int(value)))
+    if prop.type == 'FLOAT':
+        return max(prop.hard_min, min(prop.hard_max, float(value)))
+    if prop.type == 'BOOLEAN':
+        return bool(value)
+    if prop.type == 'ENUM':
+        return value if value in prop.enum_items.keys() else None
+    if prop.type == 'POINTER':
+        rna = getattr(value, "bl_rna", None)
+        return value if rna is not None and rna.identifier == prop.fixed_type.identifier else None
+    return value
+
+
+def write_layer_settings(rs, values) -> list:
+    """{rs プロパティ名: 値} を検証して、異なる値だけ書き込む。書き換えた名前のリストを返す"""
+    changed = []
+    for name, value in values.items():
+        value = _validated(rs, name, value)
+        if value is None:
+            continue
+        _assign(rs, name, value, changed)
+    return changed
+
+
 # --- update コールバック関数 ---
 def _update_render_settings(self, context):
-    """プロパティ更新時にレンダー設定を適用し、ビューポートを更新する"""
-    if context.scene and context.view_layer:
-        if not context.scene.get("vlm_settings_synced", False):
-            return
-        apply_render_override(context.scene, context.view_layer)
-        
-        for window in context.window_manager.windows:
-            for area in window.screen.areas:
-                if area.type == 'VIEW_3D':
-                    area.tag_redraw()
+    """プロパティ更新時：解決キャッシュを捨て、レンダー設定の適用を予約する"""
+    if _bulk_depth:
+        return
+    core_bpy.invalidate(self.id_data)
+    schedule_apply(context.scene, context.view_layer)
 
 # ---- VLM_RenderSettings（このクラス全体で置換）----
 class VLM_RenderSettings(PropertyGroup):
@@ -268,6 +455,155 @@ class VLM_RenderSettings(PropertyGroup):
         update=_update_render_settings
     )
 
+    # Cycles パフォーマンス（適応サンプリング / 時間制限 / スレッド）
+    cycles_perf_enable: BoolProperty(
+        name="Performance Override",
+        description="このレイヤーの適応サンプリング・時間制限・スレッド数を使用する",
+        default=False,
+        update=_update_render_settings
+    )
+    cycles_use_adaptive_sampling: BoolProperty(
+        name="Adaptive Sampling",
+        default=True,
+        update=_update_render_settings
+    )
+    cycles_adaptive_threshold: FloatProperty(
+        name="Noise Threshold",
+        default=0.01, min=0.0, max=1.0, precision=4,
+        update=_update_render_settings
+    )
+    cycles_adaptive_min_samples: IntProperty(
+        name="Min Samples",
+        description="0 で自動",
+        default=0, min=0, max=4096,
+        update=_update_render_settings
+    )
+    cycles_time_limit: FloatProperty(
+        name="Time Limit",
+        description="1 フレームあたりのレンダー時間上限（秒、0 で無制限）",
+        default=0.0, min=0.0,
+        update=_update_render_settings
+    )
+    threads_mode: EnumProperty(
+        name="Threads Mode",
+        items=[
+            ("AUTO", "自動検出", ""),
+            ("FIXED", "固定", ""),
+        ],
+        default="AUTO",
+        update=_update_render_settings
+    )
+    threads: IntProperty(
+        name="Threads",
+        default=1, min=1, max=1024,
+        update=_update_render_settings
+    )
+
+    # 簡略化（Simplify）：マスク・シャドウキャッチャー等のユーティリティレイヤー向け
+    simplify_enable: BoolProperty(
+        name="Simplify Override",
+        description="このレイヤーの簡略化設定を使用する",
+        default=False,
+        update=_update_render_settings
+    )
+    simplify_use: BoolProperty(
+        name="Use Simplify",
+        default=False,
+        update=_update_render_settings
+    )
+    simplify_subdivision: IntProperty(
+        name="Max Subdivision",
+        default=6, min=0, max=6,
+        update=_update_render_settings
+    )
+    simplify_child_particles: FloatProperty(
+        name="Child Particles",
+        default=1.0, min=0.0, max=1.0, subtype='FACTOR',
+        update=_update_render_settings
+    )
+    simplify_volumes: FloatProperty(
+        name="Volume Resolution",
+        default=1.0, min=0.0, max=1.0, subtype='FACTOR',
+        update=_update_render_settings
+    )
+    simplify_texture_limit: EnumProperty(
+        name="Texture Limit",
+        items=TEXTURE_LIMITS,
+        default="OFF",
+        update=_update_render_settings
+    )
+    simplify_use_camera_cull: BoolProperty(
+        name="Camera Culling",
+        default=False,
+        update=_update_render_settings
+    )
+    simplify_camera_cull_margin: FloatProperty(
+        name="Camera Cull Margin",
+        default=0.1, min=0.0, max=5.0, subtype='FACTOR',
+        update=_update_render_settings
+    )
+    simplify_use_distance_cull: BoolProperty(
+        name="Distance Culling",
+        default=False,
+        update=_update_render_settings
+    )
+    simplify_distance_cull_margin: FloatProperty(
+        name="Distance Cull Margin",
+        default=50.0, min=0.0, subtype='DISTANCE',
+        update=_update_render_settings
+    )
+
+    # EEVEE Next パフォーマンス（シャドウ / ボリューム / レイトレース / モーションブラー）
+    eevee_perf_enable: BoolProperty(
+        name="EEVEE Performance Override",
+        description="このレイヤーの EEVEE シャドウ・ボリューム・レイトレース設定を使用する",
+        default=False,
+        update=_update_render_settings
+    )
+    eevee_shadow_resolution_scale: FloatProperty(
+        name="Shadow Resolution",
+        default=1.0, min=0.0, max=1.0, subtype='FACTOR',
+        update=_update_render_settings
+    )
+    eevee_shadow_ray_count: IntProperty(
+        name="Shadow Rays",
+        default=1, min=1, max=4,
+        update=_update_render_settings
+    )
+    eevee_shadow_step_count: IntProperty(
+        name="Shadow Steps",
+        default=6, min=1, max=16,
+        update=_update_render_settings
+    )
+    eevee_volumetric_tile_size: EnumProperty(
+        name="Volume Tile Size",
+        items=EEVEE_TILE_SIZES,
+        default="8",
+        update=_update_render_settings
+    )
+    eevee_volumetric_samples: IntProperty(
+        name="Volume Samples",
+        default=64, min=1, max=256,
+        update=_update_render_settings
+    )
+    eevee_ray_tracing_method: EnumProperty(
+        name="Ray Tracing Method",
+        items=EEVEE_RAY_TRACING_METHODS,
+        default="SCREEN",
+        update=_update_render_settings
+    )
+    eevee_ray_tracing_resolution: EnumProperty(
+        name="Ray Tracing Resolution",
+        items=EEVEE_RAY_TRACING_RESOLUTIONS,
+        default="2",
+        update=_update_render_settings
+    )
+    eevee_motion_blur_steps: IntProperty(
+        name="Motion Blur Steps",
+        default=1, min=1, max=64,
+        update=_update_render_settings
+    )
+
     # Cycles用デノイズ
     use_denoise: BoolProperty(
         name="Denoise",
@@ -324,75 +660,90 @@ class VLM_RenderSettings(PropertyGroup):
 # ──────────────────────────────────────────────
 # ② 既存のシーン設定を取得してアドオンパラメーターに反映する関数
 # ──────────────────────────────────────────────
-def sync_scene_settings_to_addon(scene):
+def _scene_sync_values(scene):
+    """Scene の現在値を、全レイヤー共通の dict とエンジン別の dict にまとめて読む"""
+    r = scene.render
+    common = {
+        "resolution_x": r.resolution_x,
+        "resolution_y": r.resolution_y,
+        "resolution_percentage": r.resolution_percentage,
+        "aspect_x": r.pixel_aspect_x,
+        "aspect_y": r.pixel_aspect_y,
+        # `fps` と `fps_base` から実際のフレームレートを計算して反映
+        "frame_rate": r.fps / r.fps_base,
+        "frame_start": scene.frame_start,
+        "frame_end": scene.frame_end,
+        "frame_step": scene.frame_step,
+    }
+    if r.engine in {'BLENDER_EEVEE', 'BLENDER_EEVEE_NEXT'}:
+        common["engine"] = 'BLENDER_EEVEE_NEXT'
+    elif r.engine == 'CYCLES':
+        common["engine"] = 'CYCLES'
+    common.update(_read_target_map(r, RENDER_THREADS_PROP_MAP))
+    common.update(_read_target_map(r, SIMPLIFY_PROP_MAP))
+    common.update(_read_target_map(getattr(scene, "cycles", None), SIMPLIFY_CYCLES_PROP_MAP))
+    if scene.camera:
+        common["camera"] = scene.camera
+
+    per_engine = {}
+    if hasattr(scene, "cycles"):
+        cyc = {"samples": scene.cycles.samples, "use_denoise": scene.cycles.use_denoising}
+        for prop_map in (LIGHT_PATH_PROP_MAP, FAST_GI_PROP_MAP, CYCLES_PERF_PROP_MAP):
+            cyc.update(_read_target_map(scene.cycles, prop_map))
+        per_engine['CYCLES'] = cyc
+    if hasattr(scene, "eevee"):
+        eev = {"samples": scene.eevee.taa_render_samples}
+        eev.update(_read_target_map(scene.eevee, EEVEE_PERF_PROP_MAP))
+        per_engine['BLENDER_EEVEE_NEXT'] = eev
+    return common, per_engine
+
+
+def sync_scene_settings_to_addon(scene, view_layer=None):
     """
     シーンの既存設定を、アドオンの各ビューレイヤープロパティに反映する
+    （Scene は 1 回だけ読み、全レイヤーへ一括で書き込む。適用は最後に 1 回）
     """
     print("VLM: シーン設定を全ビューレイヤーに同期中...")
-    
-    r = scene.render
-    
-    for vl in scene.view_layers:
-        rs = vl.vlm_render
-        
-        if r.engine in {'BLENDER_EEVEE', 'BLENDER_EEVEE_NEXT'}:
-            rs.engine = 'BLENDER_EEVEE_NEXT'
-        elif r.engine == 'CYCLES':
-            rs.engine = 'CYCLES'
-        
-        if rs.engine == 'CYCLES' and hasattr(scene, 'cycles'):
-            rs.samples     = scene.cycles.samples
-            rs.use_denoise = scene.cycles.use_denoising
-            _sync_cycles_light_paths(rs, scene.cycles)
-            _sync_cycles_fast_gi(rs, scene.cycles)
-        elif rs.engine == 'BLENDER_EEVEE_NEXT' and hasattr(scene, 'eevee'):
-            rs.samples = scene.eevee.taa_render_samples
-        
-        if scene.camera:
-            rs.camera = scene.camera
-        
-        if scene.world:
-            vl.vlm_world = scene.world
-        
-        rs.resolution_x = r.resolution_x
-        rs.resolution_y = r.resolution_y
-        rs.resolution_percentage = r.resolution_percentage
-        rs.aspect_x = r.pixel_aspect_x
-        rs.aspect_y = r.pixel_aspect_y
-        # `fps` と `fps_base` から実際のフレームレートを計算して反映
-        rs.frame_rate = r.fps / r.fps_base
-        
-        rs.frame_start = scene.frame_start
-        rs.frame_end = scene.frame_end
-        rs.frame_step = scene.frame_step
 
-    scene["vlm_settings_synced"] = True
+    common, per_engine = _scene_sync_values(scene)
+    top_flags = {nm: True for nm in (
+        "engine_enable", "camera_enable", "format_enable", "frame_enable",
+        "world_enable",  # ← World も基準ON
+        "light_paths_enable", "fast_gi_enable", "cycles_perf_enable",
+        "simplify_enable", "eevee_perf_enable",
+    )}
+
+    with bulk_edit(scene, view_layer):
+        for i, vl in enumerate(scene.view_layers):
+            rs = vl.vlm_render
+            values = dict(common)
+            values.update(per_engine.get(values.get("engine", rs.engine), {}))
+            # ★ 先頭ビューレイヤー（基準レイヤー）は各オーバーライドの基準ON
+            if i == 0:
+                values.update(top_flags)
+            write_layer_settings(rs, values)
+            if scene.world and vl.vlm_world != scene.world:
+                vl.vlm_world = scene.world
+
+        scene["vlm_settings_synced"] = True
+
+    # 後から作成・追加したシーンにも版を刻む（次の読み込みで既存シーンごと変換し直さないように）
+    from .versioning import stamp_new_scene
+    stamp_new_scene(scene)
     print("VLM: シーン設定の全ビューレイヤーへの同期が完了しました")
 
-    # ★ 先頭ビューレイヤー（基準レイヤー）の固定
-    if scene.view_layers:
-        top_vl = scene.view_layers[0]
-        top_rs = top_vl.vlm_render
-        # 各オーバーライドの基準ON
-        top_rs.engine_enable = True
-        top_rs.camera_enable = True
-        top_rs.format_enable = True
-        top_rs.frame_enable  = True
-        top_rs.world_enable  = True  # ← World も基準ON
-        top_rs.light_paths_enable = True
-        top_rs.fast_gi_enable = True
-
-        # Worldの初期化（未設定なら Scene.world を基準に）
-        if not getattr(top_vl, "vlm_world", None) and scene.world:
-            top_vl.vlm_world = scene.world
-
-    scene["vlm_settings_synced"] = True
-
 # ──────────────────────────────────────────────
 # ③ ファイル読み込み後ハンドラ (変更なし)
 # ──────────────────────────────────────────────
+@persistent
+def _invalidate_resolved(_dummy):
+    core_bpy.invalidate()
+
+
 @persistent
 def load_post_handler(_dummy):
+    core_bpy.invalidate()
+    core_bpy.subscribe_renames()
     scene = bpy.context.scene
     if scene is None:
         return
@@ -400,16 +751,8 @@ def load_post_handler(_dummy):
     if scene.get("vlm_settings_synced", False):
         return
 
-    sync_scene_settings_to_addon(scene)
-
-    if scene.view_layers:
-        top_vl = scene.view_layers[0]
-        apply_render_override(scene, top_vl)
-        
-    for window in bpy.context.window_manager.windows:
-        for area in window.screen.areas:
-            if area.type == 'VIEW_3D':
-                area.tag_redraw()
+    # 同期の最後に先頭レイヤーへ 1 回だけ適用される
+    sync_scene_settings_to_addon(scene, core_bpy.top_view_layer(scene))
 
 # ──────────────────────────────────────────────
 # ④ プロパティエディタ > レンダータブ内に簡易表示（任意）(変更なし)
@@ -440,112 +783,80 @@ class VLM_PT_RenderOverride(Panel):
 def apply_render_override(scene: bpy.types.Scene,
                           view_layer: bpy.types.ViewLayer):
     """サンプル数は【強制】＞【各VLサンプルON】＞【先頭VLのSamples】の優先順位で適用。
-       レンダーエンジンは旧識別子（BLENDER_EEVEE）を互換変換してから代入。"""
-    r = scene.render
-
-    # 既存 .blend の旧値を先に正規化
-    _sanitize_engine_values(scene)
+       フォールバック解決は core.resolve_settings に任せ、ここでは Scene へ書き込むだけ。
+       現在値と異なるプロパティだけを書き込み、書き換えたプロパティ名のリストを返す。"""
+    global _counting_depth
+    _counting_depth += 1
+    try:
+        return _write_render_override(scene, view_layer)
+    finally:
+        _counting_depth -= 1
 
-    # 先頭VL（フォールバック元）
-    top_vl = scene.view_layers[0] if scene.view_layers else view_layer
-    rs     = getattr(view_layer, "vlm_render", None)
-    top_rs = getattr(top_vl,     "vlm_render", None)
-    if rs is None or top_rs is None:
-        return
 
-    # 1) レンダーエンジン（engine_enable が True ならこのVL、Falseなら先頭VL）
-    eng_src = rs if (view_layer == top_vl or getattr(rs, "engine_enable", False)) else top_rs
-    r.engine = _normalize_engine_id(getattr(eng_src, "engine", "BLENDER_EEVEE_NEXT"))
+def _write_render_override(scene, view_layer):
+    r = scene.render
 
-    # 2) サンプルの解決（強制 ＞ 各VLトグルON ＞ 先頭VL）
-    def _resolve_samples():
-        if getattr(scene, "vlm_force_samples_enable", False):
-            return None  # 後段で強制値を適用
-        if bool(getattr(rs, "samples_enable", False)):
-            return max(1, int(getattr(rs, "samples", 1)))
-        return max(1, int(getattr(top_rs, "samples", 1)))
+    # 旧エンジン識別子の正規化は versioning のマイグレーション（読み込み時に 1 回）で済ませてある
+    if getattr(view_layer, "vlm_render", None) is None:
+        return []
+    res = core_bpy.resolve_view_layer(scene, view_layer)
 
-    samples_val = _resolve_samples()
+    # 1) レンダーエンジン
+    changed = []
+    _assign(r, "engine", res.engine, changed, "render.engine")
 
-    # 3) エンジン別にサンプル適用
+    # 2) エンジン別にサンプル・Cycles 設定を適用（強制サンプルは解決済み）
     if r.engine == 'CYCLES':
-        if samples_val is not None:
-            scene.cycles.samples = samples_val
+        cycles = scene.cycles
+        if res.samples is not None:
+            _assign(cycles, "samples", res.samples, changed, "cycles.samples")
         # デノイズはエンジン選択元に追随（UIから削除していても内部値は尊重）
-        scene.cycles.use_denoising = bool(getattr(eng_src, "use_denoise", False))
-        light_src = rs if (view_layer == top_vl or getattr(rs, "light_paths_enable", False)) else top_rs
-        _apply_cycles_light_paths(light_src, scene.cycles)
-        fast_gi_src = rs if (view_layer == top_vl or getattr(rs, "fast_gi_enable", False)) else top_rs
-        _apply_cycles_fast_gi(fast_gi_src, scene.cycles)
+        _assign(cycles, "use_denoising", res.use_denoise, changed, "cycles.use_denoising")
+        _write_prop_map(res.light_paths, cycles, LIGHT_PATH_PROP_MAP, changed, "cycles.")
+        _write_prop_map(res.fast_gi, cycles, FAST_GI_PROP_MAP, changed, "cycles.")
+        _write_prop_map(res.cycles_perf, cycles, CYCLES_PERF_PROP_MAP, changed, "cycles.")
+        _write_prop_map(res.cycles_perf, r, RENDER_THREADS_PROP_MAP, changed, "render.")
 
     elif r.engine in {'BLENDER_EEVEE_NEXT'}:
-        if samples_val is not None:
-            scene.eevee.taa_render_samples = samples_val
+        if res.samples is not None:
+            _assign(scene.eevee, "taa_render_samples", res.samples, changed, "eevee.taa_render_samples")
+        _write_prop_map(res.eevee_perf, scene.eevee, EEVEE_PERF_PROP_MAP, changed, "eevee.")
 
     elif r.engine == 'BLENDER_WORKBENCH':
         # Workbench はパストレ数の概念なし（何もしない）
         pass
 
-    # 3.5) 強制サンプル（最優先で最終上書き）
-    if getattr(scene, "vlm_force_samples_enable", False):
-        if r.engine == 'CYCLES':
-            scene.cycles.samples = max(1, int(getattr(scene, "vlm_force_samples_cycles", 16)))
-        elif r.engine == 'BLENDER_EEVEE_NEXT':
-            scene.eevee.taa_render_samples = max(1, int(getattr(scene, "vlm_force_samples_eevee", 16)))
-        else:
-            # Workbench 等では無視
-            pass
+    # 2.5) 簡略化（テクスチャ制限・カリングは Cycles 側のプロパティ）
+    _write_prop_map(res.simplify, r, SIMPLIFY_PROP_MAP, changed, "render.")
+    _write_prop_map(res.simplify, getattr(scene, "cycles", None), SIMPLIFY_CYCLES_PROP_MAP, changed, "cycles.")
+
+    # 3) カメラ
+    cam = core_bpy.camera_object(res)
+    if cam:
+        _assign(scene, "camera", cam, changed, "scene.camera")
 
-    # 4) カメラ（従来どおり）
-    if view_layer == top_vl:
-        if rs.camera:
-            scene.camera = rs.camera
-    else:
-        cam = rs.camera if (getattr(rs, "camera_enable", False) and rs.camera) else top_rs.camera
-        if cam:
-            scene.camera = cam
-
-    # 5) フォーマット（従来どおり）
-    fmt = rs if (view_layer == top_vl or getattr(rs, "format_enable", False)) else top_rs
-    scale  = max(1, min(int(fmt.resolution_percentage), 1000))
-    factor = scale / 100.0
-    max_dim = 16384
-    if scale <= 100:
-        r.resolution_x          = fmt.resolution_x
-        r.resolution_y          = fmt.resolution_y
-        r.resolution_percentage = scale
-    else:
-        r.resolution_x          = min(int(round(fmt.resolution_x * factor)), max_dim)
-        r.resolution_y          = min(int(round(fmt.resolution_y * factor)), max_dim)
-        r.resolution_percentage = 100
-    r.pixel_aspect_x = fmt.aspect_x
-    r.pixel_aspect_y = fmt.aspect_y
-
-    # 6) フレームレート（従来どおり）
-    fr = round(fmt.frame_rate, 3)
-    if round(fr, 2) == 29.97:
-        r.fps = 30000; r.fps_base = 1001.0
-    elif fr == 23.976:
-        r.fps = 24000; r.fps_base = 1001.0
-    else:
-        r.fps = int(round(fr)); r.fps_base = 1.0
-
-    # 7) フレーム範囲（従来どおり）
-    frm = rs if (view_layer == top_vl or getattr(rs, "frame_enable", False)) else top_rs
-    start = max(0, int(frm.frame_start))
-    end   = max(start, int(frm.frame_end))
-    step  = max(1, int(frm.frame_step))
-    scene.frame_start = start
-    scene.frame_end   = end
-    scene.frame_step  = step
-
-    # 8) World（従来どおり）
-    base_world = getattr(top_vl, "vlm_world", None) or scene.world
-    if view_layer == top_vl:
-        scene.world = base_world
-    else:
-        use_vl_world = getattr(rs, "world_enable", False) and getattr(view_layer, "vlm_world", None)
-        scene.world = view_layer.vlm_world if use_vl_world else base_world
+    # 4) フォーマット
+    _assign(r, "resolution_x", res.resolution_x, changed, "render.resolution_x")
+    _assign(r, "resolution_y", res.resolution_y, changed, "render.resolution_y")
+    _assign(r, "resolution_percentage", res.resolution_percentage, changed, "render.resolution_percentage")
+    _assign(r, "pixel_aspect_x", res.pixel_aspect_x, changed, "render.pixel_aspect_x")
+    _assign(r, "pixel_aspect_y", res.pixel_aspect_y, changed, "render.pixel_aspect_y")
+
+    # 5) フレームレート
+    _assign(r, "fps", res.fps, changed, "render.fps")
+    _assign(r, "fps_base", res.fps_base, changed, "render.fps_base")
+
+    # 6) フレーム範囲
+    _assign(scene, "frame_start", res.frame_start, changed, "scene.frame_start")
+    _assign(scene, "frame_end", res.frame_end, changed, "scene.frame_end")
+    _assign(scene, "frame_step", res.frame_step, changed, "scene.frame_step")
+
+    # 7) World
+    world = core_bpy.world_datablock(res)
+    if world is not None:
+        _assign(scene, "world", world, changed, "scene.world")
+
+    return changed
 
 # ──────────────────────────────────────────────
 # ⑥ 手動同期オペレーター (変更なし)
@@ -578,15 +889,11 @@ def register():
     bpy.types.ViewLayer.vlm_render = PointerProperty(type=VLM_RenderSettings)
     
     def _update_world_settings(self, context):
-        if context.scene and context.view_layer:
-            if not context.scene.get("vlm_settings_synced", False):
-                return
-            apply_render_override(context.scene, context.view_layer)
-            for window in context.window_manager.windows:
-                for area in window.screen.areas:
-                    if area.type == 'VIEW_3D':
-                        area.tag_redraw()
-    
+        if _bulk_depth:
+            return
+        core_bpy.invalidate(self.id_data)
+        schedule_apply(context.scene, context.view_layer)
+
     bpy.types.ViewLayer.vlm_world = PointerProperty(
         name="World",
         type=bpy.types.World,
@@ -595,6 +902,11 @@ def register():
     
     if load_post_handler not in bpy.app.handlers.load_post:
         bpy.app.handlers.load_post.append(load_post_handler)
+    core_bpy.subscribe_renames()
+    # アンドゥ・リドゥでは RNA の update が走らないので解決キャッシュを捨てる
+    for h in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _invalidate_resolved not in h:
+            h.append(_invalidate_resolved)
 
     if not hasattr(bpy.types.ViewLayer, "vlm_world"):
         bpy.types.ViewLayer.vlm_world = bpy.props.PointerProperty(
@@ -608,6 +920,14 @@ def unregister():
 
     if load_post_handler in bpy.app.handlers.load_post:
         bpy.app.handlers.load_post.remove(load_post_handler)
+    for h in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _invalidate_resolved in h:
+            h.remove(_invalidate_resolved)
+    if bpy.app.timers.is_registered(_flush_updates):
+        bpy.app.timers.unregister(_flush_updates)
+    _pending_updates.clear()
+    core_bpy.unsubscribe_renames()
+    core_bpy.invalidate()
     
     if hasattr(bpy.types.ViewLayer, 'vlm_render'):
         del bpy.types.ViewLayer.vlm_render
@@ -0,0 +1,45 @@
+# tests/conftest.py
+#
+# アドオンのルートはパッケージ（__init__.py が bpy を import する）なので、
+# bpy 非依存の core.py だけをファイルから直接読み込んで使う。
+# ------------------------------------------------------------
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load_module(name, filename):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    # dataclass の型解決のため、実行前に sys.modules へ登録しておく
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def core():
+    return _load_module("vlm_core", "core.py")
+
+
+@pytest.fixture(scope="session")
+def addon():
+    """Blender（bpy モジュール）がある環境でだけ、アドオン全体をパッケージとして読み込んで登録する"""
+    bpy = pytest.importorskip("bpy")
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    name = "vlm_addon"
+    spec = importlib.util.spec_from_file_location(
+        name, ROOT / "__init__.py", submodule_search_locations=[str(ROOT)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[name] = package
+    spec.loader.exec_module(package)
+    package.register()
+    yield package
+    package.unregister()
@@ -0,0 +1,299 @@
+# tests/test_core.py
+#
+# core.py（bpy 非依存）の単体テスト。Blender なしで pytest だけで走る。
+# ------------------------------------------------------------
+
+import json
+import os
+
+import pytest
+
+
+# ──────────────────────────────────────────────
+# エンジン識別子
+# ──────────────────────────────────────────────
+@pytest.mark.parametrize("value, expected", [
+    ("CYCLES", "CYCLES"),
+    ("BLENDER_WORKBENCH", "BLENDER_WORKBENCH"),
+    ("BLENDER_EEVEE_NEXT", "BLENDER_EEVEE_NEXT"),
+    ("BLENDER_EEVEE", "BLENDER_EEVEE_NEXT"),
+    ("EEVEE", "BLENDER_EEVEE_NEXT"),
+    ("", "BLENDER_EEVEE_NEXT"),
+    (None, "BLENDER_EEVEE_NEXT"),
+    ("UNKNOWN_ENGINE", "BLENDER_EEVEE_NEXT"),
+])
+def test_normalize_engine_id(core, value, expected):
+    assert core.normalize_engine_id(value) == expected
+
+
+# ──────────────────────────────────────────────
+# 変換ヘルパー
+# ──────────────────────────────────────────────
+@pytest.mark.parametrize("rate, expected", [
+    (24.0, (24, 1.0)),
+    (25, (25, 1.0)),
+    (29.97, (30000, 1001.0)),
+    (29.970, (30000, 1001.0)),
+    (23.976, (24000, 1001.0)),
+    (59.94, (60, 1.0)),
+])
+def test_fps_from_frame_rate(core, rate, expected):
+    assert core.fps_from_frame_rate(rate) == expected
+
+
+def test_resolution_up_to_100_percent_is_passed_through(core):
+    assert core.resolution_from_format(1920, 1080, 50) == (1920, 1080, 50)
+    assert core.resolution_from_format(1920, 1080, 100) == (1920, 1080, 100)
+
+
+def test_resolution_over_100_percent_scales_pixels(core):
+    assert core.resolution_from_format(1920, 1080, 200) == (3840, 2160, 100)
+
+
+def test_resolution_is_clamped(core):
+    # 上限 16384 px、割合は 1〜1000%
+    assert core.resolution_from_format(8000, 4000, 1000) == (core.MAX_RESOLUTION, core.MAX_RESOLUTION, 100)
+    assert core.resolution_from_format(1920, 1080, 0) == (1920, 1080, 1)
+
+
+# ──────────────────────────────────────────────
+# 設定解決（先頭レイヤーへのフォールバック）
+# ──────────────────────────────────────────────
+@pytest.fixture
+def top(core):
+    return core.LayerSettings(
+        name="Top", engine="CYCLES", samples=128, use_denoise=True,
+        cycles_perf={"use_adaptive_sampling": True},
+        simplify={"simplify_use": True},
+        camera="CamTop", world="WorldTop",
+        resolution_x=1920, resolution_y=1080, frame_rate=24.0,
+        frame_start=1, frame_end=100, frame_step=1,
+    )
+
+
+def test_layer_without_overrides_falls_back_to_top(core, top):
+    layer = core.LayerSettings(name="B", engine="BLENDER_WORKBENCH", samples=4,
+                               simplify={"simplify_use": False}, camera="CamB",
+                               resolution_x=640, frame_start=10, frame_end=20)
+    res = core.resolve_settings(layer, top)
+    assert res.layer == "B"
+    assert res.engine == "CYCLES"
+    assert res.samples == 128
+    assert res.use_denoise is True
+    assert res.simplify == {"simplify_use": True}
+    assert res.cycles_perf == {"use_adaptive_sampling": True}
+    assert res.camera == "CamTop"
+    assert res.world == "WorldTop"
+    assert res.resolution_x == 1920
+    assert (res.frame_start, res.frame_end) == (1, 100)
+
+
+def test_enabled_overrides_win(core, top):
+    layer = core.LayerSettings(
+        name="B", engine_enable=True, engine="BLENDER_EEVEE", samples_enable=True, samples=8,
+        simplify_enable=True, simplify={"simplify_use": False},
+        camera_enable=True, camera="CamB", world_enable=True, world="WorldB",
+        format_enable=True, resolution_x=640, resolution_y=480, frame_rate=29.97,
+        frame_enable=True, frame_start=10, frame_end=20, frame_step=2,
+    )
+    res = core.resolve_settings(layer, top)
+    assert res.engine == "BLENDER_EEVEE_NEXT"   # 旧識別子は正規化される
+    assert res.samples == 8
+    assert res.simplify == {"simplify_use": False}
+    assert res.camera == "CamB"
+    assert res.world == "WorldB"
+    assert (res.resolution_x, res.resolution_y) == (640, 480)
+    assert (res.fps, res.fps_base) == (30000, 1001.0)
+    assert (res.frame_start, res.frame_end, res.frame_step) == (10, 20, 2)
+
+
+def test_top_layer_always_uses_its_own_values(core, top):
+    res = core.resolve_settings(top, top)
+    assert res.engine == "CYCLES"
+    assert res.cycles_perf == {"use_adaptive_sampling": True}
+    assert res.camera == "CamTop"
+
+
+def test_enabled_camera_without_value_falls_back(core, top):
+    layer = core.LayerSettings(name="B", camera_enable=True, camera=None)
+    assert core.resolve_settings(layer, top).camera == "CamTop"
+
+
+def test_world_falls_back_to_scene_world(core, top):
+    top.world = None
+    layer = core.LayerSettings(name="B")
+    scene = core.SceneSettings(world="SceneWorld")
+    assert core.resolve_settings(layer, top, scene).world == "SceneWorld"
+
+
+def test_forced_samples_override_everything(core, top):
+    layer = core.LayerSettings(name="B", samples_enable=True, samples=8)
+    scene = core.SceneSettings(force_samples_enable=True, force_samples_cycles=0, force_samples_eevee=32)
+    # 強制値も 1 未満にはならない
+    assert core.resolve_settings(layer, top, scene).samples == 1
+
+
+def test_workbench_has_no_samples(core, top):
+    top.engine = "BLENDER_WORKBENCH"
+    assert core.resolve_settings(top, top).samples is None
+
+
+def test_frame_range_is_clamped(core, top):
+    layer = core.LayerSettings(name="B", frame_enable=True, frame_start=-5, frame_end=-10, frame_step=0)
+    res = core.resolve_settings(layer, top)
+    assert (res.frame_start, res.frame_end, res.frame_step) == (0, 0, 1)
+
+
+def test_resolved_maps_are_copies(core, top):
+    res = core.resolve_settings(top, top)
+    res.simplify["simplify_use"] = False
+    assert top.simplify == {"simplify_use": True}
+
+
+# ──────────────────────────────────────────────
+# フレーム範囲
+# ──────────────────────────────────────────────
+def test_resolve_frame_range(core, top):
+    off = core.LayerSettings(name="B", frame_start=5, frame_end=6)
+    on = core.LayerSettings(name="C", frame_enable=True, frame_start=5, frame_end=6, frame_step=0)
+    assert core.resolve_frame_range(off, top) == (1, 100, 1)
+    assert core.resolve_frame_range(on, top) == (5, 6, 1)
+
+
+def test_iter_and_count_frames(core):
+    assert list(core.iter_frames(1, 10, 3)) == [1, 4, 7, 10]
+    assert core.count_frames(1, 10, 3) == 4
+    assert core.count_frames(5, 1, 1) == 0
+    assert list(core.iter_frames(5, 1, 1)) == []
+
+
+def test_plan_render_jobs(core, top):
+    layer = core.LayerSettings(name="B", frame_enable=True, frame_start=3, frame_end=5)
+    jobs = core.plan_render_jobs([layer], top)
+    assert [(j.layer, j.frame) for j in jobs] == [("B", 3), ("B", 4), ("B", 5)]
+    stills = core.plan_render_jobs([layer, top], top, animation=False)
+    assert [(j.layer, j.frame) for j in stills] == [("B", 3), ("Top", 1)]
+
+
+# ──────────────────────────────────────────────
+# スレッド配分
+# ──────────────────────────────────────────────
+def test_allocate_threads_concurrent_sum_stays_within_budget(core):
+    # 重い 4 レイヤー（コスト 10）と軽い 12 レイヤー（平均 2.5）を 64 コア・4 プロセスで
+    costs = {f"H{i}": 10.0 for i in range(4)}
+    costs.update({f"L{i}": 0.0 for i in range(12)})
+    alloc = core.allocate_threads(costs, 64, 4)
+    assert sum(sorted(alloc.values(), reverse=True)[:4]) <= 64
+    assert all(n >= 1 for n in alloc.values())
+    assert alloc["H0"] > alloc["L0"]
+
+
+@pytest.mark.parametrize("costs, budget, workers", [
+    ({"A": 1.0, "B": 1.0}, 8, 2),
+    ({"A": 5.0, "B": 1.0, "C": 1.0, "D": 1.0}, 16, 3),
+    ({"A": 3.0, "B": 3.0, "C": 3.0}, 12, 3),
+])
+def test_allocate_threads_any_concurrent_set_fits(core, costs, budget, workers):
+    alloc = core.allocate_threads(costs, budget, workers)
+    assert sum(sorted(alloc.values(), reverse=True)[:workers]) <= budget
+
+
+def test_allocate_threads_single_worker_takes_budget(core):
+    assert core.allocate_threads({"A": 1.0, "B": 9.0}, 12, 1) == {"A": 12, "B": 12}
+
+
+# ──────────────────────────────────────────────
+# 出力パス命名
+# ──────────────────────────────────────────────
+def test_sanitize_name_for_path(core):
+    assert core.sanitize_name_for_path("Shot 01/BG.v2") == "Shot_01_BG_v2"
+    assert core.sanitize_name_for_path(None) == ""
+
+
+def test_file_extension_for_format(core):
+    assert core.file_extension_for_format("OPEN_EXR_MULTILAYER") == ".exr"
+    assert core.file_extension_for_format("PNG") == ".png"
+    assert core.file_extension_for_format("FFMPEG", "mp4") == ".mp4"
+    assert core.file_extension_for_format("FFMPEG") == ".exr"
+
+
+def test_output_paths(core):
+    base = core.output_base_path("/out", "shot 1", "BG", "Image", sep="/")
+    assert base == os.path.join("/out", "shot_1", "BG", "Image") + "/"
+    assert core.output_slot_path("shot 1", "BG", "Image") == "shot_1_BG_Image_"
+    assert core.output_frame_path("/out", "shot 1", "BG", "Image", 7, ".png") == os.path.join(
+        "/out", "shot_1", "BG", "Image", "shot_1_BG_Image_0007.png")
+
+
+def test_file_output_frame_path(core):
+    assert core.file_output_frame_path("/o", "img_###_x", 5, ".exr") == os.path.join("/o", "img_005_x.exr")
+    assert core.file_output_frame_path("/o", "img_", 5, ".exr") == os.path.join("/o", "img_0005.exr")
+
+
+def test_intermediate_base_path(core):
+    path = core.intermediate_base_path("/out", "shot", "BG", "Image", sep="/")
+    assert path == os.path.join("/out", "shot", core.INTERMEDIATE_DIR_NAME, "BG", "Image") + "/"
+
+
+# ──────────────────────────────────────────────
+# マニフェスト
+# ──────────────────────────────────────────────
+def _manifest(core, top):
+    from dataclasses import asdict
+
+    layer = core.LayerSettings(name="B", frame_enable=True, frame_start=2, frame_end=4)
+    layers = []
+    for ls in (top, layer):
+        layers.append({
+            "name": ls.name,
+            "settings": asdict(ls),
+            "resolved": asdict(core.resolve_settings(ls, top)),
+            "frame_range": list(core.resolve_frame_range(ls, top)),
+        })
+    return {"format": core.MANIFEST_FORMAT, "version": core.MANIFEST_VERSION, "layers": layers}
+
+
+def test_manifest_json_round_trip(core, top, tmp_path):
+    manifest = _manifest(core, top)
+    path = str(tmp_path / "layers.json")
+    core.dump_manifest(manifest, path)
+    loaded = core.load_manifest(path)
+    assert loaded == json.loads(json.dumps(manifest))
+
+    entry = loaded["layers"][1]
+    assert core.layer_settings_from_dict(entry["settings"]) == core.LayerSettings(
+        name="B", frame_enable=True, frame_start=2, frame_end=4)
+    res = core.resolved_settings_from_dict(entry["resolved"])
+    assert res.engine == "CYCLES" and res.frame_start == 2
+
+    jobs = core.plan_jobs_from_manifest(loaded, layers=["B"])
+    assert [(j.layer, j.frame) for j in jobs] == [("B", 2), ("B", 3), ("B", 4)]
+
+
+def test_layer_settings_from_dict_ignores_unknown_keys(core):
+    ls = core.layer_settings_from_dict({"name": "X", "samples": 3, "future_field": 1})
+    assert (ls.name, ls.samples) == ("X", 3)
+
+
+def test_load_manifest_rejects_foreign_and_newer_files(core, tmp_path):
+    foreign = tmp_path / "foreign.json"
+    foreign.write_text(json.dumps({"format": "other"}), encoding="utf-8")
+    with pytest.raises(core.ManifestError):
+        core.load_manifest(str(foreign))
+
+    newer = tmp_path / "newer.json"
+    newer.write_text(json.dumps({"format": core.MANIFEST_FORMAT,
+                                 "version": core.MANIFEST_VERSION + 1}), encoding="utf-8")
+    with pytest.raises(core.ManifestError):
+        core.load_manifest(str(newer))
+
+
+def test_msgpack_round_trip(core, top, tmp_path):
+    if core.msgpack is None:
+        with pytest.raises(core.ManifestError):
+            core.dump_manifest(_manifest(core, top), str(tmp_path / "layers.msgpack"))
+        return
+    manifest = _manifest(core, top)
+    path = str(tmp_path / "layers.msgpack")
+    core.dump_manifest(manifest, path)
+    assert core.load_manifest(path) == json.loads(json.dumps(manifest))
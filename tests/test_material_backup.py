@@ -0,0 +1,93 @@
+# tests/test_material_backup.py
+#
+# 先頭レイヤーでのスロット変更が、レイヤーを離れるときにバックアップ表へ入ること。
+# bpy が必要（Blender の Python か bpy モジュールがある環境でだけ走る）。
+# ------------------------------------------------------------
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+
+@pytest.fixture
+def scene(addon):
+    sc = bpy.data.scenes.new("VLM Backup Test")
+    sc.view_layers.new("Other")
+    yield sc
+    bpy.data.scenes.remove(sc)
+
+
+def _mesh_object(scene, name, link):
+    me = bpy.data.meshes.new(name)
+    ob = bpy.data.objects.new(name, me)
+    scene.collection.objects.link(ob)
+    ob.data.materials.append(bpy.data.materials.new(f"{name} A"))
+    ob.material_slots[0].link = link
+    if link == 'OBJECT':
+        ob.material_slots[0].material = me.materials[0]
+    return ob
+
+
+@pytest.mark.parametrize("link", ['OBJECT', 'DATA'])
+def test_slot_assignment_on_top_layer_is_backed_up_when_leaving(addon, scene, link):
+    mo = addon.material_override
+    ob = _mesh_object(scene, f"Slot {link}", link)
+    top = scene.view_layers[0]
+    top.update()
+    mo.force_create_initial_backup(scene)
+    before = ob.material_slots[0].material
+    assert mo.read_backup(scene)[ob.name] == [before]
+
+    # 先頭レイヤーでスロットを付け替え、depsgraph を評価させる
+    new = bpy.data.materials.new(f"{ob.name} B")
+    ob.material_slots[0].material = new
+    top.update()
+    assert mo._uid(ob) in mo._dirty_backup.get(scene.name, set())
+
+    # 先頭レイヤーを離れる（切替時に走る取り直し）
+    assert mo.refresh_dirty_backups(scene) == 1
+    assert mo.read_backup(scene)[ob.name] == [new]
+
+
+def test_transform_only_update_is_not_marked(addon, scene):
+    mo = addon.material_override
+    ob = _mesh_object(scene, "Moved", 'OBJECT')
+    top = scene.view_layers[0]
+    top.update()
+    mo.force_create_initial_backup(scene)
+    mo._dirty_backup.pop(scene.name, None)
+
+    ob.location.x += 1.0
+    top.update()
+    assert mo._uid(ob) not in mo._dirty_backup.get(scene.name, set())
+
+
+def test_backup_row_follows_object_rename(addon, scene):
+    mo = addon.material_override
+    ob = _mesh_object(scene, "Renamed", 'OBJECT')
+    scene.view_layers[0].update()
+    mo.force_create_initial_backup(scene)
+    base = [ob.material_slots[0].material]
+
+    ob.name = "Renamed Later"
+    mo._on_object_renamed()   # msgbus の通知はイベントループで届くので直接呼ぶ
+    assert mo.read_backup(scene).get("Renamed Later") == base
+    assert "Renamed" not in mo.read_backup(scene)
+
+    # 上書きを重ねても、ベースは上書き前の割り当てのまま
+    mo.backup_all_materials(scene)
+    assert mo.read_backup(scene)["Renamed Later"] == base
+
+
+def test_cached_rows_drop_removed_material_when_count_is_unchanged(addon, scene):
+    mo = addon.material_override
+    ob = _mesh_object(scene, "Swapped", 'OBJECT')
+    scene.view_layers[0].update()
+    mo.force_create_initial_backup(scene)
+    old = ob.material_slots[0].material
+    assert mo.read_backup(scene)[ob.name] == [old]
+
+    # 1 つ消して 1 つ足す（マテリアル数は変わらない）
+    bpy.data.materials.remove(old)
+    bpy.data.materials.new("Swapped Added")
+    assert mo.read_backup(scene)[ob.name] == [None]
@@ -0,0 +1,38 @@
+# tests/test_versioning.py
+#
+# マイグレーションはシーンごとの版で走り、最新のシーンを変換し直さないこと。
+# bpy が必要（Blender の Python か bpy モジュールがある環境でだけ走る）。
+# ------------------------------------------------------------
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+
+def test_adding_a_scene_does_not_rerun_migrations_on_existing_scenes(addon):
+    versioning = addon.versioning
+    existing = bpy.data.scenes.new("VLM Versioning Existing")
+    try:
+        versioning.migrate_all()
+        assert versioning.schema_version(existing) == versioning.SCHEMA_VERSION
+
+        # 最新の版のシーンで、先頭レイヤーの設定を利用者が変えておく
+        existing["vlm_settings_synced"] = True
+        rs = existing.view_layers[0].vlm_render
+        rs.cycles_perf_enable = False
+        rs.simplify_enable = False
+        before = {name: getattr(rs, name) for name in rs.bl_rna.properties.keys() if name != "rna_type"}
+
+        added = bpy.data.scenes.new("VLM Versioning Added")
+        try:
+            assert versioning.schema_version(added) == 0
+            done = versioning.migrate_all()
+            assert done
+            assert versioning.schema_version(added) == versioning.SCHEMA_VERSION
+            after = {name: getattr(rs, name) for name in before}
+            assert after == before
+            assert versioning.migrate_all() == []
+        finally:
+            bpy.data.scenes.remove(added)
+    finally:
+        bpy.data.scenes.remove(existing)
@@ -0,0 +1,289 @@
+# versioning.py
+#
+# 保存データの一回限りのマイグレーション
+#   - Scene ごとに vlm_schema_version を刻み、版が古いシーンだけを load_post / 登録時に 1 回変換する
+#     （新しく作ったシーンは初回同期時に現在の版を刻むので、後から足しても既存シーンは変換し直さない）
+#   - 変換は MIGRATIONS に (到達バージョン, 関数) で追加していく。関数は対象シーンのリストを受け取り、
+#     そのシーン（とそのオブジェクト・コレクション）だけに触る（何度走っても安全に書く）
+#   - apply のたびに全レイヤーを正規化していた処理（旧 _sanitize_engine_values）はここへ移した
+# ------------------------------------------------------------
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import core, core_bpy
+from .material_override import (
+    _NAME_SEP, _backup_key, _override_key, decode_rows, encode_rows, invalidate_backup_cache,
+    read_backup, set_override, write_backup,
+)
+
+SCHEMA_KEY = "vlm_schema_version"
+
+# material_override._override_key の接頭辞
+_OVERRIDE_PREFIX = "_vlm_mat_override_"
+
+
+# ──────────────────────────────────────────────
+# ① 各マイグレーション
+# ──────────────────────────────────────────────
+def _scene_objects(scenes):
+    seen = set()
+    for scene in scenes:
+        for obj in scene.objects:
+            if obj.name not in seen:
+                seen.add(obj.name)
+                yield obj
+
+
+def _scene_collections(scenes):
+    seen = set()
+    for scene in scenes:
+        for col in scene.collection.children_recursive:
+            if col.name not in seen:
+                seen.add(col.name)
+                yield col
+
+
+def _migrate_engine_ids(scenes):
+    """旧エンジン識別子（BLENDER_EEVEE 等）や不正値を Eevee Next に寄せる"""
+    fixed = 0
+    for scene in scenes:
+        for vl in scene.view_layers:
+            rs = getattr(vl, "vlm_render", None)
+            if rs is None:
+                continue
+            current = getattr(rs, "engine", "")
+            engine = core.normalize_engine_id(current)
+            if engine != current:
+                rs.engine = engine
+                fixed += 1
+    return fixed
+
+
+def _migrate_string_backups(scenes):
+    """カンマ区切り文字列のマテリアルバックアップを pointer（backup_materials）へ移す。
+    キー自体は backup_all_materials と同じく空文字の互換フラグとして残す。"""
+    moved = 0
+    for obj in _scene_objects(scenes):
+        if obj.type != 'MESH':
+            continue
+        key = _backup_key(obj)
+        raw = obj.get(key)
+        if not isinstance(raw, str) or not raw:
+            continue
+        if not obj.backup_materials:
+            for name in raw.split(","):
+                item = obj.backup_materials.add()
+                item.material = bpy.data.materials.get(name) if name else None
+            moved += 1
+        obj[key] = ""
+    return moved
+
+
+def _migrate_override_values(scenes):
+    """コレクションのマテリアル上書きの値をマテリアル名（文字列）に揃え、空のキーを消す"""
+    fixed = 0
+    for col in _scene_collections(scenes):
+        for key in [k for k in col.keys() if k.startswith(_OVERRIDE_PREFIX)]:
+            value = col[key]
+            if isinstance(value, bpy.types.Material):
+                col[key] = value.name
+                fixed += 1
+            elif isinstance(value, bytes):
+                col[key] = value.decode("utf-8", "replace")
+                fixed += 1
+            elif not isinstance(value, str) or not value:
+                del col[key]
+                fixed += 1
+    return fixed
+
+
+def _migrate_override_registry(scenes):
+    """コレクションの ID プロパティ（_vlm_mat_override_{VL}_{コレクション}）を
+    ViewLayer.vlm_material_overrides のレジストリへ移す。
+    キーは現存する VL 名・コレクション名と完全一致するものだけを対象にする
+    （名前に '_' を含んでもキーを分解しないので曖昧にならない）。"""
+    moved = 0
+    cols = list(_scene_collections(scenes))
+    for scene in scenes:
+        for vl in scene.view_layers:
+            if not hasattr(vl, "vlm_material_overrides"):
+                continue
+            for col in cols:
+                key = _override_key(vl.name, col.name)
+                if key not in col:
+                    continue
+                mat = bpy.data.materials.get(col[key]) if isinstance(col[key], str) else None
+                if mat is not None:
+                    set_override(vl, col, mat)
+                    moved += 1
+                del col[key]
+    return moved
+
+
+def _migrate_backup_table(scenes):
+    """オブジェクトごとの backup_materials をシーン単位のバックアップ表へ移す。
+    オブジェクトは複数シーンで共有されうるので、各シーンには自分のオブジェクトの行だけ入れる。
+    表に既にある行は上書きしない。移し終えたら Object 側のデータと互換フラグを消す。"""
+    moved = 0
+    for scene in scenes:
+        entries = dict(read_backup(scene))
+        added = {
+            obj.name: [item.material for item in obj.backup_materials]
+            for obj in scene.objects
+            if obj.type == 'MESH' and obj.backup_materials and obj.name not in entries
+        }
+        if added:
+            write_backup(scene, {**entries, **added})
+            moved += len(added)
+    for obj in _scene_objects(scenes):
+        if obj.type != 'MESH':
+            continue
+        if obj.backup_materials:
+            obj.backup_materials.clear()
+        if _backup_key(obj) in obj:
+            del obj[_backup_key(obj)]
+    return moved
+
+
+def _seed_maps(scene):
+    """先頭レイヤーへ Scene の現在値を写す項目 (フラグ名, Scene 側の所有者, 対応表) の一覧"""
+    r = scene.render
+    return [
+        ("cycles_perf_enable", getattr(scene, "cycles", None), core.CYCLES_PERF_PROP_MAP),
+        ("cycles_perf_enable", r, core.RENDER_THREADS_PROP_MAP),
+        ("simplify_enable", r, core.SIMPLIFY_PROP_MAP),
+        ("simplify_enable", getattr(scene, "cycles", None), core.SIMPLIFY_CYCLES_PROP_MAP),
+        ("eevee_perf_enable", getattr(scene, "eevee", None), core.EEVEE_PERF_PROP_MAP),
+    ]
+
+
+def _migrate_seed_top_layer(scenes):
+    """同期済みの古いファイルでは、後から追加した先頭レイヤーの項目が RNA の既定値のまま。
+    最初の適用で Scene の実際の設定（適応サンプリング・スレッド等）を既定値で
+    上書きしないよう（Simplify はエンジンを問わず書かれる）、Scene の現在値を先頭レイヤーへ写しておく。
+    基準フラグが既に ON の項目は設定済みとみなして触らない（再実行しても先頭レイヤーを上書きしない）。"""
+    from .render_override import _read_target_map, write_layer_settings
+
+    seeded = 0
+    for scene in scenes:
+        if not scene.get("vlm_settings_synced", False) or not scene.view_layers:
+            continue
+        rs = getattr(scene.view_layers[0], "vlm_render", None)
+        if rs is None:
+            continue
+        values, flags = {}, set()
+        for flag, owner, prop_map in _seed_maps(scene):
+            if owner is None or getattr(rs, flag, True):
+                continue
+            values.update(_read_target_map(owner, prop_map))
+            flags.add(flag)
+        values.update(dict.fromkeys(flags, True))
+        if write_layer_settings(rs, values):
+            seeded += 1
+    return seeded
+
+
+def _migrate_backup_object_pointers(scenes):
+    """バックアップ表・スナップショットの行にオブジェクトの pointer（objects）を足す。
+    pointer の無い古い表は名前でしか引けず、改名で行が宙に浮くため。
+    行の内容は変えずに書き直すだけ（既に pointer がある表は触らない）。"""
+    fixed = 0
+    for scene in scenes:
+        tables = [getattr(scene, "vlm_material_backup", None)]
+        tables += list(getattr(scene, "vlm_material_snapshots", []))
+        for table in tables:
+            if table is None or not table.object_names:
+                continue
+            if len(table.objects) == len(table.object_names.split(_NAME_SEP)):
+                continue
+            encode_rows(table, decode_rows(table)[0])
+            fixed += 1
+    invalidate_backup_cache()
+    return fixed
+
+
+# (このマイグレーション後のスキーマ版, 関数)。版は昇順で追加する
+MIGRATIONS = (
+    (1, _migrate_engine_ids),
+    (2, _migrate_string_backups),
+    (3, _migrate_override_values),
+    (4, _migrate_override_registry),
+    (5, _migrate_backup_table),
+    (6, _migrate_seed_top_layer),
+    (7, _migrate_backup_object_pointers),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# ──────────────────────────────────────────────
+# ② 実行
+# ──────────────────────────────────────────────
+def schema_version(scene):
+    return int(scene.get(SCHEMA_KEY, 0))
+
+
+def migrate_all(scenes=None):
+    """版が古いシーン（省略時は全シーン）ごとに、そのシーンの版より新しい変換だけを
+    1 回ずつ走らせ、現在の版を刻む。変換は対象シーン（とそのオブジェクト・コレクション）
+    だけに効くので、最新のシーンは何度呼んでも変わらない。"""
+    if scenes is None:
+        scenes = bpy.data.scenes
+    pending = [sc for sc in scenes if schema_version(sc) < SCHEMA_VERSION]
+    if not pending:
+        return []
+
+    from .render_override import suspend_updates
+
+    done = []
+    with suspend_updates():
+        for version, fn in MIGRATIONS:
+            scenes = [sc for sc in pending if schema_version(sc) < version]
+            if not scenes:
+                continue
+            count = fn(scenes)
+            done.append((version, fn.__name__, count))
+        for sc in pending:
+            sc[SCHEMA_KEY] = SCHEMA_VERSION
+    core_bpy.invalidate()
+
+    for version, name, count in done:
+        if count:
+            print(f"VLM: migration v{version} {name}: {count} item(s) updated")
+    return done
+
+
+def stamp_new_scene(scene):
+    """初回同期したシーンに現在の版を刻む。版の無いシーン（作成・追加直後）は
+    そのシーンだけ変換を通してから刻む（新しいシーンでは何も変わらない）"""
+    if SCHEMA_KEY not in scene:
+        migrate_all([scene])
+
+
+@persistent
+def _load_post(_dummy):
+    migrate_all()
+
+
+def _migrate_on_register():
+    # register 中は bpy.data に触れないので、直後のタイマーで実行する
+    try:
+        migrate_all()
+    except Exception as e:
+        print(f"VLM: migration failed: {e}")
+    return None
+
+
+def register():
+    # render_override の load_post（初回同期）より先に走らせる
+    if _load_post not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.insert(0, _load_post)
+    bpy.app.timers.register(_migrate_on_register, first_interval=0.0)
+
+
+def unregister():
+    if _load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_load_post)
+    if bpy.app.timers.is_registered(_migrate_on_register):
+        bpy.app.timers.unregister(_migrate_on_register)
@@ -1,5 +1,7 @@
 import bpy
 
+from . import visibility_index
+
 # --------------------------------------------------
 # LayerCollection 検索・操作ユーティリティ
 # --------------------------------------------------
@@ -60,6 +62,7 @@ def _apply_content_collection_overrides(view_layer):
             _walk(child)
 
     _walk(view_layer.layer_collection)
+    visibility_index.invalidate(view_layer.id_data)
     return True
 
 
@@ -80,6 +83,7 @@ class VLM_OT_toggle_collection_in_viewlayer(bpy.types.Operator):
                 return True
             return any(_traverse(c) for c in lc.children)
         _traverse(vl.layer_collection)
+        visibility_index.invalidate(context.scene)
         return {'FINISHED'}
 
 class VLM_OT_add_empty_viewlayer(bpy.types.Operator):
@@ -119,11 +123,11 @@ class VLM_OT_set_active_viewlayer(bpy.types.Operator):
         top_vl = sc.view_layers[0]
         dest_vl = sc.view_layers[self.layer_name]
 
-        # ★ トップ→他レイヤーに切り替わる時だけ、事前にバックアップを強制作成
+        # ★ トップ→他レイヤーに切り替わる時だけ、トップで変わったスロットをバックアップへ取り込む
+        #    （全件の作り直しは［マテリアルバックアップ］ボタンで明示的に行う）
         if context.window.view_layer == top_vl and dest_vl != top_vl:
             try:
-                # 既存のオペレーターを呼ぶ：トップを基準にバックアップ作り直し
-                bpy.ops.vlm.force_backup_materials()
+                material_override.refresh_dirty_backups(sc)
             except Exception:
                 # 万一失敗しても作業を止めない（安全にスルー）
                 pass
@@ -176,10 +180,9 @@ class VLM_OT_remove_viewlayer(bpy.types.Operator):
         if was_top_layer and new_top_layer_name:
             new_top_vl = sc.view_layers.get(new_top_layer_name)
             if new_top_vl:
-                for col in bpy.data.collections:
-                    key = material_override._override_key(new_top_vl.name, col.name)
-                    if key in col:
-                        del col[key]
+                # 先頭レイヤーはマテリアル上書きを持たない
+                new_top_vl.vlm_material_overrides.clear()
+                material_override.invalidate_override_index(new_top_vl)
                 
                 material_override._restore_viewlayer_materials(new_top_vl)
                 
@@ -234,6 +237,7 @@ class VLM_OT_toggle_layercollection_flag(bpy.types.Operator):
         f = self.flag
         if f == "exclude":
             lc.exclude = not lc.exclude
+            visibility_index.invalidate(context.scene)
         elif f == "hide_select":
             coll.hide_select = not coll.hide_select
         elif f == "hide_render":
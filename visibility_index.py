@@ -0,0 +1,149 @@
+# visibility_index.py
+#
+# ビューレイヤーごとの「可視オブジェクト」索引
+#   - vl.objects を 1 度だけ走査し、種別ごと・所属コレクションごとにまとめて持つ
+#     （マテリアル切替・ライト反映・AOV 収集・画像解放が毎回 visible_get を呼ばないように）
+#   - アドオン内のコレクション切替（内容切替・視錐台カリングなど）は、除外を書き換えた側が
+#     invalidate を呼んで捨てる
+#   - SCENE の更新（UI での除外切替もここに来るが、レンダー設定の書き込みでも毎回来る）では
+#     捨てずに「要確認」の印だけ付け、次の参照で 1 回だけ署名（除外 / 非表示フラグと
+#     オブジェクト数）を照合する。毎回の参照で署名は取らない
+#   - オブジェクト単位の表示変更は depsgraph 更新で、アンドゥ・ファイル読み込みは全体を捨てる
+# ------------------------------------------------------------
+
+from dataclasses import dataclass, field
+
+import bpy
+from bpy.app.handlers import persistent
+
+# これらの ID 種別が更新されたら表示状態が変わりうる
+_INVALIDATING_TYPES = ('COLLECTION',)
+
+
+@dataclass
+class VisibilityIndex:
+    members: dict = field(default_factory=dict)        # 種別 → vl.objects のオブジェクト（可視に限らない）
+    visible: list = field(default_factory=list)        # 可視オブジェクト
+    by_type: dict = field(default_factory=dict)        # 種別 → 可視オブジェクト
+    by_collection: dict = field(default_factory=dict)  # コレクション名 → 直下の可視オブジェクト
+    signature: tuple = ()
+
+
+# (シーン名, VL名) → VisibilityIndex
+_cache = {}
+# SCENE 更新のあと、次の参照で署名を照合する (シーン名, VL名)
+_unverified = set()
+
+
+def _is_visible(ob, vl):
+    try:
+        return ob.visible_get(view_layer=vl)
+    except TypeError:
+        return ob.visible_get()
+
+
+def _signature(vl):
+    """オブジェクト数と、レイヤーコレクションの除外 / 非表示フラグ（コレクション数に比例）"""
+    flags = []
+
+    def _walk(lc):
+        for child in lc.children:
+            flags.append((child.exclude, child.hide_viewport, child.collection.hide_viewport))
+            _walk(child)
+
+    _walk(vl.layer_collection)
+    return (len(vl.objects), tuple(flags))
+
+
+def build_index(vl):
+    idx = VisibilityIndex(signature=_signature(vl))
+    for ob in vl.objects:
+        idx.members.setdefault(ob.type, []).append(ob)
+        if not _is_visible(ob, vl):
+            continue
+        idx.visible.append(ob)
+        idx.by_type.setdefault(ob.type, []).append(ob)
+        for col in ob.users_collection:
+            idx.by_collection.setdefault(col.name, []).append(ob)
+    return idx
+
+
+def get_index(vl):
+    """キャッシュ付きの索引。SCENE 更新の後の最初の参照でだけ署名を照合し、変わっていれば作り直す"""
+    key = (vl.id_data.name, vl.name)
+    idx = _cache.get(key)
+    if idx is not None and key in _unverified:
+        _unverified.discard(key)
+        if idx.signature != _signature(vl):
+            idx = None
+    if idx is None:
+        idx = _cache[key] = build_index(vl)
+    return idx
+
+
+def visible_objects(vl, obj_type=None):
+    idx = get_index(vl)
+    return idx.visible if obj_type is None else idx.by_type.get(obj_type, [])
+
+
+def visible_in_collection(vl, col, obj_type=None):
+    """コレクション直下（col.objects）の可視オブジェクト"""
+    objs = get_index(vl).by_collection.get(col.name, [])
+    return objs if obj_type is None else [ob for ob in objs if ob.type == obj_type]
+
+
+def layer_objects(vl, obj_type):
+    """このVLに属する（除外されていない）オブジェクト。表示 / 非表示は問わない"""
+    return get_index(vl).members.get(obj_type, [])
+
+
+def invalidate(scene=None):
+    """索引を捨てる（scene 省略で全シーン）。レイヤーコレクションの除外を書き換えたら呼ぶ"""
+    if scene is None:
+        _cache.clear()
+        _unverified.clear()
+        return
+    for key in [k for k in _cache if k[0] == scene.name]:
+        del _cache[key]
+        _unverified.discard(key)
+
+
+@persistent
+def _depsgraph_handler(scene, depsgraph=None):
+    if depsgraph is None:
+        return
+    if any(depsgraph.id_type_updated(t) for t in _INVALIDATING_TYPES):
+        invalidate(scene)
+        return
+    if depsgraph.id_type_updated('SCENE'):
+        _unverified.update(k for k in _cache if k[0] == scene.name)
+    for upd in depsgraph.updates:
+        if not isinstance(upd.id, bpy.types.Object):
+            continue
+        # 移動・形状・マテリアルだけの更新は表示に関係しない（マテリアル切替自身もここ）
+        if not (upd.is_updated_transform or upd.is_updated_geometry or upd.is_updated_shading):
+            invalidate(scene)
+            return
+
+
+@persistent
+def _reset(_dummy=None):
+    invalidate()
+
+
+def register():
+    if _depsgraph_handler not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_depsgraph_handler)
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset not in h:
+            h.append(_reset)
+
+
+def unregister():
+    if _depsgraph_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_depsgraph_handler)
+    for h in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if _reset in h:
+            h.remove(_reset)
+    _cache.clear()
+    _unverified.clear()